@@ -1,588 +1,2259 @@
-# ╔════════════════════════════════════════════════════════════════════╗
-# ║                     app.py - Main Flask API                        ║
-# ║  WebSocket • Database • Auth • Ready for Render deployment         ║
-# ╚════════════════════════════════════════════════════════════════════╝
-
-from flask import Flask, request, jsonify, render_template_string, redirect
-from flask_cors import CORS
-from flask_socketio import SocketIO, emit
-from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-import google.generativeai as genai
-import os
-import markdown
-from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
-import secrets
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# ══════════════════════════════════════════════════════════════════════
-# CONFIGURATION
-# ══════════════════════════════════════════════════════════════════════
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(32))
-app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', secrets.token_hex(32))
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30)
-
-# Database configuration (SQLite for simplicity, can use PostgreSQL on Render)
-database_url = os.environ.get('DATABASE_URL', 'sqlite:///agent.db')
-if database_url.startswith('postgres://'):
-    database_url = database_url.replace('postgres://', 'postgresql://', 1)
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Initialize extensions
-CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
-db = SQLAlchemy(app)
-jwt = JWTManager(app)
-
-# LLM Configuration
-GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
-AGENT_TYPE = os.environ.get('AGENT_TYPE', 'coding_assistant')
-
-# ══════════════════════════════════════════════════════════════════════
-# DATABASE MODELS
-# ══════════════════════════════════════════════════════════════════════
-
-class User(db.Model):
-    """User model for authentication"""
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(255), nullable=False)
-    api_key = db.Column(db.String(64), unique=True, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    conversations = db.relationship('Conversation', backref='user', lazy=True)
-    
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
-    
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-
-class Conversation(db.Model):
-    """Conversation history model"""
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    title = db.Column(db.String(200), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    messages = db.relationship('Message', backref='conversation', lazy=True)
-
-class Message(db.Model):
-    """Individual message model"""
-    id = db.Column(db.Integer, primary_key=True)
-    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=False)
-    role = db.Column(db.String(20), nullable=False)  # 'user' or 'assistant'
-    content = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    tokens = db.Column(db.Integer, default=0)
-
-# Create tables
-with app.app_context():
-    db.create_all()
-    
-    # Create guest user if not exists
-    if not User.query.filter_by(username='guest').first():
-        guest = User(
-            username='guest',
-            email='guest@example.com',
-            api_key='guest_key',
-            password_hash='guest'
-        )
-        db.session.add(guest)
-        db.session.commit()
-
-# ══════════════════════════════════════════════════════════════════════
-# LLM SETUP
-# ══════════════════════════════════════════════════════════════════════
-
-AGENT_PROMPTS = {
-    "coding_assistant": """You are an expert software engineer.
-Provide clean code, explanations, and best practices.
-Format code in markdown with syntax highlighting.""",
-    
-    "data_analyst": """You are a senior data scientist.
-Provide data analysis code, visualizations, and insights.
-Use pandas, numpy, and visualization libraries.""",
-    
-    "creative_writer": """You are a creative writer and storyteller.
-Write engaging narratives, stories, and creative content.""",
-    
-    "tutor": """You are a patient educational tutor.
-Explain concepts clearly with examples and practice problems."""
-}
-
-def get_llm_model():
-    """Initialize Gemini model"""
-    if not GOOGLE_API_KEY:
-        return None
-    
-    try:
-        genai.configure(api_key=GOOGLE_API_KEY)
-        system_prompt = AGENT_PROMPTS.get(AGENT_TYPE, AGENT_PROMPTS['coding_assistant'])
-        model = genai.GenerativeModel(
-            model_name='gemini-2.0-flash-exp',
-            system_instruction=system_prompt
-        )
-        return model
-    except Exception as e:
-        print(f"LLM setup error: {e}")
-        return None
-
-model = get_llm_model()
-
-# ══════════════════════════════════════════════════════════════════════
-# AUTHENTICATION ENDPOINTS
-# ══════════════════════════════════════════════════════════════════════
-
-@app.route('/api/auth/register', methods=['POST'])
-def register():
-    """Register new user"""
-    try:
-        data = request.get_json()
-        username = data.get('username')
-        email = data.get('email')
-        password = data.get('password')
-        
-        if not all([username, email, password]):
-            return jsonify({"error": "Missing required fields"}), 400
-        
-        if User.query.filter_by(username=username).first():
-            return jsonify({"error": "Username already exists"}), 400
-        
-        if User.query.filter_by(email=email).first():
-            return jsonify({"error": "Email already exists"}), 400
-        
-        # Create new user
-        user = User(
-            username=username,
-            email=email,
-            api_key=secrets.token_urlsafe(32)
-        )
-        user.set_password(password)
-        
-        db.session.add(user)
-        db.session.commit()
-        
-        # Generate JWT token
-        access_token = create_access_token(identity=user.id)
-        
-        return jsonify({
-            "message": "User registered successfully",
-            "access_token": access_token,
-            "api_key": user.api_key
-        }), 201
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/auth/login', methods=['POST'])
-def login():
-    """Login user"""
-    try:
-        data = request.get_json()
-        username = data.get('username')
-        password = data.get('password')
-        
-        user = User.query.filter_by(username=username).first()
-        
-        if not user or not user.check_password(password):
-            return jsonify({"error": "Invalid credentials"}), 401
-        
-        access_token = create_access_token(identity=user.id)
-        
-        return jsonify({
-            "access_token": access_token,
-            "api_key": user.api_key,
-            "username": user.username
-        })
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-        if not conversation:
-            return jsonify({"error": "Conversation not found"}), 404
-        
-        messages = Message.query.filter_by(
-            conversation_id=conversation_id
-        ).order_by(Message.timestamp).all()
-        
-        return jsonify({
-            "conversation": {
-                "id": conversation.id,
-                "title": conversation.title,
-                "created_at": conversation.created_at.isoformat()
-            },
-            "messages": [{
-                "role": m.role,
-                "content": m.content,
-                "timestamp": m.timestamp.isoformat()
-            } for m in messages]
-        })
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-# ══════════════════════════════════════════════════════════════════════
-# WEBSOCKET SUPPORT FOR REAL-TIME STREAMING
-# ══════════════════════════════════════════════════════════════════════
-
-@socketio.on('connect')
-def handle_connect():
-    """Handle WebSocket connection"""
-    print('Client connected')
-    emit('status', {'message': 'Connected to AI Agent'})
-
-@socketio.on('disconnect')
-def handle_disconnect():
-    """Handle WebSocket disconnection"""
-    print('Client disconnected')
-
-@socketio.on('chat_message')
-def handle_chat_message(data):
-    """Handle real-time chat via WebSocket"""
-    try:
-        message = data.get('message')
-        token = data.get('token')
-        
-        if not message:
-            emit('error', {'message': 'No message provided'})
-            return
-        
-        # TODO: Validate JWT token from WebSocket
-        
-        if not model:
-            emit('error', {'message': 'LLM not configured'})
-            return
-        
-        # Generate response
-        chat_session = model.start_chat(history=[])
-        response = chat_session.send_message(message)
-        
-        # Stream response word by word
-        words = response.text.split()
-        for word in words:
-            emit('chat_chunk', {'chunk': word + ' '})
-            socketio.sleep(0.05)  # Simulate streaming
-        
-        emit('chat_complete', {'message': 'Response complete'})
-        
-    except Exception as e:
-        emit('error', {'message': str(e)})
-
-# ══════════════════════════════════════════════════════════════════════
-# STATUS & INFO ENDPOINTS
-# ══════════════════════════════════════════════════════════════════════
-
-@app.route('/')
-def home():
-    """API documentation homepage"""
-    html = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Flask AI Agent API</title>
-        <style>
-            body {
-                font-family: 'Segoe UI', system-ui, sans-serif;
-                max-width: 1200px;
-                margin: 0 auto;
-                padding: 20px;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                color: white;
-            }
-            .container {
-                background: rgba(255, 255, 255, 0.1);
-                backdrop-filter: blur(10px);
-                border-radius: 20px;
-                padding: 40px;
-                box-shadow: 0 8px 32px rgba(0, 0, 0, 0.3);
-            }
-            h1 { margin-top: 0; font-size: 2.5em; }
-            .endpoint {
-                background: rgba(255, 255, 255, 0.15);
-                padding: 20px;
-                margin: 15px 0;
-                border-radius: 10px;
-            }
-            .method {
-                display: inline-block;
-                padding: 5px 15px;
-                background: #10b981;
-                border-radius: 5px;
-                font-weight: bold;
-                margin-right: 10px;
-            }
-            code {
-                background: rgba(0, 0, 0, 0.3);
-                padding: 2px 8px;
-                border-radius: 4px;
-            }
-            .feature {
-                display: inline-block;
-                background: rgba(255, 255, 255, 0.2);
-                padding: 8px 16px;
-                margin: 5px;
-                border-radius: 20px;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>🤖 Flask AI Agent API</h1>
-            <p><strong>Status:</strong> 🟢 Online</p>
-            
-            <h2>✨ Features</h2>
-            <div>
-                <span class="feature">🔐 JWT Authentication</span>
-                <span class="feature">💾 Database History</span>
-                <span class="feature">⚡ WebSocket Streaming</span>
-                <span class="feature">🎨 Markdown Responses</span>
-                <span class="feature">🔑 API Keys</span>
-            </div>
-            
-            <h2>📡 Endpoints</h2>
-            
-            <div class="endpoint">
-                <span class="method">POST</span>
-                <code>/api/auth/register</code>
-                <p>Register a new user account</p>
-            </div>
-            
-            <div class="endpoint">
-                <span class="method">POST</span>
-                <code>/api/auth/login</code>
-                <p>Login and get JWT token</p>
-            </div>
-            
-            <div class="endpoint">
-                <span class="method">POST</span>
-                <code>/api/chat</code>
-                <p>Send message to AI agent (requires JWT)</p>
-            </div>
-            
-            <div class="endpoint">
-                <span class="method">GET</span>
-                <code>/api/conversations</code>
-                <p>Get user's conversation history</p>
-            </div>
-            
-            <div class="endpoint">
-                <span class="method">WebSocket</span>
-                <code>ws://your-domain/socket.io</code>
-                <p>Real-time chat streaming</p>
-            </div>
-            
-            <h2>🚀 Quick Start</h2>
-            <pre><code># Register
-curl -X POST https://your-api.com/api/auth/register \\
-  -H "Content-Type: application/json" \\
-  -d '{"username":"user","email":"user@example.com","password":"pass123"}'
-
-# Login
-curl -X POST https://your-api.com/api/auth/login \\
-  -H "Content-Type: application/json" \\
-  -d '{"username":"user","password":"pass123"}'
-
-# Chat
-curl -X POST https://your-api.com/api/chat \\
-  -H "Authorization: Bearer YOUR_JWT_TOKEN" \\
-  -H "Content-Type: application/json" \\
-  -d '{"message":"Hello AI!"}'</code></pre>
-            
-            <p style="margin-top: 30px; text-align: center;">
-                <a href="/streamlit" style="background: #10b981; color: white; padding: 12px 24px; border-radius: 8px; text-decoration: none; font-weight: bold;">
-                    Open Streamlit UI →
-                </a>
-            </p>
-        </div>
-    </body>
-    </html>
-    """
-    return render_template_string(html)
-
-@app.route('/api/status', methods=['GET'])
-def status():
-    """API status check"""
-    return jsonify({
-        "status": "online",
-        "llm_configured": model is not None,
-        "agent_type": AGENT_TYPE,
-        "features": ["auth", "database", "websocket", "markdown"],
-        "timestamp": datetime.utcnow().isoformat()
-    })
-
-# ══════════════════════════════════════════════════════════════════════
-# RUN APPLICATION
-# ══════════════════════════════════════════════════════════════════════
-
-if __name__ == '__main__':
-    socketio.run(
-        app,
-        host='0.0.0.0',
-        port=7860,
-        allow_unsafe_werkzeug=True,
-        debug=False
-    )
- 
- @ a p p . r o u t e ( ' / s t r e a m l i t ' ) 
- 
- d e f   s t r e a m l i t _ r e d i r e c t ( ) : 
- 
-         " " " R e d i r e c t   t o   S t r e a m l i t   U I " " " 
- 
-         s t r e a m l i t _ u r l   =   o s . e n v i r o n . g e t ( ' S T R E A M L I T _ U R L ' ,   ' h t t p : / / l o c a l h o s t : 8 5 0 1 ' ) 
- 
-         r e t u r n   r e d i r e c t ( s t r e a m l i t _ u r l ) 
- 
-  
- #    "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   
- #   C H A T   E N D P O I N T S  
- #    "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   "   
-  
- @ a p p . r o u t e ( ' / a p i / c h a t ' ,   m e t h o d s = [ ' P O S T ' ] )  
- d e f   c h a t ( ) :  
-         " " " M a i n   c h a t   e n d p o i n t   w i t h   c o n v e r s a t i o n   h i s t o r y " " "  
-         t r y :  
-                 #   D e f a u l t   t o   g u e s t   u s e r  
-                 u s e r   =   U s e r . q u e r y . f i l t e r _ b y ( u s e r n a m e = ' g u e s t ' ) . f i r s t ( )  
-                 c u r r e n t _ u s e r _ i d   =   u s e r . i d  
-                  
-                 d a t a   =   r e q u e s t . g e t _ j s o n ( )  
-                  
-                 m e s s a g e   =   d a t a . g e t ( ' m e s s a g e ' )  
-                 c o n v e r s a t i o n _ i d   =   d a t a . g e t ( ' c o n v e r s a t i o n _ i d ' )  
-                  
-                 i f   n o t   m e s s a g e :  
-                         r e t u r n   j s o n i f y ( { " e r r o r " :   " M i s s i n g   m e s s a g e " } ) ,   4 0 0  
-                  
-                 i f   n o t   m o d e l :  
-                         r e t u r n   j s o n i f y ( { " e r r o r " :   " L L M   n o t   c o n f i g u r e d " } ) ,   5 0 0  
-                  
-                 #   G e t   o r   c r e a t e   c o n v e r s a t i o n  
-                 i f   c o n v e r s a t i o n _ i d :  
-                         c o n v e r s a t i o n   =   C o n v e r s a t i o n . q u e r y . f i l t e r _ b y (  
-                                 i d = c o n v e r s a t i o n _ i d ,  
-                                 u s e r _ i d = c u r r e n t _ u s e r _ i d  
-                         ) . f i r s t ( )  
-                 e l s e :  
-                         c o n v e r s a t i o n   =   C o n v e r s a t i o n (  
-                                 u s e r _ i d = c u r r e n t _ u s e r _ i d ,  
-                                 t i t l e = m e s s a g e [ : 5 0 ]   +   " . . . "   i f   l e n ( m e s s a g e )   >   5 0   e l s e   m e s s a g e  
-                         )  
-                         d b . s e s s i o n . a d d ( c o n v e r s a t i o n )  
-                         d b . s e s s i o n . f l u s h ( )  
-                  
-                 #   G e t   c o n v e r s a t i o n   h i s t o r y  
-                 m e s s a g e s   =   M e s s a g e . q u e r y . f i l t e r _ b y (  
-                         c o n v e r s a t i o n _ i d = c o n v e r s a t i o n . i d  
-                 ) . o r d e r _ b y ( M e s s a g e . t i m e s t a m p ) . a l l ( )  
-                  
-                 #   B u i l d   c h a t   h i s t o r y  
-                 h i s t o r y   =   [ ]  
-                 f o r   m s g   i n   m e s s a g e s :  
-                         h i s t o r y . a p p e n d ( {  
-                                 " r o l e " :   m s g . r o l e ,  
-                                 " p a r t s " :   [ m s g . c o n t e n t ]  
-                         } )  
-                  
-                 #   G e n e r a t e   r e s p o n s e  
-                 c h a t _ s e s s i o n   =   m o d e l . s t a r t _ c h a t ( h i s t o r y = h i s t o r y )  
-                 r e s p o n s e   =   c h a t _ s e s s i o n . s e n d _ m e s s a g e ( m e s s a g e )  
-                 a i _ r e s p o n s e   =   r e s p o n s e . t e x t  
-                  
-                 #   S a v e   m e s s a g e s  
-                 u s e r _ m s g   =   M e s s a g e (  
-                         c o n v e r s a t i o n _ i d = c o n v e r s a t i o n . i d ,  
-                         r o l e = ' u s e r ' ,  
-                         c o n t e n t = m e s s a g e  
-                 )  
-                 a s s i s t a n t _ m s g   =   M e s s a g e (  
-                         c o n v e r s a t i o n _ i d = c o n v e r s a t i o n . i d ,  
-                         r o l e = ' a s s i s t a n t ' ,  
-                         c o n t e n t = a i _ r e s p o n s e ,  
-                         t o k e n s = l e n ( a i _ r e s p o n s e . s p l i t ( ) )  
-                 )  
-                  
-                 d b . s e s s i o n . a d d ( u s e r _ m s g )  
-                 d b . s e s s i o n . a d d ( a s s i s t a n t _ m s g )  
-                 d b . s e s s i o n . c o m m i t ( )  
-                  
-                 #   C o n v e r t   t o   H T M L  
-                 h t m l _ r e s p o n s e   =   m a r k d o w n . m a r k d o w n ( a i _ r e s p o n s e ,   e x t e n s i o n s = [ ' f e n c e d _ c o d e ' ,   ' t a b l e s ' ] )  
-                  
-                 r e t u r n   j s o n i f y ( {  
-                         " r e s p o n s e " :   a i _ r e s p o n s e ,  
-                         " h t m l " :   h t m l _ r e s p o n s e ,  
-                         " c o n v e r s a t i o n _ i d " :   c o n v e r s a t i o n . i d ,  
-                         " t i m e s t a m p " :   d a t e t i m e . u t c n o w ( ) . i s o f o r m a t ( )  
-                 } )  
-                  
-         e x c e p t   E x c e p t i o n   a s   e :  
-                 d b . s e s s i o n . r o l l b a c k ( )  
-                 r e t u r n   j s o n i f y ( { " e r r o r " :   s t r ( e ) } ) ,   5 0 0  
-  
- @ a p p . r o u t e ( ' / a p i / c o n v e r s a t i o n s ' ,   m e t h o d s = [ ' G E T ' ] )  
- d e f   g e t _ c o n v e r s a t i o n s ( ) :  
-         " " " G e t   u s e r ' s   c o n v e r s a t i o n   l i s t " " "  
-         t r y :  
-                 u s e r   =   U s e r . q u e r y . f i l t e r _ b y ( u s e r n a m e = ' g u e s t ' ) . f i r s t ( )  
-                 c u r r e n t _ u s e r _ i d   =   u s e r . i d  
-                  
-                 c o n v e r s a t i o n s   =   C o n v e r s a t i o n . q u e r y . f i l t e r _ b y (  
-                         u s e r _ i d = c u r r e n t _ u s e r _ i d  
-                 ) . o r d e r _ b y ( C o n v e r s a t i o n . u p d a t e d _ a t . d e s c ( ) ) . a l l ( )  
-                  
-                 r e t u r n   j s o n i f y ( {  
-                         " c o n v e r s a t i o n s " :   [ {  
-                                 " i d " :   c . i d ,  
-                                 " t i t l e " :   c . t i t l e ,  
-                                 " c r e a t e d _ a t " :   c . c r e a t e d _ a t . i s o f o r m a t ( ) ,  
-                                 " u p d a t e d _ a t " :   c . u p d a t e d _ a t . i s o f o r m a t ( ) ,  
-                                 " m e s s a g e _ c o u n t " :   l e n ( c . m e s s a g e s )  
-                         }   f o r   c   i n   c o n v e r s a t i o n s ]  
-                 } )  
-                  
-         e x c e p t   E x c e p t i o n   a s   e :  
-                 r e t u r n   j s o n i f y ( { " e r r o r " :   s t r ( e ) } ) ,   5 0 0  
-  
- @ a p p . r o u t e ( ' / a p i / c o n v e r s a t i o n s / < i n t : c o n v e r s a t i o n _ i d > ' ,   m e t h o d s = [ ' G E T ' ] )  
- d e f   g e t _ c o n v e r s a t i o n ( c o n v e r s a t i o n _ i d ) :  
-         " " " G e t   s p e c i f i c   c o n v e r s a t i o n   w i t h   m e s s a g e s " " "  
-         t r y :  
-                 u s e r   =   U s e r . q u e r y . f i l t e r _ b y ( u s e r n a m e = ' g u e s t ' ) . f i r s t ( )  
-                 c u r r e n t _ u s e r _ i d   =   u s e r . i d  
-                  
-                 c o n v e r s a t i o n   =   C o n v e r s a t i o n . q u e r y . f i l t e r _ b y (  
-                         i d = c o n v e r s a t i o n _ i d ,  
-                         u s e r _ i d = c u r r e n t _ u s e r _ i d  
-                 ) . f i r s t ( )  
-                  
-                 i f   n o t   c o n v e r s a t i o n :  
-                         r e t u r n   j s o n i f y ( { " e r r o r " :   " C o n v e r s a t i o n   n o t   f o u n d " } ) ,   4 0 4  
-                  
-                 m e s s a g e s   =   M e s s a g e . q u e r y . f i l t e r _ b y (  
-                         c o n v e r s a t i o n _ i d = c o n v e r s a t i o n _ i d  
-                 ) . o r d e r _ b y ( M e s s a g e . t i m e s t a m p ) . a l l ( )  
-                  
-                 r e t u r n   j s o n i f y ( {  
-                         " c o n v e r s a t i o n " :   {  
-                                 " i d " :   c o n v e r s a t i o n . i d ,  
-                                 " t i t l e " :   c o n v e r s a t i o n . t i t l e ,  
-                                 " c r e a t e d _ a t " :   c o n v e r s a t i o n . c r e a t e d _ a t . i s o f o r m a t ( )  
-                         } ,  
-                         " m e s s a g e s " :   [ {  
-                                 " r o l e " :   m . r o l e ,  
-                                 " c o n t e n t " :   m . c o n t e n t ,  
-                                 " t i m e s t a m p " :   m . t i m e s t a m p . i s o f o r m a t ( )  
-                         }   f o r   m   i n   m e s s a g e s ]  
-                 } )  
-                  
-         e x c e p t   E x c e p t i o n   a s   e :  
-                 r e t u r n   j s o n i f y ( { " e r r o r " :   s t r ( e ) } ) ,   5 0 0  
- 
\ No newline at end of file
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║                     app.py - Main Flask API                        ║
+# ║  WebSocket • Database • Auth • Ready for Render deployment         ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Serving mode: 'threading' (Werkzeug, development) or 'eventlet' (green threads,
+# production). Eventlet has to patch the standard library before anything else
+# imports it, so in-flight LLM calls wait on sockets without pinning OS threads.
+ASYNC_MODE = os.environ.get('ASYNC_MODE', 'threading')
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
+from flask import Flask, Response, g, request, jsonify, render_template_string, redirect, stream_with_context
+from flask_cors import CORS
+from flask_socketio import SocketIO, emit
+from flask_sqlalchemy import SQLAlchemy
+from flask_jwt_extended import (
+    JWTManager, create_access_token, decode_token, get_jwt_identity, verify_jwt_in_request
+)
+from datetime import datetime, timedelta
+from functools import wraps
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.exc import IntegrityError
+import atexit
+import click
+import secrets
+import shutil
+import signal
+import sys
+import tempfile
+import json
+import math
+import threading
+import time
+from llm import FakeModel, iter_batches, iter_text, usage_stats
+from caches import HistoryCache, ResponseCache, SingleFlight
+from auth import Identity, UserCache
+from ratelimit import CostTooLarge, MemoryBackend, RateLimited, RateLimiter, RedisBackend, per_minute
+from dispatcher import DispatchError, LLMDispatcher
+from resilience import CircuitBreaker, ResilientModel
+from personas import ModelRegistry, PromptStore
+from batch import completed
+from jobs import JobStore, JobWatcher, JobWorkerPool, RetryJob, TERMINAL_STATUSES, run_worker
+from metrics import COUNT_BUCKETS, MetricsRegistry, QueryTracker, timed
+from context import ContextWindow, llm_summarizer
+from persistence import WriteBehindQueue, apply_sqlite_profile, sqlite_pragmas
+from migrations import migrate
+from transfer import export_ndjson, import_ndjson
+from search import MessageSearch
+from rendering import IncrementalRenderer, MarkdownRenderer
+from memory import GeminiEmbedder, HashingEmbedder, MemoryIndexer, VectorIndex, with_memories
+
+# ══════════════════════════════════════════════════════════════════════
+# CONFIGURATION
+# ══════════════════════════════════════════════════════════════════════
+
+app = Flask(__name__)
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(32))
+app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', secrets.token_hex(32))
+app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30)
+
+# Auth: user records resolved from JWTs / API keys are cached this many seconds;
+# requests without credentials act as the shared guest user unless ALLOW_GUEST=0
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '300'))
+ALLOW_GUEST = os.environ.get('ALLOW_GUEST', '1') == '1'
+
+# Rate limiting: token buckets (requests per minute, burst) per user, API key and client IP,
+# plus a cap on each user's in-flight LLM calls. Anonymous callers share the guest bucket
+# and get the in-flight cap per IP. RATE_LIMIT_REDIS_URL shares limits across workers.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT', '1') == '1'
+RATE_LIMIT_USER_PER_MINUTE = float(os.environ.get('RATE_LIMIT_USER_PER_MINUTE', '30'))
+RATE_LIMIT_USER_BURST = float(os.environ.get('RATE_LIMIT_USER_BURST', '10'))
+RATE_LIMIT_API_KEY_PER_MINUTE = float(os.environ.get('RATE_LIMIT_API_KEY_PER_MINUTE', '60'))
+RATE_LIMIT_API_KEY_BURST = float(os.environ.get('RATE_LIMIT_API_KEY_BURST', '20'))
+RATE_LIMIT_GUEST_PER_MINUTE = float(os.environ.get('RATE_LIMIT_GUEST_PER_MINUTE', '120'))
+RATE_LIMIT_GUEST_BURST = float(os.environ.get('RATE_LIMIT_GUEST_BURST', '40'))
+RATE_LIMIT_IP_PER_MINUTE = float(os.environ.get('RATE_LIMIT_IP_PER_MINUTE', '60'))
+RATE_LIMIT_IP_BURST = float(os.environ.get('RATE_LIMIT_IP_BURST', '20'))
+MAX_CONCURRENT_LLM_CALLS = int(os.environ.get('MAX_CONCURRENT_LLM_CALLS', '4'))  # per user, 0 = no cap
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL')
+# Number of reverse proxies in front of the app whose X-Forwarded-For can be trusted
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', '0'))
+
+# LLM dispatcher: upstream model calls run on a fixed worker pool behind a bounded priority
+# queue (interactive WebSocket > signed-in REST > guest > batch); overflow is shed with 503
+# and calls that can't finish (or start streaming) within LLM_TIMEOUT seconds get 504.
+# Under eventlet the workers are green threads, so the defaults admit as many waiting calls
+# as the high-concurrency mode is meant to hold instead of shedding past ~80
+LLM_DISPATCH_ENABLED = os.environ.get('LLM_DISPATCH', '1') == '1'
+LLM_WORKERS = int(os.environ.get('LLM_WORKERS', '512' if ASYNC_MODE == 'eventlet' else '16'))
+LLM_QUEUE_SIZE = int(os.environ.get('LLM_QUEUE_SIZE', '4096' if ASYNC_MODE == 'eventlet' else '64'))
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', '60'))
+
+# Database configuration (SQLite for simplicity, can use PostgreSQL on Render)
+database_url = os.environ.get('DATABASE_URL', 'sqlite:///agent.db')
+if database_url.startswith('postgres://'):
+    database_url = database_url.replace('postgres://', 'postgresql://', 1)
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# SQLite profile (WAL, tuned pragmas, pool sized for concurrent requests), applied per connection
+SQLITE_PROFILE_ENABLED = os.environ.get('SQLITE_PROFILE', '1') == '1'
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', str(-64 * 1024)))  # negative = KiB
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'))  # ms
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '20'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '40'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+if database_url.startswith('sqlite:///') and ':memory:' not in database_url and SQLITE_PROFILE_ENABLED:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT / 1000.0, 'check_same_thread': False}
+    }
+
+# Per-conversation chat history cache (bytes budget, seconds to live)
+HISTORY_CACHE_MAX_BYTES = int(os.environ.get('HISTORY_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+HISTORY_CACHE_TTL = float(os.environ.get('HISTORY_CACHE_TTL', '600'))
+
+# Context window: recent turns kept verbatim up to this many tokens (0 = unlimited),
+# older turns are folded into a stored rolling summary
+CONTEXT_MAX_TOKENS = int(os.environ.get('CONTEXT_MAX_TOKENS', '8000'))
+CONTEXT_LOW_WATER = float(os.environ.get('CONTEXT_LOW_WATER', '0.5'))
+SUMMARY_MAX_TOKENS = int(os.environ.get('SUMMARY_MAX_TOKENS', '512'))
+
+# Retrieval memory: past messages are embedded once and the top-k most relevant ones
+# are sent with the recent turns instead of the full history
+RETRIEVAL_ENABLED = os.environ.get('RETRIEVAL', '0') == '1'
+RETRIEVAL_TOP_K = int(os.environ.get('RETRIEVAL_TOP_K', '5'))
+RETRIEVAL_MIN_SCORE = float(os.environ.get('RETRIEVAL_MIN_SCORE', '0.3'))
+RETRIEVAL_RECENT_TURNS = int(os.environ.get('RETRIEVAL_RECENT_TURNS', '6'))
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'hash')  # 'hash' (local) or 'gemini'
+EMBEDDING_DIM = int(os.environ.get('EMBEDDING_DIM', '256'))  # hash embedder only
+EMBEDDING_BATCH = int(os.environ.get('EMBEDDING_BATCH', '256'))
+
+# Opt-in cache of model replies for identical prompts (memory tier + optional SQLite file)
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE', '0') == '1'
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '1024'))
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '3600'))
+RESPONSE_CACHE_DB = os.environ.get('RESPONSE_CACHE_DB')  # e.g. instance/response_cache.db
+RESPONSE_CACHE_DB_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_DB_MAX_ENTRIES', '100000'))
+
+# Share one upstream model call among concurrent identical requests
+SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT', '1') == '1'
+
+# Write-behind persistence: chat messages are committed in batches by a background writer
+WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND', '1') == '1'
+WRITE_BEHIND_BATCH = int(os.environ.get('WRITE_BEHIND_BATCH', '200'))
+WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', '0.05'))
+WRITE_BEHIND_QUEUE = int(os.environ.get('WRITE_BEHIND_QUEUE', '10000'))
+
+# Pagination defaults for the conversation endpoints
+CONVERSATION_PAGE_SIZE = int(os.environ.get('CONVERSATION_PAGE_SIZE', '50'))
+MESSAGE_PAGE_SIZE = int(os.environ.get('MESSAGE_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '1000'))
+SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', '20'))
+
+# Markdown rendering: memoized HTML per distinct text; optionally stored with each reply
+MARKDOWN_CACHE_ENTRIES = int(os.environ.get('MARKDOWN_CACHE_ENTRIES', '2048'))
+PERSIST_HTML = os.environ.get('PERSIST_HTML', '0') == '1'
+
+# Bulk NDJSON export/import: rows fetched per server-side cursor round trip, rows per insert batch
+EXPORT_YIELD_PER = int(os.environ.get('EXPORT_YIELD_PER', '1000'))
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '5000'))
+
+# Batch chat: prompts per request, and how many of them run at once (the request may ask for
+# fewer, never more); finished replies are saved in groups of up to BATCH_PERSIST_GROUP
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '1000'))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '8'))
+BATCH_PERSIST_GROUP = int(os.environ.get('BATCH_PERSIST_GROUP', '100'))
+
+# Background jobs: POST /api/jobs queues a generation in the job table; JOB_WORKERS worker
+# processes (0 = none here; run `flask --app app job-worker` elsewhere) with JOB_CONCURRENCY
+# threads each claim jobs under a JOB_LEASE-second lease. GET /api/jobs/<id>?wait=N
+# long-polls for at most JOB_MAX_WAIT seconds, with at most JOB_MAX_WAITERS waiting at once.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', '4'))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '0.5'))
+JOB_LEASE = float(os.environ.get('JOB_LEASE', '180'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', '20'))  # queued + running per user
+JOB_MAX_WAIT = float(os.environ.get('JOB_MAX_WAIT', '20'))
+JOB_MAX_WAITERS = int(os.environ.get('JOB_MAX_WAITERS', '100'))
+JOB_RETENTION = float(os.environ.get('JOB_RETENTION', str(7 * 24 * 3600)))
+
+# Metrics: request, stage, LLM, WebSocket and database metrics in Prometheus text format
+# at /metrics (METRICS=0 turns off the endpoint and the per-request and per-query hooks)
+METRICS_ENABLED = os.environ.get('METRICS', '1') == '1'
+
+# Initialize extensions
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+CORS(app)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE)
+db = SQLAlchemy(app)
+jwt = JWTManager(app)
+history_cache = HistoryCache(max_bytes=HISTORY_CACHE_MAX_BYTES, ttl=HISTORY_CACHE_TTL)
+response_cache = ResponseCache(
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    ttl=RESPONSE_CACHE_TTL,
+    disk_path=RESPONSE_CACHE_DB,
+    disk_max_entries=RESPONSE_CACHE_DB_MAX_ENTRIES
+) if RESPONSE_CACHE_ENABLED else None
+single_flight = SingleFlight() if SINGLE_FLIGHT_ENABLED else None
+markdown_renderer = MarkdownRenderer(max_entries=MARKDOWN_CACHE_ENTRIES)
+rate_limiter = RateLimiter(
+    RedisBackend.from_url(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else MemoryBackend(),
+    {
+        'user': per_minute(RATE_LIMIT_USER_PER_MINUTE, RATE_LIMIT_USER_BURST),
+        'guest': per_minute(RATE_LIMIT_GUEST_PER_MINUTE, RATE_LIMIT_GUEST_BURST),
+        'api_key': per_minute(RATE_LIMIT_API_KEY_PER_MINUTE, RATE_LIMIT_API_KEY_BURST),
+        'ip': per_minute(RATE_LIMIT_IP_PER_MINUTE, RATE_LIMIT_IP_BURST)
+    },
+    max_concurrent=MAX_CONCURRENT_LLM_CALLS
+) if RATE_LIMIT_ENABLED else None
+llm_dispatcher = LLMDispatcher(
+    workers=LLM_WORKERS,
+    max_queue=LLM_QUEUE_SIZE,
+    timeout=LLM_TIMEOUT
+) if LLM_DISPATCH_ENABLED else None
+
+# Server
+PORT = int(os.environ.get('PORT', '7860'))
+MAX_CONNECTIONS = int(os.environ.get('MAX_CONNECTIONS', '10000'))  # eventlet green threads
+
+# LLM Configuration
+GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
+AGENT_TYPE = os.environ.get('AGENT_TYPE', 'coding_assistant')  # persona when a request names none
+AGENT_PROMPTS_FILE = os.environ.get('AGENT_PROMPTS_FILE')  # JSON {agent_type: prompt}, hot-reloaded
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini')  # 'gemini' or 'fake' (offline)
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gemini-2.0-flash-exp')
+LLM_FALLBACK_MODEL = os.environ.get('LLM_FALLBACK_MODEL')  # e.g. gemini-1.5-flash-8b
+FAKE_LLM_LATENCY = float(os.environ.get('FAKE_LLM_LATENCY', '0.5'))
+FAKE_LLM_TOKENS_PER_SECOND = float(os.environ.get('FAKE_LLM_TOKENS_PER_SECOND', '50'))
+# Fault injection for the fake primary model (the fallback stays healthy)
+FAKE_LLM_ERROR_RATE = float(os.environ.get('FAKE_LLM_ERROR_RATE', '0'))
+FAKE_LLM_SLOW_RATE = float(os.environ.get('FAKE_LLM_SLOW_RATE', '0'))
+FAKE_LLM_SLOW_LATENCY = float(os.environ.get('FAKE_LLM_SLOW_LATENCY', '5'))
+
+# Upstream resilience: transient errors are retried with jittered exponential backoff
+# within LLM_TIMEOUT; a model's circuit opens after LLM_BREAKER_FAILURES consecutive
+# failures for LLM_BREAKER_RESET seconds, during which calls go to the fallback model.
+# LLM_HEDGE races a second request against one slower than LLM_HEDGE_AFTER seconds
+# (0 = the model's observed p95); it cuts tail latency at the cost of extra calls.
+LLM_RETRIES = int(os.environ.get('LLM_RETRIES', '2'))
+LLM_BACKOFF = float(os.environ.get('LLM_BACKOFF', '0.25'))
+LLM_MAX_BACKOFF = float(os.environ.get('LLM_MAX_BACKOFF', '4'))
+LLM_BREAKER_FAILURES = int(os.environ.get('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_RESET = float(os.environ.get('LLM_BREAKER_RESET', '30'))
+LLM_HEDGE = os.environ.get('LLM_HEDGE', '0') == '1'
+LLM_HEDGE_AFTER = float(os.environ.get('LLM_HEDGE_AFTER', '0'))
+
+# Streaming: flush buffered chunks once this many bytes or seconds accumulate
+STREAM_FLUSH_BYTES = int(os.environ.get('STREAM_FLUSH_BYTES', '64'))
+STREAM_FLUSH_INTERVAL = float(os.environ.get('STREAM_FLUSH_INTERVAL', '0.05'))
+
+# ══════════════════════════════════════════════════════════════════════
+# METRICS
+# ══════════════════════════════════════════════════════════════════════
+
+metrics_registry = MetricsRegistry()
+requests_in_flight = metrics_registry.gauge(
+    'http_requests_in_flight', 'HTTP requests being served'
+)
+request_seconds = metrics_registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency (streamed responses until the last chunk)',
+    labels=('endpoint', 'method', 'status')
+)
+stage_seconds = metrics_registry.histogram(
+    'chat_stage_duration_seconds', 'Time spent in each stage of a chat request',
+    labels=('stage',)
+)
+# Children kept at hand so hot paths skip the label lookup
+stage_history = stage_seconds.labels('history')  # loading and fitting conversation history
+stage_llm = stage_seconds.labels('llm')  # blocking model call, dispatcher queue included
+stage_llm_stream = stage_seconds.labels('llm_stream')  # streamed model call, first to last chunk
+stage_render = stage_seconds.labels('render')  # markdown to HTML
+stage_persist = stage_seconds.labels('persist')  # saving an exchange (a queue put with write-behind)
+stage_commit = stage_seconds.labels('commit')  # write-behind batch commit
+first_chunk_seconds = metrics_registry.histogram(
+    'llm_time_to_first_chunk_seconds', 'Time from a streamed chat request to its first chunk',
+    labels=('transport',)
+)
+llm_replies = metrics_registry.counter(
+    'llm_replies_total', 'Model replies served, from the response cache or not',
+    labels=('agent_type', 'cached')
+)
+llm_tokens = metrics_registry.counter(
+    'llm_tokens_total', 'Tokens sent to and generated by the model (upstream calls only)',
+    labels=('agent_type', 'kind')
+)
+websocket_connections = metrics_registry.gauge(
+    'websocket_connections', 'Open Socket.IO connections'
+)
+websocket_chat_seconds = metrics_registry.histogram(
+    'websocket_chat_duration_seconds', 'Time to stream a chat_message reply over the WebSocket'
+)
+db_queries = metrics_registry.counter(
+    'db_queries_total', 'SQL statements executed (background writers included)'
+)
+db_query_seconds = metrics_registry.histogram(
+    'db_query_duration_seconds', 'SQL statement execution time'
+)
+db_queries_per_request = metrics_registry.histogram(
+    'db_queries_per_request', 'SQL statements executed while serving one HTTP request',
+    labels=('endpoint',), buckets=COUNT_BUCKETS
+)
+query_tracker = QueryTracker(db_queries, db_query_seconds)
+metrics_registry.gauge(
+    'llm_dispatcher_queue_depth', 'Model calls waiting for a dispatcher worker',
+    function=lambda: llm_dispatcher.stats()['queue_depth'] if llm_dispatcher else 0
+)
+metrics_registry.gauge(
+    'llm_dispatcher_running', 'Model calls running upstream',
+    function=lambda: llm_dispatcher.stats()['running'] if llm_dispatcher else 0
+)
+metrics_registry.counter(
+    'llm_dispatcher_shed_total', 'Model calls rejected or evicted by the dispatcher',
+    function=lambda: llm_dispatcher.shed if llm_dispatcher else 0
+)
+metrics_registry.gauge(
+    'write_behind_queued_rows', 'Message rows waiting for the write-behind writer',
+    function=lambda: write_behind.stats()['queued'] if write_behind else 0
+)
+
+def record_usage(agent_type, usage):
+    """Count the tokens of one upstream model call"""
+    llm_tokens.labels(agent_type, 'prompt').inc(usage['prompt_tokens'])
+    llm_tokens.labels(agent_type, 'completion').inc(usage['completion_tokens'])
+
+# ══════════════════════════════════════════════════════════════════════
+# DATABASE MODELS
+# ══════════════════════════════════════════════════════════════════════
+
+class User(db.Model):
+    """User model for authentication"""
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
+    api_key = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    conversations = db.relationship('Conversation', backref='user', lazy=True)
+    
+    def set_password(self, password):
+        self.password_hash = generate_password_hash(password)
+    
+    def check_password(self, password):
+        return check_password_hash(self.password_hash, password)
+    
+    def identity(self):
+        return Identity(self.id, self.username, self.api_key)
+
+class Conversation(db.Model):
+    """Conversation history model"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    title = db.Column(db.String(200), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    messages = db.relationship('Message', backref='conversation', lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_conversation_user_updated', 'user_id', 'updated_at'),
+    )
+
+class Message(db.Model):
+    """Individual message model"""
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=False)
+    role = db.Column(db.String(20), nullable=False)  # 'user' or 'assistant'
+    content = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    tokens = db.Column(db.Integer, default=0)
+    html = db.Column(db.Text)  # rendered reply, stored when PERSIST_HTML is on
+    
+    __table_args__ = (
+        db.Index('ix_message_conversation_timestamp', 'conversation_id', 'timestamp'),
+        db.Index('ix_message_conversation_id_id', 'conversation_id', 'id'),
+    )
+
+class ConversationSummary(db.Model):
+    """Rolling summary of the turns that fell out of a conversation's context window"""
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), primary_key=True)
+    summary = db.Column(db.Text, nullable=False, default='')
+    message_count = db.Column(db.Integer, nullable=False, default=0)  # messages folded in
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Job(db.Model):
+    """Background generation job; workers claim queued rows (see jobs.py)"""
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, succeeded, failed
+    payload = db.Column(db.Text, nullable=False)  # JSON request
+    result = db.Column(db.Text)  # JSON result once succeeded
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(100))  # claim token of the lease holder
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    run_after = db.Column(db.DateTime)  # set when a transient failure delays the retry
+    started_at = db.Column(db.DateTime)
+    lease_until = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_job_status_created', 'status', 'created_at'),
+        db.Index('ix_job_user_status', 'user_id', 'status'),
+    )
+
+def load_identity(field, value):
+    """Fetch a user by id, username or api_key for the user cache"""
+    user = User.query.filter_by(**{field: value}).first()
+    return user.identity() if user else None
+
+user_cache = UserCache(load_identity, app.config['JWT_SECRET_KEY'], ttl=USER_CACHE_TTL)
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def forget_cached_user(mapper, connection, target):
+    """Drop cached identities when a user row changes through the ORM"""
+    user_cache.invalidate(target.id)
+
+@timed(stage_commit)
+def write_messages(rows):
+    """Insert message rows in a single transaction"""
+    with app.app_context():
+        try:
+            db.session.execute(db.insert(Message), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    if memory_indexer:
+        memory_indexer.notify()
+
+def forget_lost_writes(conversation_ids):
+    """Drop cached histories that already include messages the writer gave up on"""
+    for conversation_id in conversation_ids:
+        history_cache.invalidate(conversation_id)
+
+write_behind = WriteBehindQueue(
+    write_messages,
+    max_batch=WRITE_BEHIND_BATCH,
+    interval=WRITE_BEHIND_INTERVAL,
+    max_queue=WRITE_BEHIND_QUEUE,
+    on_drop=forget_lost_writes
+) if WRITE_BEHIND_ENABLED else None
+
+if write_behind:
+    # Commit whatever is still queued when the process exits
+    atexit.register(write_behind.close)
+
+# Create or upgrade tables (versioned migrations, see migrations.py)
+with app.app_context():
+    if SQLITE_PROFILE_ENABLED:
+        apply_sqlite_profile(db.engine, sqlite_pragmas(
+            journal_mode=SQLITE_JOURNAL_MODE,
+            synchronous=SQLITE_SYNCHRONOUS,
+            mmap_size=SQLITE_MMAP_SIZE,
+            cache_size=SQLITE_CACHE_SIZE,
+            busy_timeout=SQLITE_BUSY_TIMEOUT
+        ))
+    
+    for version, name in migrate(db.engine, db.metadata):
+        print(f"Applied migration {version}: {name}")
+    
+    if METRICS_ENABLED:
+        query_tracker.attach(db.engine)
+    
+    message_search = MessageSearch(db.engine)
+    job_store = JobStore(db.engine, Job.__table__, lease=JOB_LEASE, max_attempts=JOB_MAX_ATTEMPTS)
+    job_watcher = JobWatcher(job_store, max_waiters=JOB_MAX_WAITERS)
+    
+    # Create guest user if not exists (its API key is random and never handed out)
+    guest = User.query.filter_by(username='guest').first()
+    if not guest:
+        guest = User(
+            username='guest',
+            email='guest@example.com',
+            api_key=secrets.token_urlsafe(32),
+            password_hash='guest'
+        )
+        db.session.add(guest)
+        db.session.commit()
+    elif guest.api_key == 'guest_key':
+        # Older versions used a well-known key, which let anyone in as guest even with ALLOW_GUEST=0
+        guest.api_key = secrets.token_urlsafe(32)
+        db.session.commit()
+
+# ══════════════════════════════════════════════════════════════════════
+# LLM SETUP
+# ══════════════════════════════════════════════════════════════════════
+
+AGENT_PROMPTS = {
+    "coding_assistant": """You are an expert software engineer.
+Provide clean code, explanations, and best practices.
+Format code in markdown with syntax highlighting.""",
+    
+    "data_analyst": """You are a senior data scientist.
+Provide data analysis code, visualizations, and insights.
+Use pandas, numpy, and visualization libraries.""",
+    
+    "creative_writer": """You are a creative writer and storyteller.
+Write engaging narratives, stories, and creative content.""",
+    
+    "tutor": """You are a patient educational tutor.
+Explain concepts clearly with examples and practice problems."""
+}
+
+prompt_store = PromptStore(AGENT_PROMPTS, AGENT_PROMPTS_FILE)
+llm_breakers = {}  # upstream model name -> CircuitBreaker, shared by every persona
+genai = None
+genai_lock = threading.Lock()
+
+def load_genai():
+    """Import and configure google.generativeai on first use; the import alone takes seconds"""
+    global genai
+    if genai is None:
+        with genai_lock:
+            if genai is None:
+                import google.generativeai as module
+                # The default gRPC transport blocks the eventlet hub; REST goes through patched sockets
+                module.configure(
+                    api_key=GOOGLE_API_KEY,
+                    transport='rest' if ASYNC_MODE == 'eventlet' else None
+                )
+                genai = module
+    return genai
+
+def llm_configured():
+    return LLM_BACKEND == 'fake' or bool(GOOGLE_API_KEY)
+
+def build_model(model_name, system_prompt, primary=True):
+    """One upstream model: Gemini, or the offline fake when LLM_BACKEND=fake"""
+    if LLM_BACKEND == 'fake':
+        return FakeModel(
+            system_instruction=system_prompt,
+            latency=FAKE_LLM_LATENCY,
+            tokens_per_second=FAKE_LLM_TOKENS_PER_SECOND,
+            model_name=f"fake/{model_name}",
+            error_rate=FAKE_LLM_ERROR_RATE if primary else 0.0,
+            slow_rate=FAKE_LLM_SLOW_RATE if primary else 0.0,
+            slow_latency=FAKE_LLM_SLOW_LATENCY
+        )
+    return load_genai().GenerativeModel(
+        model_name=model_name,
+        system_instruction=system_prompt
+    )
+
+def build_persona_model(agent_type, system_prompt):
+    """A persona's model behind retries, circuit breakers and the fallback model"""
+    names = [LLM_MODEL] + ([LLM_FALLBACK_MODEL] if LLM_FALLBACK_MODEL else [])
+    breakers = [
+        llm_breakers.setdefault(name, CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET))
+        for name in names
+    ]
+    return ResilientModel(
+        [build_model(name, system_prompt, primary=(i == 0)) for i, name in enumerate(names)],
+        retries=LLM_RETRIES,
+        backoff=LLM_BACKOFF,
+        max_backoff=LLM_MAX_BACKOFF,
+        deadline=LLM_TIMEOUT,
+        hedge=LLM_HEDGE,
+        hedge_after=LLM_HEDGE_AFTER or None,
+        breakers=breakers
+    )
+
+# Personas are built on their first request, not at startup
+model_registry = ModelRegistry(build_persona_model, prompt_store)
+
+def get_llm_model(agent_type=AGENT_TYPE):
+    """Model for a persona; None if no LLM is configured (KeyError for an unknown persona)"""
+    if not llm_configured():
+        return None
+    try:
+        return model_registry.get(agent_type)
+    except KeyError:
+        raise
+    except Exception as e:
+        print(f"LLM setup error: {e}")
+        return None
+
+def request_agent_type(data):
+    """Persona named by a request payload (AGENT_TYPE if none); None if it doesn't exist"""
+    agent_type = data.get('agent_type') or AGENT_TYPE
+    if not isinstance(agent_type, str) or prompt_store.get(agent_type) is None:
+        return None
+    return agent_type
+
+context_window = ContextWindow(
+    llm_summarizer(
+        lambda agent_type: get_llm_model(agent_type or AGENT_TYPE), SUMMARY_MAX_TOKENS,
+        dispatch=(lambda fn: llm_dispatcher.call(fn, 'batch')) if llm_dispatcher else None
+    ),
+    max_tokens=CONTEXT_MAX_TOKENS,
+    low_water=CONTEXT_LOW_WATER
+)
+
+def get_embedder():
+    """Embedding function for retrieval memory"""
+    if EMBEDDING_BACKEND == 'gemini' and GOOGLE_API_KEY and LLM_BACKEND != 'fake':
+        return GeminiEmbedder(load_genai())
+    return HashingEmbedder(EMBEDDING_DIM)
+
+memory_indexer = None
+if RETRIEVAL_ENABLED:
+    embedder = get_embedder()
+    with app.app_context():
+        memory_indexer = MemoryIndexer(
+            db.engine, embedder, VectorIndex(embedder.dim), batch=EMBEDDING_BATCH
+        )
+    
+    # Started by the first request (or __main__), so CLI commands and job workers don't embed too
+    app.before_request(memory_indexer.start)
+
+def reply_key(history, message, agent_type=AGENT_TYPE):
+    """Identity of a model call: persona, system prompt, history and message"""
+    return ResponseCache.key(agent_type, prompt_store.get(agent_type), history, message)
+
+def llm_priority(identity, interactive=False):
+    """Dispatcher class for a caller: live WebSocket sessions first, guests after signed-in users"""
+    if identity.username == 'guest':
+        return 'guest'
+    return 'interactive' if interactive else 'user'
+
+@timed(stage_llm)
+def call_model(history, message, priority='user', agent_type=AGENT_TYPE):
+    """One upstream model call (through the dispatcher); returns (text, usage)"""
+    if llm_dispatcher is not None:
+        return llm_dispatcher.call(lambda: send_model(history, message, agent_type), priority)
+    return send_model(history, message, agent_type)
+
+def persona_model(agent_type):
+    """Built model for a persona (raises if no LLM is configured)"""
+    model = get_llm_model(agent_type)
+    if model is None:
+        raise RuntimeError("LLM not configured")
+    return model
+
+def send_model(history, message, agent_type=AGENT_TYPE):
+    """Blocking model call on the current thread"""
+    chat_session = persona_model(agent_type).start_chat(history=history)
+    response = chat_session.send_message(message)
+    ai_response = response.text
+    usage = usage_stats(response, message, ai_response)
+    record_usage(agent_type, usage)
+    return ai_response, usage
+
+def stream_model(history, message, result, priority='user', agent_type=AGENT_TYPE):
+    """One upstream streamed model call; fills `result` with text and usage when done"""
+    produce = lambda: send_model_stream(history, message, result, agent_type)
+    if llm_dispatcher is not None:
+        return llm_dispatcher.stream(produce, priority)
+    return produce()
+
+def send_model_stream(history, message, result, agent_type=AGENT_TYPE):
+    """Streamed model call on the current thread"""
+    with stage_llm_stream.time():
+        chat_session = persona_model(agent_type).start_chat(history=history)
+        response = chat_session.send_message(message, stream=True)
+        
+        parts = []
+        for batch in iter_batches(iter_text(response), STREAM_FLUSH_BYTES, STREAM_FLUSH_INTERVAL):
+            parts.append(batch)
+            yield batch
+    ai_response = ''.join(parts)
+    usage = usage_stats(response, message, ai_response)
+    record_usage(agent_type, usage)
+    result.update(text=ai_response, usage=usage)
+
+def generate_reply(history, message, use_cache=True, priority='user', agent_type=AGENT_TYPE):
+    """Full model reply for a prompt; returns (text, usage, cached)"""
+    key = reply_key(history, message, agent_type)
+    if response_cache is not None and use_cache:
+        cached = response_cache.get(key)
+        if cached is not None:
+            llm_replies.labels(agent_type, 'true').inc()
+            return cached, usage_stats(None, message, cached), True
+    
+    if single_flight is not None:
+        (ai_response, usage), _ = single_flight.do(
+            key, lambda: call_model(history, message, priority, agent_type)
+        )
+    else:
+        ai_response, usage = call_model(history, message, priority, agent_type)
+    
+    if response_cache is not None:
+        response_cache.put(key, ai_response)
+    llm_replies.labels(agent_type, 'false').inc()
+    return ai_response, usage, False
+
+def stream_reply(history, message, result, use_cache=True, priority='user', agent_type=AGENT_TYPE):
+    """Yield batched reply chunks as the model produces them.
+    
+    Once exhausted, `result` holds the full 'text', its 'usage' and whether it was 'cached'.
+    """
+    key = reply_key(history, message, agent_type)
+    if response_cache is not None and use_cache:
+        cached = response_cache.get(key)
+        if cached is not None:
+            result.update(text=cached, usage=usage_stats(None, message, cached), cached=True)
+            llm_replies.labels(agent_type, 'true').inc()
+            yield cached
+            return
+    
+    produce = lambda shared: stream_model(history, message, shared, priority, agent_type)
+    if single_flight is not None:
+        yield from single_flight.stream(key, produce, result)
+    else:
+        yield from produce(result)
+    
+    if response_cache is not None:
+        response_cache.put(key, result['text'])
+    result['cached'] = False
+    llm_replies.labels(agent_type, 'false').inc()
+
+# ══════════════════════════════════════════════════════════════════════
+# AUTHENTICATION ENDPOINTS
+# ══════════════════════════════════════════════════════════════════════
+
+def api_key_identity(api_key):
+    """Cached identity for an API key; never the guest user when ALLOW_GUEST is off"""
+    identity = user_cache.by_api_key(api_key)
+    if identity is not None and identity.username == 'guest' and not ALLOW_GUEST:
+        return None
+    return identity
+
+def resolve_identity(token=None, api_key=None):
+    """Cached identity for an API key or a JWT (raises if the JWT is invalid).
+    
+    Without credentials this is the guest user, or None when ALLOW_GUEST is off.
+    """
+    if api_key:
+        return api_key_identity(api_key)
+    if token:
+        return user_cache.by_id(decode_token(token)['sub'])
+    return user_cache.by_username('guest') if ALLOW_GUEST else None
+
+def auth_required(view):
+    """Resolve the caller (X-API-Key or Bearer JWT) into g.user, or answer 401"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        api_key = request.headers.get('X-API-Key')
+        if api_key:
+            identity = api_key_identity(api_key)
+        elif verify_jwt_in_request(optional=True):
+            identity = user_cache.by_id(get_jwt_identity())
+        else:
+            identity = resolve_identity()
+        if identity is None:
+            return jsonify({"error": "Authentication required"}), 401
+        g.user = identity
+        return view(*args, **kwargs)
+    return wrapper
+
+def limit_request(identity, api_key, ip, cost=1):
+    """Take an in-flight slot and charge the caller's buckets; returns the slot key or None.
+    
+    The slot comes first, so a request refused for concurrency spends no tokens,
+    and it is given back if a bucket then refuses the request.
+    """
+    if rate_limiter is None:
+        return None
+    is_guest = identity.username == 'guest'
+    slot = f"guest:{ip}" if is_guest else f"user:{identity.id}"
+    acquired = rate_limiter.acquire(slot)
+    try:
+        rate_limiter.check([
+            ('guest', 'all') if is_guest else ('user', identity.id),
+            ('api_key', api_key),
+            ('ip', ip)
+        ], cost=cost)
+    except RateLimited:
+        if acquired:
+            rate_limiter.release(slot)
+        raise
+    return slot if acquired else None
+
+def rate_limited(view=None, cost=None):
+    """Apply rate limits and the in-flight LLM call quota to an endpoint (after auth_required).
+    
+    `cost()` gives the tokens a request takes (1 without it); it runs before anything
+    is charged, and a ValueError from it rejects the request with 400. The in-flight
+    slot key is left in g.rate_slot for views that run several model calls at once.
+    """
+    if view is None:
+        return lambda view: rate_limited(view, cost)
+    
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if g.get('rate_limited'):
+            # chat() hands SSE requests to chat_stream(); charge them once
+            return view(*args, **kwargs)
+        g.rate_limited = True
+        try:
+            tokens = cost() if cost else 1
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        slot = g.rate_slot = limit_request(
+            g.user, request.headers.get('X-API-Key'), request.remote_addr, tokens
+        )
+        if slot is None:
+            return view(*args, **kwargs)
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except BaseException:
+            rate_limiter.release(slot)
+            raise
+        if response.is_streamed:
+            # Held until the server closes the response after the last chunk
+            response.call_on_close(lambda: rate_limiter.release(slot))
+        else:
+            rate_limiter.release(slot)
+        return response
+    return wrapper
+
+@app.errorhandler(DispatchError)
+def llm_unavailable(e):
+    response = jsonify({"error": str(e), "retry_after": round(e.retry_after, 3)})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(max(1, round(e.retry_after)))
+    return response
+
+@app.errorhandler(RateLimited)
+def too_many_requests(e):
+    response = jsonify({"error": str(e), "retry_after": round(e.retry_after, 3)})
+    response.status_code = 429
+    response.headers['Retry-After'] = e.retry_after_header()
+    return response
+
+@app.errorhandler(CostTooLarge)
+def too_large_for_limits(e):
+    # No Retry-After: the request would be refused however long the caller waited
+    return jsonify({"error": str(e), "limit": e.burst}), 413
+
+def verify_password(username, password):
+    """Identity for correct credentials (the slow path behind the login cache)"""
+    user = User.query.filter_by(username=username).first()
+    if not user or not user.check_password(password):
+        return None
+    return user.identity()
+
+@app.route('/api/auth/register', methods=['POST'])
+def register():
+    """Register new user"""
+    try:
+        data = request.get_json()
+        username = data.get('username')
+        email = data.get('email')
+        password = data.get('password')
+        
+        if not all([username, email, password]):
+            return jsonify({"error": "Missing required fields"}), 400
+        
+        if User.query.filter_by(username=username).first():
+            return jsonify({"error": "Username already exists"}), 400
+        
+        if User.query.filter_by(email=email).first():
+            return jsonify({"error": "Email already exists"}), 400
+        
+        # Create new user
+        user = User(
+            username=username,
+            email=email,
+            api_key=secrets.token_urlsafe(32)
+        )
+        user.set_password(password)
+        
+        db.session.add(user)
+        db.session.commit()
+        
+        # Generate JWT token
+        access_token = create_access_token(identity=str(user.id))
+        
+        return jsonify({
+            "message": "User registered successfully",
+            "access_token": access_token,
+            "api_key": user.api_key
+        }), 201
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/auth/login', methods=['POST'])
+def login():
+    """Login user"""
+    try:
+        data = request.get_json()
+        username = data.get('username')
+        password = data.get('password')
+        
+        if not username or not password:
+            return jsonify({"error": "Invalid credentials"}), 401
+        
+        user = user_cache.login(username, password, verify_password)
+        if not user:
+            return jsonify({"error": "Invalid credentials"}), 401
+        
+        access_token = create_access_token(identity=str(user.id))
+        
+        return jsonify({
+            "access_token": access_token,
+            "api_key": user.api_key,
+            "username": user.username
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/streamlit')
+def streamlit_redirect():
+    """Redirect to Streamlit UI"""
+    streamlit_url = os.environ.get('STREAMLIT_URL', 'http://localhost:8501')
+    return redirect(streamlit_url)
+
+# ══════════════════════════════════════════════════════════════════════
+# CHAT ENDPOINTS
+# ══════════════════════════════════════════════════════════════════════
+
+def build_history(conversation_id):
+    """Load a conversation's messages as model chat history (cached)"""
+    history = history_cache.get(conversation_id)
+    if history is not None:
+        return history
+    
+    # Taken before the query, so a turn appended meanwhile keeps this load out of the cache
+    version = history_cache.version(conversation_id)
+    if write_behind:
+        write_behind.wait(conversation_id)
+    messages = db.session.query(Message.role, Message.content).filter_by(
+        conversation_id=conversation_id
+    ).order_by(Message.timestamp).all()
+    
+    history = [{"role": msg.role, "parts": [msg.content]} for msg in messages]
+    history_cache.put(conversation_id, history, version)
+    return history
+
+@timed(stage_history)
+def build_context(conversation_id, agent_type=AGENT_TYPE):
+    """History for the next model call: rolling summary plus the recent turns that fit"""
+    history = build_history(conversation_id)
+    record = db.session.get(ConversationSummary, conversation_id)
+    summary = record.summary if record else ''
+    summarized = record.message_count if record else 0
+    
+    if context_window.over_budget(history, summarized):
+        # Folding calls the model: don't hold a pooled connection (or SQLite lock) meanwhile
+        db.session.close()
+    prompt_history, new_summary, new_summarized = context_window.fit(
+        history, summary, summarized, agent_type
+    )
+    
+    if new_summarized != summarized:
+        save_summary(conversation_id, new_summary, new_summarized)
+    
+    return prompt_history
+
+def save_summary(conversation_id, summary, summarized):
+    """Store a folded summary unless a concurrent request already stored one as far along"""
+    table = ConversationSummary.__table__
+    values = {"summary": summary, "message_count": summarized, "updated_at": datetime.utcnow()}
+    try:
+        updated = db.session.execute(table.update().where(
+            table.c.conversation_id == conversation_id,
+            table.c.message_count < summarized
+        ).values(**values)).rowcount
+        if not updated and db.session.get(ConversationSummary, conversation_id) is None:
+            db.session.execute(table.insert().values(conversation_id=conversation_id, **values))
+        db.session.commit()
+    except IntegrityError:
+        # Another request inserted the first summary meanwhile; keep theirs
+        db.session.rollback()
+
+def retrieve_memories(user_id, message, recent=()):
+    """The user's past messages most similar to `message`, skipping ones already in `recent`"""
+    query = memory_indexer.embedder.embed([message], kind='query')[0]
+    hits = [
+        hit for hit in memory_indexer.index.search(query, k=RETRIEVAL_TOP_K * 2, user_id=user_id)
+        if hit[2] >= RETRIEVAL_MIN_SCORE
+    ]
+    if not hits:
+        return []
+    
+    rows = db.session.query(Message.id, Message.role, Message.content).filter(
+        Message.id.in_([hit[0] for hit in hits])
+    ).all()
+    by_id = {row.id: row for row in rows}
+    seen = {part for turn in recent for part in turn["parts"]}
+    memories = []
+    for message_id, _, score in hits:
+        row = by_id.get(message_id)
+        if row is None or row.content in seen:
+            continue
+        memories.append({"role": row.role, "content": row.content, "score": score})
+        if len(memories) == RETRIEVAL_TOP_K:
+            break
+    return memories
+
+@timed(stage_history)
+def build_retrieval_context(user_id, message, conversation=None):
+    """History for retrieval mode: relevant past messages plus the most recent turns"""
+    recent = []
+    if conversation:
+        recent = build_history(conversation.id)[-RETRIEVAL_RECENT_TURNS:]
+    return with_memories(recent, retrieve_memories(user_id, message, recent))
+
+def use_retrieval(data):
+    """True when retrieval memory is on and the request didn't opt out"""
+    return memory_indexer is not None and data.get('retrieval', True) is not False
+
+def create_conversation(user_id, message):
+    """Add a new conversation titled after its first message"""
+    conversation = Conversation(
+        user_id=user_id,
+        title=message[:50] + "..." if len(message) > 50 else message
+    )
+    db.session.add(conversation)
+    db.session.commit()
+    return conversation
+
+def exchange_rows(conversation_id, message, ai_response):
+    """Message rows for one user/assistant exchange"""
+    now = datetime.utcnow()
+    rows = [{
+        "conversation_id": conversation_id,
+        "role": 'user',
+        "content": message,
+        "timestamp": now,
+        "tokens": 0
+    }, {
+        "conversation_id": conversation_id,
+        "role": 'assistant',
+        "content": ai_response,
+        "timestamp": now + timedelta(microseconds=1),
+        "tokens": len(ai_response.split())
+    }]
+    if PERSIST_HTML:
+        rows[0]["html"] = None
+        rows[1]["html"] = markdown_renderer.render(ai_response)
+    return rows
+
+@timed(stage_persist)
+def save_exchange(conversation, message, ai_response):
+    """Persist a user/assistant message pair (queued when write-behind is on)"""
+    rows = exchange_rows(conversation.id, message, ai_response)
+    
+    if write_behind:
+        write_behind.put(conversation.id, rows, owner=conversation.user_id)
+    else:
+        db.session.execute(db.insert(Message), rows)
+        db.session.commit()
+        if memory_indexer:
+            memory_indexer.notify()
+    
+    history_cache.append(conversation.id, [
+        {"role": "user", "parts": [message]},
+        {"role": "assistant", "parts": [ai_response]}
+    ])
+
+@timed(stage_persist)
+def save_exchanges(user_id, exchanges):
+    """Persist many (conversation_id or None, message, reply) exchanges at once.
+    
+    Missing conversations are created together; all message rows go out in one
+    insert (or one write-behind put per conversation). Returns the conversation ids.
+    """
+    new = [
+        Conversation(user_id=user_id, title=message[:50] + "..." if len(message) > 50 else message)
+        for conversation_id, message, _ in exchanges if conversation_id is None
+    ]
+    if new:
+        db.session.add_all(new)
+        db.session.commit()
+    created = iter(new)
+    conversation_ids = [
+        conversation_id if conversation_id is not None else next(created).id
+        for conversation_id, _, _ in exchanges
+    ]
+    
+    rows_by_conversation = {}
+    for conversation_id, (_, message, ai_response) in zip(conversation_ids, exchanges):
+        rows_by_conversation.setdefault(conversation_id, []).extend(
+            exchange_rows(conversation_id, message, ai_response)
+        )
+        history_cache.append(conversation_id, [
+            {"role": "user", "parts": [message]},
+            {"role": "assistant", "parts": [ai_response]}
+        ])
+    if write_behind:
+        for conversation_id, rows in rows_by_conversation.items():
+            write_behind.put(conversation_id, rows, owner=user_id)
+    else:
+        db.session.execute(db.insert(Message), [
+            row for rows in rows_by_conversation.values() for row in rows
+        ])
+        db.session.commit()
+        if memory_indexer:
+            memory_indexer.notify()
+    return conversation_ids
+
+def cache_allowed(data):
+    """False when the client asked to bypass the response cache"""
+    if data.get('cache', True) is False:
+        return False
+    return 'no-cache' not in request.headers.get('Cache-Control', '')
+
+def sse_event(event, data):
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/chat', methods=['POST'])
+@auth_required
+@rate_limited
+def chat():
+    """Main chat endpoint with conversation history"""
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        return chat_stream()
+    
+    try:
+        current_user_id = g.user.id
+        
+        data = request.get_json()
+        
+        message = data.get('message')
+        conversation_id = data.get('conversation_id')
+        
+        if not message:
+            return jsonify({"error": "Missing message"}), 400
+        
+        agent_type = request_agent_type(data)
+        if agent_type is None:
+            return jsonify({
+                "error": "Unknown agent_type",
+                "agent_types": model_registry.agent_types()
+            }), 400
+        
+        if not llm_configured():
+            return jsonify({"error": "LLM not configured"}), 500
+        
+        # Get conversation history
+        history = []
+        conversation = None
+        if conversation_id:
+            conversation = Conversation.query.filter_by(
+                id=conversation_id,
+                user_id=current_user_id
+            ).first()
+            if not conversation:
+                return jsonify({"error": "Conversation not found"}), 404
+        if use_retrieval(data):
+            history = build_retrieval_context(current_user_id, message, conversation)
+        elif conversation:
+            history = build_context(conversation.id, agent_type)
+        
+        # Release the DB connection while the model generates, so in-flight
+        # chats don't exhaust the pool or hold SQLite locks
+        db.session.close()
+        
+        # Generate response
+        ai_response, usage, cached = generate_reply(
+            history, message, cache_allowed(data), llm_priority(g.user), agent_type
+        )
+        
+        # Create conversation and save messages
+        if not conversation_id:
+            conversation = create_conversation(current_user_id, message)
+        save_exchange(conversation, message, ai_response)
+        
+        # Convert to HTML
+        with stage_render.time():
+            html_response = markdown_renderer.render(ai_response)
+        
+        return jsonify({
+            "response": ai_response,
+            "html": html_response,
+            "conversation_id": conversation.id,
+            "usage": usage,
+            "cached": cached,
+            "agent_type": agent_type,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+        
+    except DispatchError:
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/chat/stream', methods=['POST'])
+@auth_required
+@rate_limited
+def chat_stream():
+    """Chat endpoint streaming the response as Server-Sent Events"""
+    started = time.perf_counter()
+    try:
+        current_user_id = g.user.id
+        
+        data = request.get_json()
+        
+        message = data.get('message')
+        conversation_id = data.get('conversation_id')
+        
+        if not message:
+            return jsonify({"error": "Missing message"}), 400
+        
+        agent_type = request_agent_type(data)
+        if agent_type is None:
+            return jsonify({
+                "error": "Unknown agent_type",
+                "agent_types": model_registry.agent_types()
+            }), 400
+        
+        if not llm_configured():
+            return jsonify({"error": "LLM not configured"}), 500
+        
+        history = []
+        conversation = None
+        if conversation_id:
+            conversation = Conversation.query.filter_by(
+                id=conversation_id,
+                user_id=current_user_id
+            ).first()
+            if not conversation:
+                return jsonify({"error": "Conversation not found"}), 404
+        if use_retrieval(data):
+            history = build_retrieval_context(current_user_id, message, conversation)
+        elif conversation:
+            history = build_context(conversation.id, agent_type)
+        
+        use_cache = cache_allowed(data)
+        render_chunks = data.get('render_chunks', False) is True
+        priority = llm_priority(g.user)
+        
+        # Release the DB connection while the model streams
+        db.session.close()
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    
+    def generate():
+        try:
+            result = {}
+            renderer = IncrementalRenderer(markdown_renderer) if render_chunks else None
+            first = True
+            for batch in stream_reply(history, message, result, use_cache, priority, agent_type):
+                if first:
+                    first_chunk_seconds.labels('sse').observe(time.perf_counter() - started)
+                    first = False
+                event = {"chunk": batch}
+                if renderer:
+                    # Completed blocks to append, plus a preview of the block in progress
+                    event["html"] = renderer.feed(batch)
+                    event["tail_html"] = renderer.tail()
+                yield sse_event('chunk', event)
+            ai_response = result['text']
+            
+            # Persist only once the full response is known
+            if conversation_id:
+                conversation = db.session.get(Conversation, conversation_id)
+            else:
+                conversation = create_conversation(current_user_id, message)
+            save_exchange(conversation, message, ai_response)
+            
+            with stage_render.time():
+                html_response = markdown_renderer.render(ai_response)
+            
+            yield sse_event('complete', {
+                "conversation_id": conversation.id,
+                "usage": result['usage'],
+                "cached": result['cached'],
+                "agent_type": agent_type,
+                "html": html_response,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+            
+        except DispatchError as e:
+            db.session.rollback()
+            yield sse_event('error', {"error": str(e), "retry_after": round(e.retry_after, 3)})
+        except Exception as e:
+            db.session.rollback()
+            yield sse_event('error', {"error": str(e)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def parse_batch_items(data):
+    """Validated batch items: [{"message", "agent_type", "conversation_id"}] (raises ValueError)"""
+    raw = data.get('items')
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("items must be a non-empty list")
+    if len(raw) > BATCH_MAX_ITEMS:
+        raise ValueError(f"At most {BATCH_MAX_ITEMS} items per batch")
+    
+    default_agent = data.get('agent_type') or AGENT_TYPE
+    items = []
+    for index, entry in enumerate(raw):
+        if isinstance(entry, str):
+            entry = {"message": entry}
+        if not isinstance(entry, dict) or not entry.get('message') or not isinstance(entry['message'], str):
+            raise ValueError(f"items[{index}]: missing message")
+        agent_type = request_agent_type({"agent_type": entry.get('agent_type') or default_agent})
+        if agent_type is None:
+            raise ValueError(f"items[{index}]: unknown agent_type")
+        conversation_id = entry.get('conversation_id')
+        if conversation_id is not None and not isinstance(conversation_id, int):
+            raise ValueError(f"items[{index}]: conversation_id must be an integer")
+        items.append({
+            "message": entry['message'],
+            "agent_type": agent_type,
+            "conversation_id": conversation_id
+        })
+    return items
+
+def batch_cost():
+    """Rate-limit tokens for a batch: one per item, like sending them one by one.
+    
+    The body is validated first (ValueError), so a malformed batch spends nothing.
+    """
+    data = request.get_json(silent=True)
+    return len(parse_batch_items(data if isinstance(data, dict) else {}))
+
+@app.route('/api/chat/batch', methods=['POST'])
+@auth_required
+@rate_limited(cost=batch_cost)
+def chat_batch():
+    """Run many independent prompts concurrently; results stream back as NDJSON in completion order"""
+    try:
+        current_user_id = g.user.id
+        
+        data = request.get_json()
+        items = parse_batch_items(data or {})
+        
+        if not llm_configured():
+            return jsonify({"error": "LLM not configured"}), 500
+        
+        concurrency = data.get('concurrency', BATCH_CONCURRENCY)
+        if not isinstance(concurrency, int) or concurrency < 1:
+            return jsonify({"error": "concurrency must be a positive integer"}), 400
+        concurrency = min(concurrency, BATCH_CONCURRENCY, len(items))
+        
+        conversation_ids = {item['conversation_id'] for item in items} - {None}
+        if conversation_ids:
+            owned = {row.id for row in db.session.query(Conversation.id).filter(
+                Conversation.id.in_(conversation_ids),
+                Conversation.user_id == current_user_id
+            )}
+            missing = sorted(conversation_ids - owned)
+            if missing:
+                return jsonify({"error": f"Conversation {missing[0]} not found"}), 404
+        
+        # Every item sees its conversation as it was when the batch started
+        retrieval = use_retrieval(data)
+        histories = {}
+        for item in items:
+            conversation_id = item['conversation_id']
+            if retrieval:
+                conversation = db.session.get(Conversation, conversation_id) if conversation_id else None
+                item['history'] = build_retrieval_context(current_user_id, item['message'], conversation)
+            elif conversation_id:
+                key = (conversation_id, item['agent_type'])
+                if key not in histories:
+                    histories[key] = build_context(conversation_id, item['agent_type'])
+                item['history'] = histories[key]
+            else:
+                item['history'] = []
+        
+        use_cache = cache_allowed(data)
+        persist = data.get('persist', True) is not False
+        
+        # Release the DB connection while the model works through the batch
+        db.session.close()
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    
+    # Each item running at once is one of the caller's in-flight calls: the batch holds
+    # one slot already and fans out only as far as more are free
+    slot = g.get('rate_slot')
+    extra_slots = rate_limiter.acquire_up_to(slot, concurrency - 1) if slot else 0
+    if slot:
+        concurrency = 1 + extra_slots
+    
+    def run(item):
+        return generate_reply(item['history'], item['message'], use_cache, 'batch', item['agent_type'])
+    
+    def generate():
+        started = time.perf_counter()
+        succeeded = failed = 0
+        for group in completed(run, items, concurrency, BATCH_PERSIST_GROUP):
+            done = [(index, value) for index, value, error in group if error is None]
+            saved, persist_error = {}, None
+            if persist and done:
+                try:
+                    ids = save_exchanges(current_user_id, [
+                        (items[index]['conversation_id'], items[index]['message'], value[0])
+                        for index, value in done
+                    ])
+                    saved = {index: conversation_id for (index, _), conversation_id in zip(done, ids)}
+                except Exception as e:
+                    db.session.rollback()
+                    persist_error = str(e)
+            
+            for index, value, error in group:
+                if error is not None:
+                    failed += 1
+                    line = {"type": "error", "index": index, "error": str(error)}
+                    if isinstance(error, DispatchError):
+                        line["retry_after"] = round(error.retry_after, 3)
+                else:
+                    succeeded += 1
+                    ai_response, usage, cached = value
+                    line = {
+                        "type": "result",
+                        "index": index,
+                        "response": ai_response,
+                        "conversation_id": saved.get(index),
+                        "agent_type": items[index]['agent_type'],
+                        "usage": usage,
+                        "cached": cached
+                    }
+                    if persist_error:
+                        line["persist_error"] = persist_error
+                yield json.dumps(line) + "\n"
+        
+        yield json.dumps({
+            "type": "summary",
+            "items": len(items),
+            "succeeded": succeeded,
+            "failed": failed,
+            "concurrency": concurrency,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+        }) + "\n"
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    if extra_slots:
+        response.call_on_close(lambda: rate_limiter.release(slot, extra_slots))
+    return response
+
+CONVERSATION_FIELDS = ('id', 'title', 'created_at', 'updated_at', 'message_count', 'last_message_at')
+MESSAGE_FIELDS = ('id', 'role', 'content', 'timestamp', 'tokens', 'html')
+
+def parse_limit(default, maximum):
+    """Page size from ?limit=, clamped to [1, maximum] (raises ValueError("invalid limit"))"""
+    try:
+        limit = int(request.args.get('limit', default))
+    except ValueError:
+        raise ValueError("invalid limit") from None
+    return max(1, min(limit, maximum))
+
+def parse_cursor(parse):
+    """?before= cursor decoded by `parse`, or None (raises ValueError("invalid cursor"))"""
+    raw = request.args.get('before')
+    if not raw:
+        return None
+    try:
+        return parse(raw)
+    except (TypeError, ValueError):
+        raise ValueError("invalid cursor") from None
+
+def conversation_cursor(raw):
+    """Cursor is "<updated_at>|<id>" of the last row of the previous page"""
+    updated_at, separator, last_id = raw.rpartition('|')
+    if not separator:
+        raise ValueError(raw)
+    return datetime.fromisoformat(updated_at), int(last_id)
+
+def parse_fields(allowed, default):
+    """Projection from ?fields=a,b,c (unknown names are rejected)"""
+    raw = request.args.get('fields')
+    if not raw:
+        return list(default)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def serialize_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def message_value(row, field):
+    if field == 'html':
+        # Stored HTML if it was persisted, otherwise the memoized rendering
+        return row.html or markdown_renderer.render(row.source)
+    return serialize_value(getattr(row, field))
+
+@app.route('/api/conversations', methods=['GET'])
+@auth_required
+def get_conversations():
+    """Get user's conversation list (newest first, keyset-paginated)"""
+    try:
+        current_user_id = g.user.id
+        
+        limit = parse_limit(CONVERSATION_PAGE_SIZE, MAX_PAGE_SIZE)
+        fields = parse_fields(CONVERSATION_FIELDS, CONVERSATION_FIELDS)
+        before = parse_cursor(conversation_cursor)
+        
+        if write_behind:
+            write_behind.wait(owner=current_user_id)
+        
+        columns = [Conversation.id, Conversation.updated_at]
+        columns += [getattr(Conversation, f) for f in ('title', 'created_at') if f in fields]
+        aggregated = 'message_count' in fields or 'last_message_at' in fields
+        if aggregated:
+            # Counts come from the join; message bodies are never loaded
+            columns += [
+                db.func.count(Message.id).label('message_count'),
+                db.func.max(Message.timestamp).label('last_message_at')
+            ]
+        
+        query = db.session.query(*columns).filter(Conversation.user_id == current_user_id)
+        if aggregated:
+            query = query.outerjoin(
+                Message, Message.conversation_id == Conversation.id
+            ).group_by(Conversation.id)
+        if before:
+            updated_at, last_id = before
+            query = query.filter(db.or_(
+                Conversation.updated_at < updated_at,
+                db.and_(Conversation.updated_at == updated_at, Conversation.id < last_id)
+            ))
+        
+        rows = query.order_by(
+            Conversation.updated_at.desc(), Conversation.id.desc()
+        ).limit(limit + 1).all()
+        
+        page = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = f"{page[-1].updated_at.isoformat()}|{page[-1].id}"
+        
+        return jsonify({
+            "conversations": [{
+                f: serialize_value(getattr(c, f)) for f in fields
+            } for c in page],
+            "next_cursor": next_cursor
+        })
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/conversations/<int:conversation_id>', methods=['GET'])
+@auth_required
+def get_conversation(conversation_id):
+    """Get specific conversation with a page of messages.
+    
+    Returns the latest `limit` messages (oldest first); pass `next_cursor` back
+    as `?before=` to fetch the page before them.
+    """
+    try:
+        current_user_id = g.user.id
+        
+        limit = parse_limit(MESSAGE_PAGE_SIZE, MAX_PAGE_SIZE)
+        fields = parse_fields(MESSAGE_FIELDS, ('id', 'role', 'content', 'timestamp'))
+        before = parse_cursor(int)
+        
+        conversation = Conversation.query.filter_by(
+            id=conversation_id,
+            user_id=current_user_id
+        ).first()
+        
+        if not conversation:
+            return jsonify({"error": "Conversation not found"}), 404
+        
+        # Read-your-writes: let queued messages for this conversation land first
+        if write_behind:
+            write_behind.wait(conversation_id)
+        
+        # Keyset on the primary key: ids follow insertion order within a conversation
+        columns = [Message.id] + [getattr(Message, f) for f in fields if f != 'id']
+        if 'html' in fields:
+            columns.append(Message.content.label('source'))
+        query = db.session.query(*columns).filter(Message.conversation_id == conversation_id)
+        if before:
+            query = query.filter(Message.id < before)
+        rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+        
+        page = rows[:limit][::-1]
+        next_cursor = page[0].id if len(rows) > limit else None
+        
+        return jsonify({
+            "conversation": {
+                "id": conversation.id,
+                "title": conversation.title,
+                "created_at": conversation.created_at.isoformat()
+            },
+            "messages": [{
+                f: message_value(m, f) for f in fields
+            } for m in page],
+            "next_cursor": next_cursor
+        })
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/search', methods=['GET'])
+@auth_required
+def search_messages():
+    """Full-text search over the user's messages, best matches first"""
+    try:
+        current_user_id = g.user.id
+        
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({"error": "Query parameter q is required"}), 400
+        limit = parse_limit(SEARCH_PAGE_SIZE, MAX_PAGE_SIZE)
+        offset = max(0, request.args.get('offset', 0, type=int))
+        conversation_id = request.args.get('conversation_id', type=int)
+        
+        # Queued messages only become searchable once they are committed
+        if write_behind:
+            write_behind.wait(owner=current_user_id)
+        
+        results, has_more = message_search.search(
+            db.session.connection(), query, current_user_id,
+            limit=limit, offset=offset, conversation_id=conversation_id
+        )
+        
+        return jsonify({
+            "query": query,
+            "results": [{
+                k: serialize_value(v) for k, v in result.items()
+            } for result in results],
+            "next_offset": offset + limit if has_more else None
+        })
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ══════════════════════════════════════════════════════════════════════
+# BACKGROUND JOBS
+# ══════════════════════════════════════════════════════════════════════
+
+job_pool = None
+job_pool_lock = threading.Lock()
+
+def ensure_job_workers():
+    """Start the worker processes on first use (so CLI commands and the workers themselves don't)"""
+    global job_pool
+    if job_pool is None and JOB_WORKERS > 0:
+        with job_pool_lock:
+            if job_pool is None:
+                app_path = os.path.abspath(__file__)
+                job_pool = JobWorkerPool(
+                    [sys.executable, '-m', 'flask', '--app', app_path, 'job-worker'],
+                    processes=JOB_WORKERS,
+                    cwd=os.path.dirname(app_path)
+                )
+                job_pool.start()
+                atexit.register(job_pool.stop)
+    return job_pool
+
+def execute_job(job):
+    """Run one job in a worker process: the same generation and persistence as /api/chat"""
+    payload = job['payload']
+    user_id = job['user_id']
+    message = payload['message']
+    agent_type = payload.get('agent_type') or AGENT_TYPE
+    with app.app_context():
+        try:
+            conversation = None
+            if payload.get('conversation_id'):
+                conversation = Conversation.query.filter_by(
+                    id=payload['conversation_id'],
+                    user_id=user_id
+                ).first()
+                if not conversation:
+                    raise ValueError("Conversation not found")
+            if use_retrieval(payload):
+                # Workers don't run the indexer; pick up the vectors the web processes stored
+                memory_indexer.load()
+                history = build_retrieval_context(user_id, message, conversation)
+            elif conversation:
+                history = build_context(conversation.id, agent_type)
+            else:
+                history = []
+            db.session.close()
+            
+            try:
+                ai_response, usage, cached = generate_reply(
+                    history, message, payload.get('cache', True), 'batch', agent_type
+                )
+            except DispatchError as e:
+                # Overloaded or upstream down: try again later instead of failing the job
+                raise RetryJob(str(e), e.retry_after) from e
+            
+            if not conversation:
+                conversation = create_conversation(user_id, message)
+            save_exchange(conversation, message, ai_response)
+            if write_behind:
+                # Report success only once the messages are committed
+                write_behind.wait(conversation.id)
+            
+            return {
+                "response": ai_response,
+                "html": markdown_renderer.render(ai_response),
+                "conversation_id": conversation.id,
+                "agent_type": agent_type,
+                "usage": usage,
+                "cached": cached
+            }
+        except Exception:
+            db.session.rollback()
+            raise
+
+def job_document(job):
+    """Public view of a job row"""
+    return {
+        "job_id": job['id'],
+        "status": job['status'],
+        "attempts": job['attempts'],
+        "created_at": serialize_value(job['created_at']),
+        "started_at": serialize_value(job['started_at']),
+        "finished_at": serialize_value(job['finished_at']),
+        "result": job['result'],
+        "error": job['error']
+    }
+
+@app.route('/api/jobs', methods=['POST'])
+@auth_required
+@rate_limited
+def submit_job():
+    """Queue a generation and return at once; poll GET /api/jobs/<id> for the result"""
+    try:
+        current_user_id = g.user.id
+        
+        data = request.get_json()
+        
+        message = data.get('message')
+        conversation_id = data.get('conversation_id')
+        
+        if not message:
+            return jsonify({"error": "Missing message"}), 400
+        
+        agent_type = request_agent_type(data)
+        if agent_type is None:
+            return jsonify({
+                "error": "Unknown agent_type",
+                "agent_types": model_registry.agent_types()
+            }), 400
+        
+        if not llm_configured():
+            return jsonify({"error": "LLM not configured"}), 500
+        
+        if conversation_id and not db.session.query(Conversation.id).filter_by(
+            id=conversation_id,
+            user_id=current_user_id
+        ).first():
+            return jsonify({"error": "Conversation not found"}), 404
+        
+        pending = job_store.pending(current_user_id) if JOB_MAX_PENDING else 0
+        db.session.close()
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    
+    if JOB_MAX_PENDING and pending >= JOB_MAX_PENDING:
+        raise RateLimited('pending jobs', JOB_POLL_INTERVAL * 4, reason='concurrency')
+    
+    job_id = job_store.submit(current_user_id, {
+        "message": message,
+        "conversation_id": conversation_id,
+        "agent_type": agent_type,
+        "cache": cache_allowed(data),
+        "retrieval": data.get('retrieval', True) is not False
+    })
+    ensure_job_workers()
+    
+    response = jsonify({"job_id": job_id, "status": "queued", "poll": f"/api/jobs/{job_id}"})
+    response.status_code = 202
+    response.headers['Location'] = f"/api/jobs/{job_id}"
+    return response
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@auth_required
+def get_job(job_id):
+    """Job status and result; ?wait=N long-polls up to N seconds for the job to finish"""
+    try:
+        wait = min(float(request.args.get('wait', 0)), JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    
+    current_user_id = g.user.id
+    db.session.close()
+    ensure_job_workers()
+    
+    job = job_store.get(job_id, user_id=current_user_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if wait <= 0 or job['status'] in TERMINAL_STATUSES:
+        return jsonify(job_document(job))
+    
+    # The worker is another process: one shared watcher polls the table for all waiting requests
+    if not job_watcher.wait(job_id, wait):
+        # Too many long-polls in progress; answer now and let the client poll again
+        response = jsonify(job_document(job))
+        response.headers['Retry-After'] = str(max(1, math.ceil(JOB_POLL_INTERVAL * 4)))
+        return response
+    return jsonify(job_document(job_store.get(job_id, user_id=current_user_id)))
+
+# ══════════════════════════════════════════════════════════════════════
+# BULK EXPORT & IMPORT (NDJSON)
+# ══════════════════════════════════════════════════════════════════════
+
+@app.route('/api/export', methods=['GET'])
+@auth_required
+def export_conversations():
+    """Stream all of the user's conversations and messages as NDJSON"""
+    current_user_id = g.user.id
+    db.session.close()
+    
+    if write_behind:
+        write_behind.wait(owner=current_user_id)
+    
+    filename = f"conversations-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson"
+    return Response(
+        stream_with_context(export_ndjson(
+            db.engine, db.metadata, user_id=current_user_id, yield_per=EXPORT_YIELD_PER
+        )),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/api/import', methods=['POST'])
+@auth_required
+def import_conversations():
+    """Import an NDJSON export (request body) into the user's account, all or nothing"""
+    try:
+        current_user_id = g.user.id
+        db.session.close()
+        
+        # Spool the upload first (to disk past 8 MiB), so a slow client never holds the
+        # write transaction open; then import it in one transaction a bad line rolls back
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as upload:
+            shutil.copyfileobj(request.stream, upload)
+            upload.seek(0)
+            counts = import_ndjson(
+                db.engine, db.metadata, upload,
+                user_id=current_user_id, batch_size=IMPORT_BATCH_SIZE,
+                atomic=True, render_html=markdown_renderer.render
+            )
+        return jsonify({"imported": counts})
+        
+    except (ValueError, KeyError) as e:
+        return jsonify({"error": f"Invalid NDJSON: {e}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.cli.command('export-conversations')
+@click.option('--user', 'username', help='Only this user\'s conversations (default: all users)')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-',
+              help='Output file (default: stdout)')
+def export_conversations_command(username, output):
+    """Write conversations and messages as NDJSON (users included)."""
+    user_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if not user:
+            raise click.ClickException(f"Unknown user: {username}")
+        user_id = user.id
+    for line in export_ndjson(db.engine, db.metadata, user_id=user_id,
+                              include_users=True, yield_per=EXPORT_YIELD_PER):
+        output.write(line)
+
+@app.cli.command('import-conversations')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--user', 'username', help='Assign every conversation to this user')
+@click.option('--preserve-ids', is_flag=True, help='Keep original ids (loading into an empty database)')
+@click.option('--batch-size', type=int, default=IMPORT_BATCH_SIZE, show_default=True)
+def import_conversations_command(source, username, preserve_ids, batch_size):
+    """Load an NDJSON export (use - for stdin)."""
+    user_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if not user:
+            raise click.ClickException(f"Unknown user: {username}")
+        user_id = user.id
+    counts = import_ndjson(db.engine, db.metadata, source, user_id=user_id,
+                           preserve_ids=preserve_ids, batch_size=batch_size)
+    click.echo(f"Imported {counts['user']} users, {counts['conversation']} conversations, "
+               f"{counts['message']} messages")
+
+@app.cli.command('job-worker')
+@click.option('--name', help='Worker name recorded on the jobs it claims')
+@click.option('--concurrency', type=int, default=JOB_CONCURRENCY, show_default=True,
+              help='Jobs run at once by this process')
+def job_worker_command(name, concurrency):
+    """Run background jobs from the job table until SIGTERM or Ctrl-C."""
+    name = name or f"job-worker-{os.getpid()}"
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        # Finish the jobs in hand, then exit; unfinished leases expire and are retried
+        signal.signal(signum, lambda signum, frame: stop.set())
+    click.echo(f"{name}: running up to {concurrency} jobs at once", err=True)
+    run_worker(
+        job_store, execute_job, name,
+        concurrency=concurrency,
+        poll_interval=JOB_POLL_INTERVAL,
+        retention=JOB_RETENTION,
+        stop=stop
+    )
+
+# ══════════════════════════════════════════════════════════════════════
+# WEBSOCKET SUPPORT FOR REAL-TIME STREAMING
+# ══════════════════════════════════════════════════════════════════════
+
+@socketio.on('connect')
+def handle_connect():
+    """Handle WebSocket connection"""
+    print('Client connected')
+    websocket_connections.inc()
+    emit('status', {'message': 'Connected to AI Agent'})
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    """Handle WebSocket disconnection"""
+    print('Client disconnected')
+    websocket_connections.dec()
+
+@socketio.on('chat_message')
+def handle_chat_message(data):
+    """Handle real-time chat via WebSocket"""
+    try:
+        message = data.get('message')
+        token = data.get('token')
+        
+        if not message:
+            emit('error', {'message': 'No message provided'})
+            return
+        
+        try:
+            identity = resolve_identity(token, data.get('api_key'))
+        except Exception:
+            identity = None
+        if identity is None:
+            emit('error', {'message': 'Invalid or missing token'})
+            return
+        
+        agent_type = request_agent_type(data)
+        if agent_type is None:
+            emit('error', {
+                'message': 'Unknown agent_type',
+                'agent_types': model_registry.agent_types()
+            })
+            return
+        
+        if not llm_configured():
+            emit('error', {'message': 'LLM not configured'})
+            return
+        
+        try:
+            slot = limit_request(identity, data.get('api_key'), request.remote_addr)
+        except RateLimited as e:
+            emit('error', {'message': str(e), 'retry_after': round(e.retry_after, 3)})
+            return
+        
+        # Stream chunks to the client as the model produces them
+        started = time.perf_counter()
+        first_chunk_at = None
+        result = {}
+        try:
+            for batch in stream_reply(
+                [], message, result, data.get('cache', True) is not False,
+                llm_priority(identity, interactive=True), agent_type
+            ):
+                if first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                emit('chat_chunk', {'chunk': batch})
+        except DispatchError as e:
+            emit('error', {'message': str(e), 'retry_after': round(e.retry_after, 3)})
+            return
+        finally:
+            if slot:
+                rate_limiter.release(slot)
+        
+        finished = time.perf_counter()
+        first_chunk_seconds.labels('websocket').observe((first_chunk_at or finished) - started)
+        websocket_chat_seconds.observe(finished - started)
+        emit('chat_complete', {
+            'message': 'Response complete',
+            'usage': result['usage'],
+            'cached': result['cached'],
+            'agent_type': agent_type,
+            'time_to_first_chunk_ms': round(((first_chunk_at or finished) - started) * 1000, 1),
+            'duration_ms': round((finished - started) * 1000, 1)
+        })
+        
+    except Exception as e:
+        emit('error', {'message': str(e)})
+
+# ══════════════════════════════════════════════════════════════════════
+# STATUS & INFO ENDPOINTS
+# ══════════════════════════════════════════════════════════════════════
+
+@app.route('/')
+def home():
+    """API documentation homepage"""
+    html = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Flask AI Agent API</title>
+        <style>
+            body {
+                font-family: 'Segoe UI', system-ui, sans-serif;
+                max-width: 1200px;
+                margin: 0 auto;
+                padding: 20px;
+                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+                color: white;
+            }
+            .container {
+                background: rgba(255, 255, 255, 0.1);
+                backdrop-filter: blur(10px);
+                border-radius: 20px;
+                padding: 40px;
+                box-shadow: 0 8px 32px rgba(0, 0, 0, 0.3);
+            }
+            h1 { margin-top: 0; font-size: 2.5em; }
+            .endpoint {
+                background: rgba(255, 255, 255, 0.15);
+                padding: 20px;
+                margin: 15px 0;
+                border-radius: 10px;
+            }
+            .method {
+                display: inline-block;
+                padding: 5px 15px;
+                background: #10b981;
+                border-radius: 5px;
+                font-weight: bold;
+                margin-right: 10px;
+            }
+            code {
+                background: rgba(0, 0, 0, 0.3);
+                padding: 2px 8px;
+                border-radius: 4px;
+            }
+            .feature {
+                display: inline-block;
+                background: rgba(255, 255, 255, 0.2);
+                padding: 8px 16px;
+                margin: 5px;
+                border-radius: 20px;
+            }
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h1>🤖 Flask AI Agent API</h1>
+            <p><strong>Status:</strong> 🟢 Online</p>
+            
+            <h2>✨ Features</h2>
+            <div>
+                <span class="feature">🔐 JWT Authentication</span>
+                <span class="feature">💾 Database History</span>
+                <span class="feature">⚡ WebSocket Streaming</span>
+                <span class="feature">🎨 Markdown Responses</span>
+                <span class="feature">🔑 API Keys</span>
+            </div>
+            
+            <h2>📡 Endpoints</h2>
+            
+            <div class="endpoint">
+                <span class="method">POST</span>
+                <code>/api/auth/register</code>
+                <p>Register a new user account</p>
+            </div>
+            
+            <div class="endpoint">
+                <span class="method">POST</span>
+                <code>/api/auth/login</code>
+                <p>Login and get JWT token</p>
+            </div>
+            
+            <div class="endpoint">
+                <span class="method">POST</span>
+                <code>/api/chat</code>
+                <p>Send message to AI agent (requires JWT)</p>
+            </div>
+            
+            <div class="endpoint">
+                <span class="method">POST</span>
+                <code>/api/chat/stream</code>
+                <p>Stream the AI response as Server-Sent Events</p>
+            </div>
+            
+            <div class="endpoint">
+                <span class="method">GET</span>
+                <code>/api/conversations</code>
+                <p>Get user's conversation history</p>
+            </div>
+            
+            <div class="endpoint">
+                <span class="method">GET</span>
+                <code>/api/search?q=</code>
+                <p>Full-text search across past messages</p>
+            </div>
+            
+            <div class="endpoint">
+                <span class="method">WebSocket</span>
+                <code>ws://your-domain/socket.io</code>
+                <p>Real-time chat streaming</p>
+            </div>
+            
+            <h2>🚀 Quick Start</h2>
+            <pre><code># Register
+curl -X POST https://your-api.com/api/auth/register \\
+  -H "Content-Type: application/json" \\
+  -d '{"username":"user","email":"user@example.com","password":"pass123"}'
+
+# Login
+curl -X POST https://your-api.com/api/auth/login \\
+  -H "Content-Type: application/json" \\
+  -d '{"username":"user","password":"pass123"}'
+
+# Chat
+curl -X POST https://your-api.com/api/chat \\
+  -H "Authorization: Bearer YOUR_JWT_TOKEN" \\
+  -H "Content-Type: application/json" \\
+  -d '{"message":"Hello AI!"}'</code></pre>
+            
+            <p style="margin-top: 30px; text-align: center;">
+                <a href="/streamlit" style="background: #10b981; color: white; padding: 12px 24px; border-radius: 8px; text-decoration: none; font-weight: bold;">
+                    Open Streamlit UI →
+                </a>
+            </p>
+        </div>
+    </body>
+    </html>
+    """
+    return render_template_string(html)
+
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    requests_in_flight.inc()
+    query_tracker.begin()
+
+def record_response_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+def finish_request_metrics(exc):
+    """Runs at teardown, so streamed responses are measured until their last chunk"""
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    endpoint = request.endpoint or 'unmatched'
+    status_code = 500 if exc is not None else g.get('metrics_status', 500)
+    request_seconds.labels(endpoint, request.method, str(status_code)).observe(
+        time.perf_counter() - started
+    )
+    db_queries_per_request.labels(endpoint).observe(query_tracker.end())
+    requests_in_flight.dec()
+
+if METRICS_ENABLED:
+    app.before_request(start_request_metrics)
+    app.after_request(record_response_status)
+    app.teardown_request(finish_request_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics_registry.render(), content_type=metrics_registry.content_type)
+
+@app.route('/api/status', methods=['GET'])
+def status():
+    """API status check"""
+    return jsonify({
+        "status": "online",
+        "llm_configured": llm_configured(),
+        "agent_type": AGENT_TYPE,
+        "personas": model_registry.stats(),
+        "features": ["auth", "database", "websocket", "markdown"],
+        "history_cache": history_cache.stats(),
+        "response_cache": response_cache.stats() if response_cache else None,
+        "single_flight": single_flight.stats() if single_flight else None,
+        "write_behind": write_behind.stats() if write_behind else None,
+        "memory": memory_indexer.stats() if memory_indexer else None,
+        "markdown": markdown_renderer.stats(),
+        "user_cache": user_cache.stats(),
+        "rate_limit": rate_limiter.stats() if rate_limiter else None,
+        "jobs": {
+            "workers": job_pool.stats() if job_pool else None,
+            "queue": job_store.counts(),
+            "long_polls": job_watcher.stats()
+        },
+        "llm_dispatcher": llm_dispatcher.stats() if llm_dispatcher else None,
+        "llm_client": {
+            agent_type: persona.stats() for agent_type, persona in model_registry.built().items()
+        },
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+# ══════════════════════════════════════════════════════════════════════
+# RUN APPLICATION
+# ══════════════════════════════════════════════════════════════════════
+
+if __name__ == '__main__':
+    # Turn SIGTERM (docker stop, Render deploys) into a normal exit so atexit hooks flush
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    # Pick up jobs left queued by a previous run without waiting for a request
+    ensure_job_workers()
+    if memory_indexer:
+        memory_indexer.start()
+    
+    if ASYNC_MODE == 'eventlet':
+        # One green thread per connection; thousands can wait on the LLM at once
+        socketio.run(
+            app,
+            host='0.0.0.0',
+            port=PORT,
+            max_size=MAX_CONNECTIONS,
+            # eventlet otherwise holds chunked output until 4 KiB, delaying SSE chunks
+            minimum_chunk_size=1,
+            debug=False
+        )
+    else:
+        socketio.run(
+            app,
+            host='0.0.0.0',
+            port=PORT,
+            allow_unsafe_werkzeug=True,
+            debug=False
+        )
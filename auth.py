@@ -0,0 +1,99 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║              auth.py - Cached Identity Resolution                  ║
+# ║    JWT subjects • API keys • Verified logins • TTL user cache      ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import hashlib
+import hmac
+import threading
+import time
+from collections import namedtuple
+
+from caches import LRUCache
+
+# What request handlers need to know about a user; never an ORM object, so
+# cached entries are safe to share between sessions and threads
+Identity = namedtuple('Identity', ['id', 'username', 'api_key'])
+
+
+class UserCache:
+    """TTL cache of user identities by id, username, API key and verified login.
+
+    `load(field, value)` fetches an Identity from the database (or None) on a
+    miss. Entries expire after `ttl` seconds; `invalidate(user_id)` drops every
+    entry of a user at once (call it whenever a user row changes). Misses are
+    not cached, so a new user or key works immediately.
+    """
+
+    def __init__(self, load, secret, ttl=300, max_entries=10000, clock=time.monotonic):
+        self.load = load
+        self._secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self._entries = LRUCache(max_entries=max_entries, ttl=ttl, clock=clock)
+        self._keys_by_user = {}  # user id -> cache keys pointing at that user
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def by_id(self, user_id):
+        return self._get(('id', int(user_id)), 'id', int(user_id))
+
+    def by_username(self, username):
+        return self._get(('username', username), 'username', username)
+
+    def by_api_key(self, api_key):
+        return self._get(('api_key', api_key), 'api_key', api_key)
+
+    def login(self, username, password, verify):
+        """Identity for a correct username/password, or None.
+
+        `verify(username, password)` does the real (slow) hash check; a
+        success is remembered under an HMAC of the credentials, so repeated
+        logins skip both the query and the hash until the entry expires.
+        """
+        key = ('login', hmac.new(
+            self._secret, f"{username}\0{password}".encode('utf-8'), hashlib.sha256
+        ).digest())
+        identity = self._entries.get(key)
+        if identity is not None:
+            self.hits += 1
+            return identity
+        self.misses += 1
+        identity = verify(username, password)
+        if identity is not None:
+            self._store(key, identity)
+        return identity
+
+    def invalidate(self, user_id):
+        """Forget everything cached about a user (profile, key or password changed)"""
+        with self._lock:
+            keys = self._keys_by_user.pop(user_id, ())
+        for key in keys:
+            self._entries.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._keys_by_user.clear()
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def _get(self, key, field, value):
+        identity = self._entries.get(key)
+        if identity is not None:
+            self.hits += 1
+            return identity
+        self.misses += 1
+        identity = self.load(field, value)
+        if identity is not None:
+            self._store(key, identity)
+        return identity
+
+    def _store(self, key, identity):
+        self._entries.put(key, identity)
+        with self._lock:
+            self._keys_by_user.setdefault(identity.id, set()).add(key)
@@ -0,0 +1,68 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║               batch.py - Concurrent Batch Execution                ║
+# ║   Bounded fan-out • Completion-order results • Grouped handoff     ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import queue
+import threading
+
+_WORKER_DONE = object()
+
+
+def completed(fn, items, concurrency=8, max_group=64):
+    """Run fn(item) for every item on at most `concurrency` threads.
+
+    Yields lists of (index, value, error) in completion order. Each list is
+    everything that finished since the previous one (at least one result,
+    at most `max_group`), so the caller can persist a list in one
+    transaction: results come in bulk while the workers are fast and one
+    at a time while they are slow. Closing the generator stops new items
+    from starting; calls already running finish in the background.
+    """
+    items = list(items)
+    if not items:
+        return
+    results = queue.Queue()
+    pending = iter(enumerate(items))
+    lock = threading.Lock()
+    stopped = threading.Event()
+
+    def work():
+        try:
+            while not stopped.is_set():
+                with lock:
+                    try:
+                        index, item = next(pending)
+                    except StopIteration:
+                        return
+                try:
+                    results.put((index, fn(item), None))
+                except Exception as e:
+                    results.put((index, None, e))
+        finally:
+            results.put(_WORKER_DONE)
+
+    workers = min(concurrency, len(items))
+    for n in range(workers):
+        threading.Thread(target=work, name=f'batch-worker-{n}', daemon=True).start()
+
+    live = workers
+    try:
+        while live:
+            group = []
+            entry = results.get()
+            while True:
+                if entry is _WORKER_DONE:
+                    live -= 1
+                else:
+                    group.append(entry)
+                if len(group) >= max_group or not live:
+                    break
+                try:
+                    entry = results.get_nowait()
+                except queue.Empty:
+                    break
+            if group:
+                yield group
+    finally:
+        stopped.set()
@@ -0,0 +1 @@
+"""Offline benchmarks for the Flask AI Agent (run with ``python -m benchmarks.<name>``)"""
@@ -0,0 +1,141 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║        benchmarks/concurrency.py - Serving Mode Load Test          ║
+# ║    Threading vs. eventlet against the fake model (offline)         ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def read_proc_status(pid):
+    """Thread count and resident memory (MB) of a process, Linux only"""
+    threads, rss = 0, 0.0
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    threads = int(line.split()[1])
+                elif line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return threads, rss
+
+
+def start_server(mode, port, latency, tokens_per_second, workdir,
+                 database_url=None, overrides=None, startup_timeout=30.0):
+    """Launch app.py with the fake model in the given serving mode (`overrides` wins over the defaults)"""
+    env = dict(
+        os.environ,
+        ASYNC_MODE=mode,
+        PORT=str(port),
+        LLM_BACKEND='fake',
+        RATE_LIMIT='0',  # measure the server, not the per-user quotas
+        FAKE_LLM_LATENCY=str(latency),
+        FAKE_LLM_TOKENS_PER_SECOND=str(tokens_per_second),
+        DATABASE_URL=database_url or f'sqlite:///{os.path.join(workdir, mode + ".db")}'
+    )
+    env.update(overrides or {})
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'app.py')],
+        cwd=workdir, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(int(startup_timeout * 10)):
+        try:
+            if requests.get(f'{url}/api/status', timeout=1).ok:
+                return proc, url
+        except requests.RequestException:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f'{mode} server did not start on port {port}')
+
+
+def run_load(url, endpoint, total, concurrency):
+    """Fire `total` chat requests with `concurrency` clients in flight"""
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            r = requests.post(f'{url}{endpoint}', json={'message': f'load test prompt {i}'}, timeout=300)
+            ok = r.status_code == 200
+        except requests.RequestException:
+            ok = False
+        with lock:
+            (latencies if ok else errors).append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare serving modes under concurrent LLM waits')
+    parser.add_argument('--modes', nargs='+', default=['threading', 'eventlet'])
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=2.0, help='fake model latency (s)')
+    parser.add_argument('--tokens-per-second', type=float, default=0, help='0 = whole reply at once')
+    parser.add_argument('--endpoint', default='/api/chat')
+    parser.add_argument('--port', type=int, default=7870)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra server setting (repeatable), e.g. LLM_DISPATCH=0')
+    args = parser.parse_args()
+    overrides = dict(item.split('=', 1) for item in args.env)
+
+    print(f"{'mode':<10} {'ok':>6} {'err':>5} {'rps':>8} {'p50_ms':>9} {'p95_ms':>9} "
+          f"{'threads':>8} {'rss_mb':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for offset, mode in enumerate(args.modes):
+            proc, url = start_server(mode, args.port + offset, args.latency,
+                                     args.tokens_per_second, workdir, overrides=overrides)
+            peak = [0, 0.0]
+            done = threading.Event()
+
+            def sample():
+                while not done.is_set():
+                    threads, rss = read_proc_status(proc.pid)
+                    peak[0], peak[1] = max(peak[0], threads), max(peak[1], rss)
+                    time.sleep(0.1)
+
+            sampler = threading.Thread(target=sample, daemon=True)
+            sampler.start()
+            try:
+                latencies, errors, elapsed = run_load(url, args.endpoint, args.requests, args.concurrency)
+            finally:
+                done.set()
+                sampler.join()
+                proc.terminate()
+                proc.wait()
+
+            print(f"{mode:<10} {len(latencies):>6} {len(errors):>5} "
+                  f"{len(latencies) / elapsed:>8.1f} "
+                  f"{percentile(latencies, 50) * 1000:>9.0f} {percentile(latencies, 95) * 1000:>9.0f} "
+                  f"{peak[0]:>8} {peak[1]:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║          benchmarks/dataset.py - Seeded Benchmark Databases        ║
+# ║   Baseline schema without app imports • Bulk synthetic history     ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+# Schema as the original db.create_all() produced it (no secondary indexes)
+SCHEMA = [
+    'CREATE TABLE "user" (id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, '
+    'email VARCHAR(120) NOT NULL UNIQUE, password_hash VARCHAR(255) NOT NULL, '
+    'api_key VARCHAR(64) NOT NULL UNIQUE, created_at DATETIME)',
+    'CREATE TABLE conversation (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, '
+    'title VARCHAR(200), created_at DATETIME, updated_at DATETIME)',
+    'CREATE TABLE message (id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL, '
+    'role VARCHAR(20) NOT NULL, content TEXT NOT NULL, timestamp DATETIME, tokens INTEGER)'
+]
+
+WORDS = (
+    "python flask sqlite index query latency cache stream token model prompt "
+    "history summary database commit thread async request response json user"
+).split()
+
+
+def create_schema(conn):
+    for statement in SCHEMA:
+        conn.execute(text(statement))
+
+
+def seed(engine, users=10, conversations=1000, messages=100000, content_words=60,
+         batch=20000, seed_value=42, rare_words=0):
+    """Fill a fresh database with users, conversations and interleaved messages.
+
+    With `rare_words`, every message also gets one of that many distinct terms
+    ("term0", "term1", ...), so search benchmarks have selective queries.
+    """
+    rng = random.Random(seed_value)
+    start = datetime(2025, 1, 1)
+    with engine.begin() as conn:
+        create_schema(conn)
+        conn.execute(text(
+            'INSERT INTO "user" (id, username, email, password_hash, api_key, created_at) '
+            'VALUES (:id, :name, :email, :pw, :key, :ts)'
+        ), [{
+            "id": u, "name": f"user{u}", "email": f"user{u}@example.com",
+            "pw": "x", "key": f"key{u}", "ts": start
+        } for u in range(1, users + 1)])
+        conn.execute(text(
+            "INSERT INTO conversation (id, user_id, title, created_at, updated_at) "
+            "VALUES (:id, :uid, :title, :ts, :ts)"
+        ), [{
+            "id": c, "uid": c % users + 1, "title": f"conversation {c}",
+            "ts": start + timedelta(minutes=c)
+        } for c in range(1, conversations + 1)])
+
+    insert = text(
+        "INSERT INTO message (conversation_id, role, content, timestamp, tokens) "
+        "VALUES (:cid, :role, :content, :ts, :tokens)"
+    )
+    for offset in range(0, messages, batch):
+        rows = []
+        for i in range(offset, min(offset + batch, messages)):
+            content = ' '.join(rng.choice(WORDS) for _ in range(content_words))
+            if rare_words:
+                content += f" term{rng.randrange(rare_words)}"
+            rows.append({
+                "cid": rng.randint(1, conversations),
+                "role": 'user' if i % 2 == 0 else 'assistant',
+                "content": content,
+                "ts": start + timedelta(seconds=i),
+                "tokens": content_words
+            })
+        with engine.begin() as conn:
+            conn.execute(insert, rows)
@@ -0,0 +1,86 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║         benchmarks/indexes.py - Hot Query Latency vs. Indexes      ║
+# ║     Seed N messages • Time endpoint queries • Migrate • Re-time    ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import MetaData, create_engine, text
+
+from benchmarks.dataset import seed
+from migrations import migrate
+
+# The SQL each endpoint issues on its hot path
+QUERIES = {
+    "chat history": text(
+        "SELECT role, content FROM message WHERE conversation_id = :cid ORDER BY timestamp"
+    ),
+    "message page": text(
+        "SELECT id, role, content, timestamp FROM message WHERE conversation_id = :cid "
+        "ORDER BY id DESC LIMIT 101"
+    ),
+    "conversation list": text(
+        "SELECT c.id, c.title, c.updated_at, COUNT(m.id), MAX(m.timestamp) FROM conversation c "
+        "LEFT OUTER JOIN message m ON m.conversation_id = c.id WHERE c.user_id = :uid "
+        "GROUP BY c.id ORDER BY c.updated_at DESC, c.id DESC LIMIT 51"
+    ),
+}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+def time_queries(engine, args):
+    rng = random.Random(7)
+    results = {}
+    with engine.connect() as conn:
+        for name, query in QUERIES.items():
+            samples = []
+            for _ in range(args.iterations):
+                params = {"cid": rng.randint(1, args.conversations), "uid": rng.randint(1, args.users)}
+                started = time.perf_counter()
+                conn.execute(query, params).fetchall()
+                samples.append((time.perf_counter() - started) * 1000)
+            results[name] = (percentile(samples, 50), percentile(samples, 95))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Endpoint query latency before and after the index migration')
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--conversations', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--database', help='reuse/create this SQLite file instead of a temp one')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = args.database or os.path.join(workdir, 'bench.db')
+        engine = create_engine(f'sqlite:///{path}')
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            started = time.perf_counter()
+            seed(engine, users=args.users, conversations=args.conversations, messages=args.messages)
+            print(f"seeded {args.messages} messages in {time.perf_counter() - started:.1f}s")
+
+        before = time_queries(engine, args)
+        started = time.perf_counter()
+        # The tables already exist, so only the non-baseline steps change anything
+        migrate(engine, MetaData())
+        print(f"migrated in {time.perf_counter() - started:.1f}s")
+        after = time_queries(engine, args)
+        engine.dispose()
+
+    print(f"{'query':<20} {'p50 before':>11} {'p95 before':>11} {'p50 after':>10} {'p95 after':>10}")
+    for name in QUERIES:
+        (b50, b95), (a50, a95) = before[name], after[name]
+        print(f"{name:<20} {b50:>9.2f}ms {b95:>9.2f}ms {a50:>8.2f}ms {a95:>8.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
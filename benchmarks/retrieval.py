@@ -0,0 +1,53 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║        benchmarks/retrieval.py - Vector Index Top-k Latency        ║
+# ║     N random unit vectors • Per-user and global nearest lookup     ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.indexes import percentile
+from memory import HashingEmbedder, VectorIndex, normalize_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Top-k search latency of the in-memory vector index')
+    parser.add_argument('--vectors', type=int, default=1000000)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    index = VectorIndex(args.dim)
+    started = time.perf_counter()
+    chunk = 100000
+    for offset in range(0, args.vectors, chunk):
+        count = min(chunk, args.vectors - offset)
+        ids = np.arange(offset, offset + count)
+        index.add(ids, normalize_rows(rng.standard_normal((count, args.dim))),
+                  ids // 50, rng.integers(1, args.users + 1, count))
+    print(f"built {args.vectors} x {args.dim} index in {time.perf_counter() - started:.1f}s "
+          f"({index.stats()['bytes'] / 2**20:.0f} MiB)")
+
+    embedder = HashingEmbedder(args.dim)
+    started = time.perf_counter()
+    for i in range(args.iterations):
+        embedder.embed([f"how do I tune sqlite write throughput {i}"], kind='query')
+    print(f"hash embedding: {(time.perf_counter() - started) * 1000 / args.iterations:.3f}ms per query")
+
+    queries = normalize_rows(rng.standard_normal((args.iterations, args.dim)))
+    for label, user in (("all vectors", None), ("one user", 1)):
+        samples = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, k=args.k, user_id=user)
+            samples.append((time.perf_counter() - started) * 1000)
+        print(f"{label:<12} p50 {percentile(samples, 50):8.2f}ms  p95 {percentile(samples, 95):8.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║          benchmarks/search.py - Full-Text Search Latency           ║
+# ║      Seed N messages • Build the FTS index • Index vs LIKE scan    ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import MetaData, create_engine
+
+from benchmarks.dataset import seed
+from benchmarks.indexes import percentile
+from migrations import migrate
+from search import MessageSearch
+
+QUERIES = {
+    "rare term": lambda rng, args: f"term{rng.randrange(args.rare_words)}",
+    "common + rare": lambda rng, args: f"python term{rng.randrange(args.rare_words)}",
+    "prefix": lambda rng, args: f"term{rng.randrange(10, 100)}*",
+}
+
+
+def time_searches(engine, searcher, args):
+    rng = random.Random(7)
+    results = {}
+    with engine.connect() as conn:
+        for name, make_query in QUERIES.items():
+            samples = []
+            for _ in range(args.iterations):
+                started = time.perf_counter()
+                searcher.search(conn, make_query(rng, args), rng.randint(1, args.users), limit=20)
+                samples.append((time.perf_counter() - started) * 1000)
+            results[name] = (percentile(samples, 50), percentile(samples, 95))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full-text search latency, FTS index vs LIKE scan')
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--conversations', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rare-words', type=int, default=50000)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--database', help='reuse/create this SQLite file instead of a temp one')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = args.database or os.path.join(workdir, 'bench.db')
+        engine = create_engine(f'sqlite:///{path}')
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            started = time.perf_counter()
+            seed(engine, users=args.users, conversations=args.conversations,
+                 messages=args.messages, rare_words=args.rare_words)
+            print(f"seeded {args.messages} messages in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        migrate(engine, MetaData())
+        print(f"migrated (index build) in {time.perf_counter() - started:.1f}s")
+
+        indexed = MessageSearch(engine)
+        scan = MessageSearch(engine)
+        scan._backend = 'like'
+        print(f"index backend: {indexed.backend}")
+        fts = time_searches(engine, indexed, args)
+        like = time_searches(engine, scan, args)
+        engine.dispose()
+
+    print(f"{'query':<16} {'p50 LIKE':>10} {'p95 LIKE':>10} {'p50 index':>10} {'p95 index':>10}")
+    for name in QUERIES:
+        (l50, l95), (f50, f95) = like[name], fts[name]
+        print(f"{name:<16} {l50:>8.2f}ms {l95:>8.2f}ms {f50:>8.2f}ms {f95:>8.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║       benchmarks/sqlite_profile.py - SQLite Read/Write Mix         ║
+# ║    Default rollback journal vs. the WAL performance profile        ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from persistence import apply_sqlite_profile, sqlite_pragmas
+
+SCHEMA = [
+    "CREATE TABLE conversation (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+    "title VARCHAR(200), created_at DATETIME, updated_at DATETIME)",
+    "CREATE TABLE message (id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL, "
+    "role VARCHAR(20) NOT NULL, content TEXT NOT NULL, timestamp DATETIME, tokens INTEGER)"
+]
+
+LIST_QUERY = text(
+    "SELECT c.id, c.title, c.updated_at, COUNT(m.id) FROM conversation c "
+    "LEFT JOIN message m ON m.conversation_id = c.id "
+    "WHERE c.user_id = 1 GROUP BY c.id ORDER BY c.updated_at DESC"
+)
+INSERT_MESSAGE = text(
+    "INSERT INTO message (conversation_id, role, content, timestamp, tokens) "
+    "VALUES (:cid, 'user', :content, :ts, 10)"
+)
+
+
+def make_engine(path, profiled, pool_size):
+    engine = create_engine(
+        f'sqlite:///{path}',
+        pool_size=pool_size, max_overflow=pool_size, pool_timeout=30,
+        connect_args={'check_same_thread': False}
+    )
+    if profiled:
+        apply_sqlite_profile(engine, sqlite_pragmas())
+    return engine
+
+
+def seed(engine, conversations, messages):
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text(
+            "INSERT INTO conversation (id, user_id, title, created_at, updated_at) "
+            "VALUES (:id, 1, :title, :ts, :ts)"
+        ), [{"id": i, "title": f"conversation {i}", "ts": now} for i in range(1, conversations + 1)])
+        conn.execute(INSERT_MESSAGE, [
+            {"cid": i % conversations + 1, "content": "x" * 400, "ts": now} for i in range(messages)
+        ])
+
+
+def run(profiled, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = make_engine(os.path.join(workdir, 'bench.db'), profiled, args.readers + args.writers)
+        seed(engine, args.conversations, args.messages)
+        counts = {"reads": 0, "writes": 0, "locked": 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def reader():
+            while not stop.is_set():
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(LIST_QUERY).fetchall()
+                    key = "reads"
+                except OperationalError:
+                    key = "locked"
+                with lock:
+                    counts[key] += 1
+
+        def writer():
+            while not stop.is_set():
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(INSERT_MESSAGE, {"cid": 1, "content": "y" * 400, "ts": datetime.utcnow()})
+                    key = "writes"
+                except OperationalError:
+                    key = "locked"
+                with lock:
+                    counts[key] += 1
+
+        threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+        threads += [threading.Thread(target=writer) for _ in range(args.writers)]
+        for t in threads:
+            t.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        engine.dispose()
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent read/write throughput with and without the SQLite profile')
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--conversations', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'profile':<10} {'reads/s':>10} {'writes/s':>10} {'locked':>8}")
+    for name, profiled in (('default', False), ('wal', True)):
+        counts = run(profiled, args)
+        print(f"{name:<10} {counts['reads'] / args.seconds:>10.1f} "
+              f"{counts['writes'] / args.seconds:>10.1f} {counts['locked']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║          benchmarks/streaming.py - WebSocket Streaming Latency      ║
+# ║      Word-split replay vs. incremental chunk batching (offline)    ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import argparse
+import time
+
+from llm import FakeModel, iter_batches, iter_text
+
+
+def run_word_split(model, message, delay):
+    """Old behaviour: wait for the full reply, then replay it word by word"""
+    started = time.perf_counter()
+    first = None
+    frames = 0
+    response = model.start_chat(history=[]).send_message(message)
+    for word in response.text.split():
+        if first is None:
+            first = time.perf_counter()
+        frames += 1
+        time.sleep(delay)
+    return first - started, time.perf_counter() - started, frames
+
+
+def run_streaming(model, message, max_bytes, max_interval):
+    """New behaviour: forward batched chunks as the model produces them"""
+    started = time.perf_counter()
+    first = None
+    frames = 0
+    response = model.start_chat(history=[]).send_message(message, stream=True)
+    for batch in iter_batches(iter_text(response), max_bytes, max_interval):
+        if first is None:
+            first = time.perf_counter()
+        frames += 1
+    return first - started, time.perf_counter() - started, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency', type=float, default=0.5, help='fake model first-token latency (s)')
+    parser.add_argument('--tokens-per-second', type=float, default=200.0)
+    parser.add_argument('--words', type=int, default=200, help='reply length in words')
+    parser.add_argument('--word-delay', type=float, default=0.05, help='legacy per-word sleep (s)')
+    parser.add_argument('--flush-bytes', type=int, default=64)
+    parser.add_argument('--flush-interval', type=float, default=0.05)
+    args = parser.parse_args()
+
+    model = FakeModel(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                      reply_words=args.words)
+    message = 'Explain async/await in Python'
+
+    print(f"{'mode':<12} {'ttfc_ms':>10} {'total_ms':>10} {'frames':>8}")
+    for name, result in (
+        ('word_split', run_word_split(model, message, args.word_delay)),
+        ('streaming', run_streaming(model, message, args.flush_bytes, args.flush_interval)),
+    ):
+        ttfc, total, frames = result
+        print(f"{name:<12} {ttfc * 1000:>10.1f} {total * 1000:>10.1f} {frames:>8}")
+
+
+if __name__ == '__main__':
+    main()
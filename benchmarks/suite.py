@@ -0,0 +1,438 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║          benchmarks/suite.py - End-to-End Load Benchmark           ║
+# ║   REST + Socket.IO • Seeded history • JSON results for comparison  ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from sqlalchemy import create_engine
+
+from benchmarks.concurrency import ROOT, percentile, read_proc_status, start_server
+from benchmarks.dataset import seed
+
+SCENARIOS = ('chat', 'chat_history', 'chat_stream', 'conversations', 'conversation', 'socketio')
+
+# Server settings unless overridden with --env: production defaults, minus the
+# per-user quotas (every request would hit them) and the job workers (unused here)
+SERVER_ENV = {
+    'RATE_LIMIT': '0',
+    'LLM_DISPATCH': '1',
+    'JOB_WORKERS': '0'
+}
+
+# ══════════════════════════════════════════════════════════════════════
+# WORKLOAD
+# ══════════════════════════════════════════════════════════════════════
+
+class Workload:
+    """Seeded users and conversations, and one HTTP session per client thread"""
+
+    def __init__(self, url, users, conversations, timeout):
+        self.url = url
+        self.timeout = timeout
+        # benchmarks.dataset gives conversation c to user c % users + 1, with API key "key<u>"
+        self.conversations = {u: [] for u in range(1, users + 1)}
+        for c in range(1, conversations + 1):
+            self.conversations[c % users + 1].append(c)
+        self.users = [u for u, owned in self.conversations.items() if owned]
+        self.sockets = []  # Socket.IO clients, closed after the run
+        self._local = threading.local()
+        self._prompts = iter(range(sys.maxsize))
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def pick(self, rng):
+        """(API key headers, one of that user's conversation ids)"""
+        user = rng.choice(self.users)
+        return {'X-API-Key': f'key{user}'}, rng.choice(self.conversations[user])
+
+    def prompt(self):
+        # Unique prompts, so single-flight and the response cache never share a reply
+        with self._lock:
+            return f'benchmark prompt {next(self._prompts)}: explain connection pooling'
+
+
+def chat(work, rng):
+    headers, _ = work.pick(rng)
+    r = work.session.post(f'{work.url}/api/chat', json={'message': work.prompt()},
+                          headers=headers, timeout=work.timeout)
+    r.raise_for_status()
+
+
+def chat_history(work, rng):
+    headers, conversation_id = work.pick(rng)
+    r = work.session.post(f'{work.url}/api/chat', json={
+        'message': work.prompt(), 'conversation_id': conversation_id
+    }, headers=headers, timeout=work.timeout)
+    r.raise_for_status()
+
+
+def chat_stream(work, rng):
+    """SSE chat; returns the seconds to the first chunk"""
+    headers, conversation_id = work.pick(rng)
+    started = time.perf_counter()
+    first = None
+    with work.session.post(f'{work.url}/api/chat/stream', json={
+        'message': work.prompt(), 'conversation_id': conversation_id
+    }, headers=headers, stream=True, timeout=work.timeout) as r:
+        r.raise_for_status()
+        # Read whatever has arrived (iter_lines would wait to fill its buffer)
+        pending = b''
+        for data in r.iter_content(chunk_size=None):
+            pending += data
+            *lines, pending = pending.split(b'\n')
+            for line in lines:
+                if line == b'event: chunk' and first is None:
+                    first = time.perf_counter() - started
+                elif line == b'event: error':
+                    raise RuntimeError('stream error event')
+                elif line == b'event: complete':
+                    return first
+    raise RuntimeError('stream ended without a complete event')
+
+
+def conversations(work, rng):
+    headers, _ = work.pick(rng)
+    r = work.session.get(f'{work.url}/api/conversations', headers=headers, timeout=work.timeout)
+    r.raise_for_status()
+
+
+def conversation(work, rng):
+    headers, conversation_id = work.pick(rng)
+    r = work.session.get(f'{work.url}/api/conversations/{conversation_id}',
+                         headers=headers, timeout=work.timeout)
+    r.raise_for_status()
+
+
+def socketio_transport():
+    """'websocket' when websocket-client is installed, otherwise Socket.IO falls back to long-polling"""
+    try:
+        import websocket  # noqa: F401
+    except ImportError:
+        return 'polling'
+    return 'websocket'
+
+
+class _SocketClient:
+    """One Socket.IO connection that sends a chat_message and waits for its reply"""
+
+    def __init__(self, url):
+        import socketio  # python-socketio, already a server dependency
+
+        self.transport = socketio_transport()
+        self.sio = socketio.Client(reconnection=False)
+        self.done = threading.Event()
+        self.first = None
+        self.error = None
+        self.sio.on('chat_chunk', self._chunk)
+        self.sio.on('chat_complete', lambda data: self.done.set())
+        self.sio.on('error', self._error)
+        self.sio.connect(url, transports=[self.transport], wait_timeout=30)
+
+    def _chunk(self, data):
+        if self.first is None:
+            self.first = time.perf_counter()
+
+    def _error(self, data):
+        self.error = data.get('message', 'error')
+        self.done.set()
+
+    def send(self, message, api_key, timeout):
+        self.done.clear()
+        self.first = self.error = None
+        started = time.perf_counter()
+        self.sio.emit('chat_message', {'message': message, 'api_key': api_key})
+        if not self.done.wait(timeout):
+            raise TimeoutError('no chat_complete in time')
+        if self.error:
+            raise RuntimeError(self.error)
+        return (self.first or time.perf_counter()) - started
+
+
+def socketio_chat(work, rng):
+    """chat_message over a per-thread Socket.IO connection; returns the seconds to the first chunk"""
+    client = getattr(work._local, 'socket', None)
+    if client is None:
+        client = work._local.socket = _SocketClient(work.url)
+        with work._lock:
+            work.sockets.append(client)
+    headers, _ = work.pick(rng)
+    return client.send(work.prompt(), headers['X-API-Key'], work.timeout)
+
+
+RUNNERS = {
+    'chat': chat,
+    'chat_history': chat_history,
+    'chat_stream': chat_stream,
+    'conversations': conversations,
+    'conversation': conversation,
+    'socketio': socketio_chat
+}
+
+# ══════════════════════════════════════════════════════════════════════
+# MEASUREMENT
+# ══════════════════════════════════════════════════════════════════════
+
+def scrape(url):
+    """Histogram sums and counts from /metrics ({'name_sum{labels}': value}), empty if unavailable"""
+    try:
+        r = requests.get(f'{url}/metrics', timeout=10)
+        r.raise_for_status()
+    except requests.RequestException:
+        return {}
+    samples = {}
+    for line in r.text.splitlines():
+        if line.startswith('#') or not line:
+            continue
+        key, _, value = line.rpartition(' ')
+        if key.split('{')[0].endswith(('_sum', '_count')):
+            samples[key] = float(value)
+    return samples
+
+
+def server_breakdown(before, after):
+    """Mean milliseconds per chat stage and SQL statements per request, between two scrapes"""
+    delta = {key: value - before.get(key, 0.0) for key, value in after.items()}
+    stages = {}
+    prefix = 'chat_stage_duration_seconds_sum{stage="'
+    for key, total in delta.items():
+        if key.startswith(prefix):
+            stage = key[len(prefix):-2]
+            count = delta.get(key.replace('_sum{', '_count{'), 0)
+            if count:
+                stages[stage] = round(total / count * 1000, 2)
+    queries = sum(v for k, v in delta.items() if k.startswith('db_queries_per_request_sum'))
+    served = sum(v for k, v in delta.items() if k.startswith('db_queries_per_request_count'))
+    return stages, round(queries / served, 2) if served else None
+
+
+def summarize(samples):
+    if not samples:
+        return None
+    ms = [s * 1000 for s in samples]
+    return {
+        "p50": round(percentile(ms, 50), 2),
+        "p95": round(percentile(ms, 95), 2),
+        "p99": round(percentile(ms, 99), 2),
+        "max": round(max(ms), 2),
+        "mean": round(sum(ms) / len(ms), 2)
+    }
+
+
+def run_scenario(work, name, total, concurrency, warmup, pid, seed_value):
+    """Fire `total` requests of one scenario with `concurrency` clients in flight"""
+    runner = RUNNERS[name]
+    latencies, first_chunks, errors = [], [], {}
+    lock = threading.Lock()
+    rngs = threading.local()
+
+    def one(i, record=True):
+        rng = getattr(rngs, 'rng', None)
+        if rng is None:
+            rng = rngs.rng = random.Random(f'{seed_value}-{name}-{threading.get_ident()}')
+        started = time.perf_counter()
+        try:
+            first = runner(work, rng)
+        except Exception as e:
+            if record:
+                with lock:
+                    kind = type(e).__name__
+                    errors[kind] = errors.get(kind, 0) + 1
+            return
+        elapsed = time.perf_counter() - started
+        if record:
+            with lock:
+                latencies.append(elapsed)
+                if first is not None:
+                    first_chunks.append(first)
+
+    peak = {"threads": 0, "rss_mb": 0.0}
+    start_threads, start_rss = read_proc_status(pid)
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            threads, rss = read_proc_status(pid)
+            peak["threads"], peak["rss_mb"] = max(peak["threads"], threads), max(peak["rss_mb"], rss)
+            time.sleep(0.1)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Warm-up: open connections, build the persona model, fill caches
+        list(pool.map(lambda i: one(i, record=False), range(warmup)))
+        before = scrape(work.url)
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        try:
+            list(pool.map(one, range(total)))
+        finally:
+            elapsed = time.perf_counter() - started
+            done.set()
+            sampler.join()
+    stages, queries = server_breakdown(before, scrape(work.url))
+
+    return {
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+        "ttfc_ms": summarize(first_chunks),
+        "server": {
+            "rss_mb_start": round(start_rss, 1),
+            "rss_mb_peak": round(max(peak["rss_mb"], start_rss), 1),
+            "threads_peak": max(peak["threads"], start_threads),
+            "stage_ms": stages,
+            "db_queries_per_request": queries
+        }
+    }
+
+# ══════════════════════════════════════════════════════════════════════
+# REPORTING
+# ══════════════════════════════════════════════════════════════════════
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_table(results):
+    print(f"{'scenario':<14} {'ok':>6} {'err':>5} {'rps':>8} {'p50_ms':>8} {'p95_ms':>8} "
+          f"{'p99_ms':>8} {'ttfc50':>8} {'ttfc95':>8} {'rss_mb':>7} {'q/req':>6}")
+    for name, r in results.items():
+        latency = r['latency_ms'] or {}
+        ttfc = r['ttfc_ms'] or {}
+        queries = r['server']['db_queries_per_request']
+        print(f"{name:<14} {r['ok']:>6} {sum(r['errors'].values()):>5} {r['throughput_rps']:>8.1f} "
+              f"{latency.get('p50', 0):>8.1f} {latency.get('p95', 0):>8.1f} {latency.get('p99', 0):>8.1f} "
+              f"{ttfc.get('p50', 0):>8.1f} {ttfc.get('p95', 0):>8.1f} "
+              f"{r['server']['rss_mb_peak']:>7.1f} {'-' if queries is None else queries:>6}")
+
+
+def print_comparison(baseline, results):
+    """Relative change against an earlier run (positive = more; lower is better except rps)"""
+    def change(old, new):
+        if not old or new is None:
+            return '     n/a'
+        return f"{(new - old) / old * 100:+7.1f}%"
+
+    print(f"\nvs. {baseline.get('git_commit') or 'baseline'} ({baseline.get('started_at', '?')})")
+    print(f"{'scenario':<14} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'ttfc95':>8} {'rss':>8}")
+    for name, r in results.items():
+        old = baseline.get('scenarios', {}).get(name)
+        if not old:
+            continue
+        latency, old_latency = r['latency_ms'] or {}, old['latency_ms'] or {}
+        ttfc, old_ttfc = r['ttfc_ms'] or {}, old['ttfc_ms'] or {}
+        print(f"{name:<14} {change(old['throughput_rps'], r['throughput_rps'])} "
+              f"{change(old_latency.get('p50'), latency.get('p50'))} "
+              f"{change(old_latency.get('p95'), latency.get('p95'))} "
+              f"{change(old_latency.get('p99'), latency.get('p99'))} "
+              f"{change(old_ttfc.get('p95'), ttfc.get('p95'))} "
+              f"{change(old['server']['rss_mb_peak'], r['server']['rss_mb_peak'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the REST and Socket.IO chat paths against the fake model')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=32, help='clients in flight')
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20, help='unrecorded requests per scenario')
+    parser.add_argument('--latency', type=float, default=0.2, help='fake model latency (s)')
+    parser.add_argument('--tokens-per-second', type=float, default=200, help='0 = whole reply at once')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--conversations', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', help='reuse/create this SQLite file instead of a temp one')
+    parser.add_argument('--mode', default='threading', choices=['threading', 'eventlet'])
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra server setting (repeatable), e.g. LLM_WORKERS=64')
+    parser.add_argument('--timeout', type=float, default=120.0, help='per-request timeout (s)')
+    parser.add_argument('--port', type=int, default=7880)
+    parser.add_argument('--output', '-o', help='write results as JSON here')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    args = parser.parse_args()
+
+    overrides = dict(SERVER_ENV)
+    for item in args.env:
+        key, sep, value = item.partition('=')
+        if not sep:
+            parser.error(f'--env expects KEY=VALUE, got {item}')
+        overrides[key] = value
+
+    report = {
+        "benchmark": "suite",
+        "started_at": datetime.utcnow().isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        "server_env": overrides,
+        "socketio_transport": socketio_transport()
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = args.database or os.path.join(workdir, 'bench.db')
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            started = time.perf_counter()
+            engine = create_engine(f'sqlite:///{path}')
+            seed(engine, users=args.users, conversations=args.conversations,
+                 messages=args.messages, seed_value=args.seed)
+            engine.dispose()
+            report["seed_seconds"] = round(time.perf_counter() - started, 2)
+            print(f"seeded {args.messages} messages in {report['seed_seconds']:.1f}s", file=sys.stderr)
+
+        started = time.perf_counter()
+        proc, url = start_server(args.mode, args.port, args.latency, args.tokens_per_second, workdir,
+                                 database_url=f'sqlite:///{os.path.abspath(path)}',
+                                 overrides=overrides, startup_timeout=300)
+        report["startup_seconds"] = round(time.perf_counter() - started, 2)
+        work = Workload(url, args.users, args.conversations, args.timeout)
+        results = {}
+        try:
+            for name in args.scenarios:
+                print(f"running {name} ...", file=sys.stderr)
+                results[name] = run_scenario(work, name, args.requests, args.concurrency,
+                                             args.warmup, proc.pid, args.seed)
+        finally:
+            for client in work.sockets:
+                client.sio.disconnect()
+            proc.terminate()
+            proc.wait()
+
+    report["scenarios"] = results
+    print_table(results)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(json.load(f), results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nresults written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,429 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║                caches.py - In-Process Caching Layers               ║
+# ║  Conversation history • Model responses • Request coalescing       ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# ══════════════════════════════════════════════════════════════════════
+# CONVERSATION HISTORY CACHE
+# ══════════════════════════════════════════════════════════════════════
+
+# Rough per-turn overhead of the dict/list wrappers, on top of the text itself
+TURN_OVERHEAD_BYTES = 200
+# Write counters are striped over this many slots; a collision only skips a cache fill
+VERSION_SLOTS = 4096
+
+
+def history_size(history):
+    """Approximate memory footprint of a chat history in bytes"""
+    return sum(
+        TURN_OVERHEAD_BYTES + sum(len(part) for part in turn["parts"])
+        for turn in history
+    )
+
+
+class HistoryCache:
+    """LRU + TTL cache of model chat history per conversation, bounded by bytes.
+
+    Loads race with writes: a reader can query the DB, another thread can
+    append a turn, and the reader's older list would then be cached for the
+    whole TTL. So every append or invalidate bumps the conversation's write
+    version, and a load only fills the cache if the version it read before
+    querying is still current.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=600, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # conversation_id -> [history, size, expires_at]
+        self._bytes = 0
+        self._versions = [0] * VERSION_SLOTS
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_fills = 0
+
+    def get(self, conversation_id):
+        """Return a copy of the cached history, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None or entry[2] <= self._clock():
+                if entry is not None:
+                    self._drop(conversation_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(conversation_id)
+            self.hits += 1
+            return list(entry[0])
+
+    def version(self, conversation_id):
+        """Write version to pass to put() for a history about to be loaded"""
+        return self._versions[hash(conversation_id) % VERSION_SLOTS]
+
+    def put(self, conversation_id, history, version=None):
+        """Cache a freshly loaded history (skipped if the conversation changed since `version`)"""
+        size = history_size(history)
+        with self._lock:
+            if version is not None and version != self._versions[hash(conversation_id) % VERSION_SLOTS]:
+                self.stale_fills += 1
+                return
+            if conversation_id in self._entries:
+                self._drop(conversation_id)
+            if size > self.max_bytes:
+                return
+            self._entries[conversation_id] = [list(history), size, self._clock() + self.ttl]
+            self._bytes += size
+            self._evict()
+
+    def append(self, conversation_id, turns):
+        """Extend a cached history after new messages are committed (no-op on a miss)"""
+        size = history_size(turns)
+        with self._lock:
+            self._bump(conversation_id)
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return
+            entry[0].extend(turns)
+            entry[1] += size
+            entry[2] = self._clock() + self.ttl
+            self._bytes += size
+            self._entries.move_to_end(conversation_id)
+            self._evict()
+
+    def invalidate(self, conversation_id):
+        """Forget a conversation after an out-of-band or failed write, or its deletion"""
+        with self._lock:
+            self._bump(conversation_id)
+            if conversation_id in self._entries:
+                self._drop(conversation_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_fills": self.stale_fills
+            }
+
+    def _bump(self, conversation_id):
+        self._versions[hash(conversation_id) % VERSION_SLOTS] += 1
+
+    def _drop(self, conversation_id):
+        entry = self._entries.pop(conversation_id)
+        self._bytes -= entry[1]
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            conversation_id, entry = self._entries.popitem(last=False)
+            self._bytes -= entry[1]
+            self.evictions += 1
+
+# ══════════════════════════════════════════════════════════════════════
+# RESPONSE CACHE
+# ══════════════════════════════════════════════════════════════════════
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different prompts share a cache entry"""
+    return ' '.join(str(text).split())
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a per-entry TTL and an entry-count bound"""
+
+    def __init__(self, max_entries=1024, ttl=3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache:
+    """SQLite-backed key/value tier that survives restarts.
+
+    Expired rows are purged, and the oldest rows beyond `max_entries`
+    evicted, on open and after every `purge_every` writes.
+    """
+
+    def __init__(self, path, ttl=86400, max_entries=100000, purge_every=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_response_cache_created_at ON response_cache (created_at)"
+        )
+        self._conn.commit()
+        self.purge_expired()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] + self.ttl <= time.time():
+            return None
+        return row[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time())
+            )
+            self._conn.commit()
+            self._writes += 1
+            due = self._writes % self.purge_every == 0
+        if due:
+            self.purge_expired()
+
+    def purge_expired(self):
+        """Drop expired rows, then the oldest ones over `max_entries`"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE created_at <= ?", (time.time() - self.ttl,)
+            )
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+
+class ResponseCache:
+    """Two-tier cache of model replies keyed on persona, prompt, history and message"""
+
+    def __init__(self, max_entries=1024, ttl=3600, disk_path=None, disk_max_entries=100000):
+        self.memory = LRUCache(max_entries, ttl)
+        self.disk = DiskCache(disk_path, ttl, disk_max_entries) if disk_path else None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(agent_type, system_prompt, history, message):
+        payload = json.dumps([
+            agent_type,
+            normalize_text(system_prompt),
+            [[turn["role"], [normalize_text(p) for p in turn["parts"]]] for turn in history],
+            normalize_text(message)
+        ], separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def stats(self):
+        return {
+            "entries": len(self.memory),
+            "disk": self.disk is not None,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+# ══════════════════════════════════════════════════════════════════════
+# REQUEST COALESCING (SINGLE-FLIGHT)
+# ══════════════════════════════════════════════════════════════════════
+
+class _Flight:
+    """State of one in-flight upstream call shared by its waiters"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks = []
+        self.result = {}
+        self.value = None
+        self.error = None
+        self.done = False
+        self.listeners = 1  # streams still reading; the first is the leader
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one upstream execution.
+
+    do() and stream() share a key space but never each other's flights: a
+    blocking caller can't use a stream's chunks, nor a streaming caller a value.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.listeners += 1
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            self.leaders += 1
+            return flight, True
+
+    def _finish(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        with flight.cond:
+            flight.done = True
+            flight.cond.notify_all()
+
+    def do(self, key, fn):
+        """Run fn() once for all concurrent callers of `key`; returns (value, shared)"""
+        key = ('call', key)
+        flight, leader = self._join(key)
+        if not leader:
+            with flight.cond:
+                while not flight.done:
+                    flight.cond.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+        try:
+            flight.value = fn()
+            return flight.value, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._finish(key, flight)
+
+    def stream(self, key, produce, result):
+        """Generator variant of do(): every caller replays chunks as they arrive.
+
+        `produce(shared)` must return an iterator of chunks and may fill the
+        `shared` dict; once the stream ends it is copied into `result`. The
+        upstream is drained on its own thread, so the leader's client going
+        away doesn't cut off the followers; it is abandoned only once every
+        caller has stopped reading.
+        """
+        key = ('stream', key)
+        flight, leader = self._join(key)
+        if leader:
+            threading.Thread(
+                target=self._drain, args=(key, flight, produce), daemon=True,
+                name='single-flight-stream'
+            ).start()
+
+        sent = 0
+        try:
+            while True:
+                with flight.cond:
+                    while sent >= len(flight.chunks) and not flight.done:
+                        flight.cond.wait()
+                    pending = flight.chunks[sent:]
+                    finished = flight.done
+                sent += len(pending)
+                for chunk in pending:
+                    yield chunk
+                if finished:
+                    break
+        finally:
+            with self._lock:
+                flight.listeners -= 1
+        if flight.error is not None:
+            raise flight.error
+        result.update(flight.result)
+        if not leader:
+            result['coalesced'] = True
+
+    def _drain(self, key, flight, produce):
+        """Run one shared upstream stream to the end, or until nobody is reading"""
+        upstream = None
+        try:
+            upstream = produce(flight.result)
+            for chunk in upstream:
+                with flight.cond:
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+                with self._lock:
+                    if flight.listeners == 0:
+                        # Stop sharing it first so no new caller joins a dead stream
+                        if self._flights.get(key) is flight:
+                            del self._flights[key]
+                        flight.error = RuntimeError("Shared upstream stream was abandoned")
+                        break
+        except Exception as e:
+            flight.error = e
+        finally:
+            close = getattr(upstream, 'close', None)
+            if close is not None:
+                close()
+            self._finish(key, flight)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced
+            }
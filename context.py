@@ -0,0 +1,135 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║            context.py - Token-Budgeted Context Window              ║
+# ║       Recent turns verbatim • Older turns as rolling summary       ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+# ══════════════════════════════════════════════════════════════════════
+# TOKEN ESTIMATION
+# ══════════════════════════════════════════════════════════════════════
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+
+def turn_tokens(turn):
+    return sum(estimate_tokens(part) for part in turn["parts"])
+
+# ══════════════════════════════════════════════════════════════════════
+# SUMMARIZERS
+# ══════════════════════════════════════════════════════════════════════
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an assistant.
+Keep facts, decisions, names, code identifiers and open questions; drop pleasantries.
+Reply with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New turns to fold in:
+{turns}"""
+
+
+def format_turns(turns):
+    return "\n".join(f"{turn['role']}: {' '.join(turn['parts'])}" for turn in turns)
+
+
+def truncate_summary(text, max_tokens):
+    """Clip a summary to roughly max_tokens"""
+    max_chars = max_tokens * 4
+    return text if len(text) <= max_chars else text[:max_chars].rsplit(' ', 1)[0] + " …"
+
+
+def extractive_summarizer(max_tokens=512):
+    """Fallback summarizer: keeps the most recent text of the folded turns"""
+    def summarize(summary, turns, agent_type=None):
+        text = (summary + "\n" if summary else "") + format_turns(turns)
+        return text if estimate_tokens(text) <= max_tokens else "… " + text[-max_tokens * 4:]
+    return summarize
+
+
+def llm_summarizer(get_model, max_tokens=512, dispatch=None):
+    """Summarizer that asks the model to fold new turns into the existing summary.
+
+    `get_model(agent_type)` returns the model to use (the conversation's
+    persona, or the default one for None), so it is only built once a
+    summary is needed. `dispatch(fn)` runs the model call (e.g. through the
+    LLM dispatcher); if it fails or is shed, the extractive summarizer is
+    used instead.
+    """
+    dispatch = dispatch or (lambda fn: fn())
+    fallback = extractive_summarizer(max_tokens)
+
+    def summarize(summary, turns, agent_type=None):
+        prompt = SUMMARY_PROMPT.format(
+            max_words=int(max_tokens * 0.75),
+            summary=summary or "(none yet)",
+            turns=format_turns(turns)
+        )
+        try:
+            model = get_model(agent_type)
+            text = dispatch(lambda: model.generate_content(prompt).text).strip()
+        except Exception as e:
+            print(f"Summarization error: {e}")
+            return fallback(summary, turns)
+        return truncate_summary(text, max_tokens)
+    return summarize
+
+# ══════════════════════════════════════════════════════════════════════
+# CONTEXT WINDOW
+# ══════════════════════════════════════════════════════════════════════
+
+class ContextWindow:
+    """Keeps recent turns within a token budget and folds older ones into a summary.
+
+    When the unsummarized tail outgrows `max_tokens`, turns are folded until the
+    tail is back under `max_tokens * low_water`, so the (slow) summarizer runs
+    once every few turns rather than on every request.
+    """
+
+    def __init__(self, summarizer, max_tokens=8000, low_water=0.5, min_turns=2):
+        self.summarizer = summarizer
+        self.max_tokens = max_tokens
+        self.low_water = low_water
+        self.min_turns = min_turns
+
+    def over_budget(self, history, summarized=0):
+        """Whether fit() will fold turns, i.e. call the summarizer"""
+        tail = history[min(summarized, len(history)):]
+        return bool(self.max_tokens) and sum(turn_tokens(t) for t in tail) > self.max_tokens
+
+    def fit(self, history, summary="", summarized=0, agent_type=None):
+        """Return (prompt_history, summary, summarized) for the next model call.
+
+        `summarized` is how many leading turns of `history` are already in
+        `summary`; the returned summary/summarized differ only if turns were folded.
+        `agent_type` is passed on to the summarizer.
+        """
+        summarized = min(summarized, len(history))
+        if self.over_budget(history, summarized):
+            split = self._split(history, summarized)
+            if split > summarized:
+                summary = self.summarizer(summary, history[summarized:split], agent_type)
+                summarized = split
+        return self.with_summary(history[summarized:], summary), summary, summarized
+
+    @staticmethod
+    def with_summary(turns, summary):
+        if not summary:
+            return list(turns)
+        return [
+            {"role": "user", "parts": [f"Summary of our earlier conversation:\n{summary}"]},
+            {"role": "assistant", "parts": ["Understood, I'll keep that context in mind."]}
+        ] + list(turns)
+
+    def _split(self, history, summarized):
+        """Index where the kept tail starts, aligned to a user/assistant pair"""
+        target = self.max_tokens * self.low_water
+        split, used = len(history), 0
+        while split - 2 >= summarized:
+            pair = turn_tokens(history[split - 1]) + turn_tokens(history[split - 2])
+            if len(history) - split >= self.min_turns and used + pair > target:
+                break
+            used += pair
+            split -= 2
+        return split
@@ -0,0 +1,285 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║            dispatcher.py - LLM Admission Control                   ║
+# ║   Bounded worker pool • Priority queue • Deadlines • Load shedding ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import heapq
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+
+# Lower value = served first
+PRIORITIES = {
+    'interactive': 0,  # signed-in users on the WebSocket
+    'user': 1,         # signed-in users over REST
+    'guest': 2,        # anonymous callers
+    'batch': 3         # bulk and background work
+}
+
+
+class DispatchError(Exception):
+    """A model call that was not (or not fully) served; carries the HTTP status"""
+
+    status = 503
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Overloaded(DispatchError):
+    """Shed at admission: the queue is full or the wait would outlast the deadline"""
+
+    status = 503
+
+
+class DeadlineExceeded(DispatchError):
+    """The call did not finish (or start streaming) before its deadline"""
+
+    status = 504
+
+
+_DONE = object()  # end-of-stream marker on a job's chunk queue
+
+
+class _Job:
+    """One queued model call and the caller's handle on its outcome"""
+
+    __slots__ = ('fn', 'priority', 'deadline', 'enqueued_at', 'started_at',
+                 'chunks', 'value', 'error', 'cancelled', 'done')
+
+    def __init__(self, fn, priority, deadline, enqueued_at, stream):
+        self.fn = fn
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued_at = enqueued_at
+        self.started_at = None
+        self.chunks = queue.Queue() if stream else None
+        self.value = None
+        self.error = None
+        self.cancelled = False
+        self.done = threading.Event()
+
+    def fail(self, error):
+        self.error = error
+        if self.chunks is not None:
+            self.chunks.put(_DONE)
+        self.done.set()
+
+# ══════════════════════════════════════════════════════════════════════
+# DISPATCHER
+# ══════════════════════════════════════════════════════════════════════
+
+class LLMDispatcher:
+    """Runs model calls on a fixed pool of workers fed by a bounded priority queue.
+
+    At most `workers` upstream calls run at once, however many requests
+    arrive; up to `max_queue` more wait in priority order (FIFO within a
+    class). A full queue evicts its lowest-priority, newest job for a more
+    urgent one, otherwise the newcomer is rejected at once. So is a job whose
+    estimated wait already exceeds its deadline. Request threads only block
+    on their own job, so a slow upstream can never tie up more than
+    `workers + max_queue` of them.
+    """
+
+    def __init__(self, workers=16, max_queue=64, timeout=60.0, clock=time.monotonic):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._clock = clock
+        self._heap = []  # (priority, seq, job)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = 0
+        self._service_time = None  # moving average of seconds per call
+        self._waits = deque(maxlen=1024)  # recent queue waits in seconds
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.shed = 0
+        self.expired = 0
+        self.wait_seconds_total = 0.0
+
+    def call(self, fn, priority='user', timeout=None):
+        """Run fn() on a worker and return its result"""
+        job = self._submit(fn, priority, timeout, stream=False)
+        if not job.done.wait(max(0.0, job.deadline - self._clock())):
+            job.cancelled = True
+            raise DeadlineExceeded("Model call timed out", retry_after=self._retry_after())
+        if job.error is not None:
+            raise job.error
+        return job.value
+
+    def stream(self, produce, priority='user', timeout=None):
+        """Iterate produce() on a worker, yielding its items as they arrive.
+
+        The deadline covers the wait for a worker and the first item; once a
+        stream is flowing it runs to completion. Closing this generator early
+        stops the worker at the next item.
+        """
+        job = self._submit(produce, priority, timeout, stream=True)
+        first = True
+        try:
+            while True:
+                if first:
+                    try:
+                        item = job.chunks.get(timeout=max(0.0, job.deadline - self._clock()))
+                    except queue.Empty:
+                        raise DeadlineExceeded(
+                            "Model stream did not start in time", retry_after=self._retry_after()
+                        ) from None
+                    first = False
+                else:
+                    item = job.chunks.get()
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            job.cancelled = True
+        if job.error is not None:
+            raise job.error
+
+    def stats(self):
+        with self._cond:
+            queued = {name: 0 for name in PRIORITIES}
+            names = {rank: name for name, rank in PRIORITIES.items()}
+            for rank, _, _ in self._heap:
+                queued[names[rank]] += 1
+            running = self._running
+            waits = sorted(self._waits)
+        return {
+            "workers": self.workers,
+            "running": running,
+            "queue_depth": sum(queued.values()),
+            "queue_capacity": self.max_queue,
+            "queued": queued,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "shed": self.shed,
+            "expired": self.expired,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_ms_p50": _percentile_ms(waits, 0.50),
+            "wait_ms_p95": _percentile_ms(waits, 0.95),
+            "wait_ms_max": _percentile_ms(waits, 1.0),
+            "service_ms_avg": round((self._service_time or 0.0) * 1000, 1)
+        }
+
+    def _submit(self, fn, priority, timeout, stream):
+        rank = PRIORITIES[priority]
+        now = self._clock()
+        job = _Job(fn, rank, now + (self.timeout if timeout is None else timeout), now, stream)
+        evicted = None
+        with self._cond:
+            self.submitted += 1
+            ahead = sum(1 for r, _, _ in self._heap if r <= rank)
+            if self._service_time is not None and self._running >= self.workers:
+                # Every worker is busy: a rough wait is the queue ahead drained by the pool
+                estimated = (ahead + 1) * self._service_time / self.workers
+                if estimated > job.deadline - now:
+                    self.shed += 1
+                    raise Overloaded("Model queue wait exceeds the deadline",
+                                     retry_after=estimated)
+            if len(self._heap) >= self.max_queue:
+                # Jobs whose callers gave up still hold places; drop them first
+                live = [entry for entry in self._heap if not entry[2].cancelled]
+                if len(live) < len(self._heap):
+                    self.expired += len(self._heap) - len(live)
+                    self._heap = live
+                    heapq.heapify(self._heap)
+            if len(self._heap) >= self.max_queue:
+                worst = max(self._heap)
+                if worst[0] <= rank:
+                    self.shed += 1
+                    raise Overloaded("Model queue is full", retry_after=self._retry_after())
+                self._heap.remove(worst)
+                heapq.heapify(self._heap)
+                evicted = worst[2]
+                self.shed += 1
+            heapq.heappush(self._heap, (rank, next(self._seq), job))
+            self._ensure_workers()
+            self._cond.notify()
+        if evicted is not None:
+            evicted.fail(Overloaded("Displaced by higher-priority work",
+                                    retry_after=self._retry_after()))
+        return job
+
+    def _retry_after(self):
+        """Seconds until a queue slot is likely to free up"""
+        service = self._service_time or 1.0
+        return max(1.0, service * (len(self._heap) + 1) / self.workers)
+
+    def _ensure_workers(self):
+        # Called with the lock held; the pool grows on demand up to `workers`
+        idle = len(self._threads) - self._running
+        if idle < len(self._heap) and len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._run, name=f'llm-worker-{len(self._threads)}', daemon=True
+            )
+            self._threads.append(thread)
+            thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._heap)
+                now = self._clock()
+                if job.cancelled or now >= job.deadline:
+                    self.expired += 1
+                    expired = True
+                else:
+                    expired = False
+                    self._running += 1
+                    wait = now - job.enqueued_at
+                    self._waits.append(wait)
+                    self.wait_seconds_total += wait
+            if expired:
+                job.fail(DeadlineExceeded("Model call expired in the queue"))
+                continue
+            job.started_at = now
+            ok = self._execute(job)
+            elapsed = self._clock() - job.started_at
+            with self._cond:
+                self._running -= 1
+                if ok:
+                    self.completed += 1
+                    self._service_time = elapsed if self._service_time is None else (
+                        0.8 * self._service_time + 0.2 * elapsed
+                    )
+                else:
+                    self.failed += 1
+
+    def _execute(self, job):
+        try:
+            if job.chunks is None:
+                job.value = job.fn()
+                job.done.set()
+                return True
+            items = job.fn()
+            try:
+                for item in items:
+                    if job.cancelled:
+                        break  # the caller went away; stop pulling from upstream
+                    job.chunks.put(item)
+            finally:
+                close = getattr(items, 'close', None)
+                if close is not None:
+                    close()
+            job.chunks.put(_DONE)
+            job.done.set()
+            return True
+        except Exception as e:
+            job.fail(e)
+            return False
+
+
+def _percentile_ms(ordered, fraction):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return round(ordered[index] * 1000, 1)
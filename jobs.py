@@ -0,0 +1,350 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║             jobs.py - Background Generation Jobs                   ║
+# ║   Database-backed queue • Leased claims • Worker process pool      ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import json
+import secrets
+import signal
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+TERMINAL_STATUSES = ('succeeded', 'failed')
+
+# ══════════════════════════════════════════════════════════════════════
+# JOB STORE
+# ══════════════════════════════════════════════════════════════════════
+
+class JobStore:
+    """Job rows in one table, shared by the API and any number of worker processes.
+
+    The database is the queue: no broker, and SQLite works. A worker claims
+    the oldest runnable job with one conditional UPDATE, so two workers can
+    never take the same job. A claim is a lease: if the worker dies, the
+    job becomes runnable again once `lease` seconds pass, until
+    `max_attempts` is reached. Only the claim that currently holds the
+    lease may record the outcome.
+    """
+
+    def __init__(self, engine, table, lease=180.0, max_attempts=3):
+        self.engine = engine
+        self.table = table
+        self.lease = lease
+        self.max_attempts = max_attempts
+
+    def submit(self, user_id, payload):
+        job_id = secrets.token_hex(16)
+        with self.engine.begin() as conn:
+            conn.execute(self.table.insert().values(
+                id=job_id,
+                user_id=user_id,
+                status='queued',
+                payload=json.dumps(payload),
+                attempts=0,
+                created_at=datetime.utcnow()
+            ))
+        return job_id
+
+    def get(self, job_id, user_id=None):
+        """Job as a dict (payload and result decoded), or None"""
+        query = select(self.table).where(self.table.c.id == job_id)
+        if user_id is not None:
+            query = query.where(self.table.c.user_id == user_id)
+        with self.engine.connect() as conn:
+            row = conn.execute(query).mappings().first()
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def pending(self, user_id):
+        """Jobs of a user that are queued or running"""
+        t = self.table
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(t).where(
+                t.c.user_id == user_id, t.c.status.in_(('queued', 'running'))
+            )).scalar()
+
+    def finished(self, job_ids):
+        """The ids among `job_ids` whose jobs reached a terminal status"""
+        t = self.table
+        with self.engine.connect() as conn:
+            return set(conn.execute(select(t.c.id).where(
+                t.c.id.in_(list(job_ids)), t.c.status.in_(TERMINAL_STATUSES)
+            )).scalars())
+
+    def counts(self):
+        t = self.table
+        with self.engine.connect() as conn:
+            return dict(conn.execute(select(t.c.status, func.count()).group_by(t.c.status)).all())
+
+    def claim(self, worker):
+        """Lease the oldest runnable job to `worker`; returns it (with its 'claim' token) or None"""
+        t = self.table
+        now = datetime.utcnow()
+        token = f"{worker}/{secrets.token_hex(4)}"
+        oldest = select(t.c.id).where(
+            t.c.status == 'queued',
+            (t.c.run_after.is_(None)) | (t.c.run_after <= now)
+        ).order_by(t.c.created_at, t.c.id).limit(1).scalar_subquery()
+        with self.engine.begin() as conn:
+            claimed = conn.execute(update(t).where(t.c.id == oldest, t.c.status == 'queued').values(
+                status='running',
+                worker=token,
+                started_at=now,
+                lease_until=now + timedelta(seconds=self.lease),
+                attempts=t.c.attempts + 1
+            )).rowcount
+            if not claimed:
+                return None
+            job_id = conn.execute(select(t.c.id).where(t.c.worker == token)).scalar()
+        job = self.get(job_id)
+        job['claim'] = token
+        return job
+
+    def finish(self, job, result=None, error=None):
+        """Record the outcome; False if the lease was lost (the job was requeued meanwhile)"""
+        t = self.table
+        with self.engine.begin() as conn:
+            return conn.execute(update(t).where(
+                t.c.id == job['id'], t.c.worker == job['claim'], t.c.status == 'running'
+            ).values(
+                status='failed' if error is not None else 'succeeded',
+                result=json.dumps(result) if result is not None else None,
+                error=error,
+                finished_at=datetime.utcnow()
+            )).rowcount == 1
+
+    def retry_later(self, job, delay, error):
+        """Put a job that hit a transient failure back in the queue, or fail it for good"""
+        if job['attempts'] >= self.max_attempts:
+            return self.finish(job, error=error)
+        t = self.table
+        with self.engine.begin() as conn:
+            return conn.execute(update(t).where(
+                t.c.id == job['id'], t.c.worker == job['claim'], t.c.status == 'running'
+            ).values(
+                status='queued',
+                worker=None,
+                error=error,
+                run_after=datetime.utcnow() + timedelta(seconds=delay)
+            )).rowcount == 1
+
+    def requeue_expired(self):
+        """Release jobs whose lease ran out (their worker crashed or was killed)"""
+        t = self.table
+        now = datetime.utcnow()
+        expired = (t.c.status == 'running') & (t.c.lease_until < now)
+        with self.engine.begin() as conn:
+            failed = conn.execute(update(t).where(expired, t.c.attempts >= self.max_attempts).values(
+                status='failed', error='Worker lost', finished_at=now
+            )).rowcount
+            requeued = conn.execute(update(t).where(expired).values(
+                status='queued', worker=None
+            )).rowcount
+        return requeued + failed
+
+    def purge(self, older_than):
+        """Delete finished jobs older than `older_than` seconds"""
+        t = self.table
+        cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+        with self.engine.begin() as conn:
+            return conn.execute(t.delete().where(
+                t.c.status.in_(TERMINAL_STATUSES), t.c.finished_at < cutoff
+            )).rowcount
+
+# ══════════════════════════════════════════════════════════════════════
+# LONG-POLL WAITERS
+# ══════════════════════════════════════════════════════════════════════
+
+class JobWatcher:
+    """Lets requests wait for jobs to finish without each one polling the table.
+
+    Waiters block on an event; one background thread checks every watched
+    job in a single query each `interval` seconds and wakes the waiters of
+    those that finished. At most `max_waiters` requests wait at once.
+    """
+
+    def __init__(self, store, interval=0.25, max_waiters=100):
+        self.store = store
+        self.interval = interval
+        self.max_waiters = max_waiters
+        self._watched = {}  # job_id -> [event, waiters]
+        self._waiters = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.refused = 0
+
+    def wait(self, job_id, timeout):
+        """Block until the job finishes or `timeout` passes; False (at once) if too many wait already"""
+        with self._lock:
+            if self._waiters >= self.max_waiters:
+                self.refused += 1
+                return False
+            self._waiters += 1
+            entry = self._watched.setdefault(job_id, [threading.Event(), 0])
+            entry[1] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='job-watcher', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        try:
+            entry[0].wait(timeout)
+        finally:
+            with self._lock:
+                self._waiters -= 1
+                entry[1] -= 1
+                if entry[1] == 0 and self._watched.get(job_id) is entry:
+                    del self._watched[job_id]
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {"waiting": self._waiters, "jobs": len(self._watched), "refused": self.refused}
+
+    def _run(self):
+        while True:
+            with self._lock:
+                watched = dict(self._watched)
+            if not watched:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            try:
+                for job_id in self.store.finished(watched):
+                    watched[job_id][0].set()
+            except Exception as e:
+                print(f"Job watcher query failed: {e}")
+            time.sleep(self.interval)
+
+# ══════════════════════════════════════════════════════════════════════
+# WORKER LOOP (RUNS IN EACH WORKER PROCESS)
+# ══════════════════════════════════════════════════════════════════════
+
+class RetryJob(Exception):
+    """Raised by an executor for a transient failure; the job runs again after `delay`"""
+
+    def __init__(self, message, delay=1.0):
+        super().__init__(message)
+        self.delay = delay
+
+
+def run_worker(store, execute, name, concurrency=4, poll_interval=0.5,
+               maintenance_interval=30.0, retention=7 * 24 * 3600, stop=None):
+    """Claim and execute jobs on `concurrency` threads until `stop` is set.
+
+    `execute(job)` returns the result document, or raises: RetryJob puts the
+    job back in the queue, anything else fails it. Idle threads poll every
+    `poll_interval` seconds. One thread also releases expired leases and
+    purges old finished jobs every `maintenance_interval` seconds.
+    """
+    stop = stop or threading.Event()
+
+    def loop(thread_name, maintenance):
+        next_maintenance = 0.0
+        while not stop.is_set():
+            if maintenance and time.monotonic() >= next_maintenance:
+                next_maintenance = time.monotonic() + maintenance_interval
+                try:
+                    store.requeue_expired()
+                    store.purge(retention)
+                except Exception as e:
+                    print(f"Job maintenance failed: {e}")
+            try:
+                job = store.claim(thread_name)
+            except Exception as e:
+                print(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                stop.wait(poll_interval)
+                continue
+            try:
+                store.finish(job, result=execute(job))
+            except RetryJob as e:
+                store.retry_later(job, e.delay, str(e))
+            except Exception as e:
+                store.finish(job, error=str(e))
+
+    threads = [
+        threading.Thread(target=loop, args=(f"{name}-{n}", n == 0), name=f"{name}-{n}", daemon=True)
+        for n in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+# ══════════════════════════════════════════════════════════════════════
+# WORKER PROCESS POOL (RUNS IN THE WEB PROCESS)
+# ══════════════════════════════════════════════════════════════════════
+
+class JobWorkerPool:
+    """Keeps `processes` worker subprocesses running `command` and restarts any that exit.
+
+    Workers are separate processes, so generations never occupy the web
+    server's threads (or its GIL). `stop()` sends SIGTERM, which lets
+    workers finish their current jobs, then kills whatever is left.
+    """
+
+    def __init__(self, command, processes=2, cwd=None, env=None, restart_delay=1.0):
+        self.command = list(command)
+        self.processes = processes
+        self.cwd = cwd
+        self.env = env
+        self.restart_delay = restart_delay
+        self._procs = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._monitor = None
+        self.restarts = 0
+
+    def start(self):
+        with self._lock:
+            if self._monitor is not None:
+                return
+            self._procs = [self._spawn(n) for n in range(self.processes)]
+            self._monitor = threading.Thread(target=self._watch, name='job-pool-monitor', daemon=True)
+            self._monitor.start()
+
+    def stop(self, timeout=10.0):
+        self._stopping.set()
+        with self._lock:
+            procs = list(self._procs)
+        for proc in procs:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        for proc in procs:
+            try:
+                proc.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    def stats(self):
+        with self._lock:
+            alive = sum(1 for proc in self._procs if proc.poll() is None)
+        return {
+            "processes": self.processes,
+            "alive": alive,
+            "restarts": self.restarts
+        }
+
+    def _spawn(self, index):
+        return subprocess.Popen(self.command + ['--name', f'job-worker-{index}'],
+                                cwd=self.cwd, env=self.env)
+
+    def _watch(self):
+        while not self._stopping.wait(self.restart_delay):
+            with self._lock:
+                for index, proc in enumerate(self._procs):
+                    if proc.poll() is not None and not self._stopping.is_set():
+                        print(f"Job worker {index} exited with {proc.returncode}; restarting")
+                        self._procs[index] = self._spawn(index)
+                        self.restarts += 1
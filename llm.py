@@ -0,0 +1,225 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║                 llm.py - LLM Backends & Streaming                  ║
+# ║   Fake offline model • Fault injection • Chunk batching • Usage    ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import hashlib
+import random
+import time
+
+# ══════════════════════════════════════════════════════════════════════
+# FAKE MODEL (OFFLINE DEVELOPMENT & BENCHMARKS)
+# ══════════════════════════════════════════════════════════════════════
+
+FAKE_VOCABULARY = (
+    "the model returns a deterministic answer so that benchmarks and local "
+    "development can run without network access while still exercising "
+    "streaming batching persistence and rendering code paths with `code` "
+    "**bold** lists tables and plain prose of realistic length"
+).split()
+
+
+class FakeUpstreamError(Exception):
+    """Injected upstream failure; `code` is the HTTP status, like google.api_core errors"""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeUsage:
+    """Token usage shaped like genai's usage_metadata"""
+
+    def __init__(self, prompt_tokens, completion_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = completion_tokens
+        self.total_token_count = prompt_tokens + completion_tokens
+
+
+class FakeChunk:
+    """One streamed piece of a FakeResponse"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeResponse:
+    """Mimics genai's GenerateContentResponse: iterable when streamed, .text when done"""
+
+    def __init__(self, model, text, prompt_tokens, latency=0.0, timeout=None, fail=False):
+        self._model = model
+        self._text = text
+        self._latency = latency
+        self._timeout = timeout
+        self._fail = fail
+        self._consumed = False
+        self.usage_metadata = FakeUsage(prompt_tokens, len(text.split()))
+
+    def __iter__(self):
+        words = self._text.split(' ')
+        step = max(1, self._model.chunk_words)
+        # Failures surface before the first chunk, as they do with the real client
+        if self._timeout is not None and self._latency > self._timeout:
+            time.sleep(self._timeout)
+            raise FakeUpstreamError(504, "Deadline Exceeded")
+        time.sleep(self._latency)
+        if self._fail:
+            raise FakeUpstreamError(503, "Service Unavailable")
+        for i in range(0, len(words), step):
+            piece = ' '.join(words[i:i + step])
+            if i + step < len(words):
+                piece += ' '
+            if self._model.tokens_per_second:
+                time.sleep(step / self._model.tokens_per_second)
+            yield FakeChunk(piece)
+        self._consumed = True
+
+    @property
+    def text(self):
+        if not self._consumed:
+            for _ in self:
+                pass
+        return self._text
+
+
+class FakeChatSession:
+    """Chat session returned by FakeModel.start_chat"""
+
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history)
+
+    def send_message(self, content, stream=False, request_options=None):
+        prompt_tokens = len(str(content).split()) + sum(
+            len(' '.join(str(p) for p in turn.get('parts', [])).split())
+            for turn in self.history
+        )
+        latency, fail = self.model.draw_faults()
+        response = FakeResponse(
+            self.model, self.model.reply_for(content), prompt_tokens,
+            latency=latency, timeout=(request_options or {}).get('timeout'), fail=fail
+        )
+        if not stream:
+            response.text  # block for the full generation like the real client
+        self.history.append({"role": "user", "parts": [content]})
+        self.history.append({"role": "model", "parts": [response._text]})
+        return response
+
+
+class FakeModel:
+    """Deterministic local stand-in for genai.GenerativeModel.
+
+    Faults can be injected for resilience testing: `error_rate` of the calls
+    fail with a 503 and `slow_rate` of them take `slow_latency` seconds
+    before the first token instead of `latency`. A call given a
+    request_options timeout shorter than its latency fails with a 504.
+    """
+
+    def __init__(self, system_instruction=None, latency=0.5, tokens_per_second=50.0,
+                 reply_words=120, chunk_words=4, model_name='fake', error_rate=0.0,
+                 slow_rate=0.0, slow_latency=5.0, seed=None):
+        self.system_instruction = system_instruction
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_words = reply_words
+        self.chunk_words = chunk_words
+        self.model_name = model_name
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self._rng = random.Random(seed)
+
+    def draw_faults(self):
+        """Latency and failure flag for one call"""
+        latency = self.slow_latency if self._rng.random() < self.slow_rate else self.latency
+        return latency, self._rng.random() < self.error_rate
+
+    def reply_for(self, content):
+        """Build the same reply for the same prompt every time"""
+        digest = hashlib.sha256(str(content).encode('utf-8')).digest()
+        words = [
+            FAKE_VOCABULARY[digest[i % len(digest)] * (i + 1) % len(FAKE_VOCABULARY)]
+            for i in range(self.reply_words)
+        ]
+        return ' '.join(words)
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history or [])
+
+    def generate_content(self, contents, stream=False):
+        return self.start_chat().send_message(contents, stream=stream)
+
+# ══════════════════════════════════════════════════════════════════════
+# STREAMING HELPERS
+# ══════════════════════════════════════════════════════════════════════
+
+class ChunkBatcher:
+    """Coalesces small model chunks into frames bounded by size or elapsed time"""
+
+    def __init__(self, max_bytes=64, max_interval=0.05, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.max_interval = max_interval
+        self._clock = clock
+        self._parts = []
+        self._size = 0
+        self._last_flush = clock()
+
+    def add(self, text):
+        """Buffer a chunk; returns a batch when one is due, otherwise None"""
+        self._parts.append(text)
+        self._size += len(text.encode('utf-8'))
+        if self._size >= self.max_bytes or self._clock() - self._last_flush >= self.max_interval:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Return whatever is buffered (None if empty) and reset"""
+        self._last_flush = self._clock()
+        if not self._parts:
+            return None
+        batch = ''.join(self._parts)
+        self._parts = []
+        self._size = 0
+        return batch
+
+
+def iter_text(response):
+    """Yield the text of each streamed chunk, skipping chunks with no text parts"""
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # genai raises on chunks that only carry safety/finish metadata
+            continue
+        if text:
+            yield text
+
+
+def iter_batches(chunks, max_bytes=64, max_interval=0.05):
+    """Group an iterable of text chunks into flush-sized batches"""
+    batcher = ChunkBatcher(max_bytes, max_interval)
+    for text in chunks:
+        batch = batcher.add(text)
+        if batch:
+            yield batch
+    tail = batcher.flush()
+    if tail:
+        yield tail
+
+
+def usage_stats(response, prompt, completion):
+    """Token counts from the model response, falling back to word counts"""
+    meta = getattr(response, 'usage_metadata', None)
+    if meta is not None and getattr(meta, 'total_token_count', 0):
+        return {
+            "prompt_tokens": meta.prompt_token_count,
+            "completion_tokens": meta.candidates_token_count,
+            "total_tokens": meta.total_token_count
+        }
+    prompt_tokens = len(prompt.split())
+    completion_tokens = len(completion.split())
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
@@ -0,0 +1,307 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║             memory.py - Semantic Retrieval Memory                  ║
+# ║   Pluggable embedders • NumPy vector index • Background indexer    ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import hashlib
+import re
+import threading
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+# ══════════════════════════════════════════════════════════════════════
+# EMBEDDERS
+# ══════════════════════════════════════════════════════════════════════
+# An embedder has a `name` (stored next to each vector, so switching models
+# re-embeds instead of mixing spaces), a `dim`, and
+# `embed(texts, kind='document'|'query')` returning an L2-normalised
+# float32 array of shape (len(texts), dim).
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class HashingEmbedder:
+    """Deterministic local embedder: signed feature hashing of the words in a text.
+
+    No model and no network, so tests and benchmarks get stable vectors.
+    Texts that share vocabulary land close together, which is enough for
+    keyword-ish recall.
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f"hash-{dim}"
+
+    def _features(self, text):
+        # Words of three or more characters; shorter ones are mostly stop words
+        return [w for w in re.findall(r'\w+', text.lower()) if len(w) > 2]
+
+    def embed(self, texts, kind='document'):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text_ in enumerate(texts):
+            for feature in self._features(text_):
+                digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], 'little') % self.dim
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        return normalize_rows(vectors)
+
+
+class GeminiEmbedder:
+    """Embeddings from the Gemini embedding API (one request per batch)"""
+
+    def __init__(self, genai, model='models/text-embedding-004', dim=768):
+        self.genai = genai
+        self.model = model
+        self.dim = dim
+        self.name = model
+
+    def embed(self, texts, kind='document'):
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        result = self.genai.embed_content(
+            model=self.model,
+            content=list(texts),
+            task_type='retrieval_query' if kind == 'query' else 'retrieval_document'
+        )
+        return normalize_rows(result['embedding'])
+
+# ══════════════════════════════════════════════════════════════════════
+# VECTOR INDEX
+# ══════════════════════════════════════════════════════════════════════
+
+class VectorIndex:
+    """Append-only float32 matrix of unit vectors with exact, vectorised top-k search.
+
+    Rows carry the message, conversation and owning user ids so a query can be
+    restricted to one user's memory. Capacity doubles as rows are added, so
+    appends are amortised O(1); searches work on a snapshot and never block them.
+    """
+
+    def __init__(self, dim, capacity=1024):
+        self.dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._conversations = np.zeros(capacity, dtype=np.int64)
+        self._users = np.zeros(capacity, dtype=np.int64)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def add(self, ids, vectors, conversation_ids, user_ids):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        count = len(vectors)
+        with self._lock:
+            needed = self._size + count
+            if needed > len(self._ids):
+                self._grow(max(needed, 2 * len(self._ids)))
+            end = self._size + count
+            self._vectors[self._size:end] = vectors
+            self._ids[self._size:end] = ids
+            self._conversations[self._size:end] = conversation_ids
+            self._users[self._size:end] = user_ids
+            self._size = end
+
+    def search(self, query, k=5, user_id=None):
+        """Return [(message_id, conversation_id, score)] of the k most similar rows"""
+        with self._lock:
+            size = self._size
+            vectors, ids = self._vectors, self._ids
+            conversations, users = self._conversations, self._users
+        if size == 0 or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+
+        if user_id is None:
+            rows = None
+            scores = vectors[:size] @ query
+        else:
+            rows = np.flatnonzero(users[:size] == user_id)
+            if len(rows) == 0:
+                return []
+            if len(rows) * 4 < size:
+                # Selective filter: gather just those rows
+                scores = vectors[rows] @ query
+            else:
+                # Most rows qualify: one pass over the matrix is cheaper than a gather
+                scores = (vectors[:size] @ query)[rows]
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        positions = top if rows is None else rows[top]
+        return [
+            (int(ids[p]), int(conversations[p]), float(scores[t]))
+            for p, t in zip(positions, top)
+        ]
+
+    def stats(self):
+        return {
+            "vectors": self._size,
+            "dim": self.dim,
+            "bytes": int(self._vectors.nbytes)
+        }
+
+    def _grow(self, capacity):
+        def resized(array):
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            return grown
+        # New buffers are swapped in whole, so a concurrent search keeps a consistent snapshot
+        self._vectors = resized(self._vectors)
+        self._ids = resized(self._ids)
+        self._conversations = resized(self._conversations)
+        self._users = resized(self._users)
+
+# ══════════════════════════════════════════════════════════════════════
+# INDEXER
+# ══════════════════════════════════════════════════════════════════════
+
+class MemoryIndexer:
+    """Embeds each committed message once and keeps the vector index current.
+
+    Vectors are stored in the message_embedding table (see migrations.py), so
+    a restart reloads them instead of re-embedding. A background thread picks
+    up new messages in id order, whether they came from chat, write-behind or
+    an import, and embeds them in batches. The index is filled from that table
+    rather than from this process's own batches, so with several processes
+    each one sees the vectors any of them stored.
+    """
+
+    def __init__(self, engine, embedder, index, batch=256, interval=1.0, max_chars=2000):
+        self.engine = engine
+        self.embedder = embedder
+        self.index = index
+        self.batch = batch
+        self.interval = interval
+        self.max_chars = max_chars
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._embedded_id = 0  # every message up to this id has a stored vector
+        self._loaded_id = 0  # every stored vector up to this message id is in the index
+        self.loaded = False
+        self.embedded = 0
+        self.errors = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='memory-indexer', daemon=True)
+                self._thread.start()
+
+    def notify(self):
+        """New messages were committed; index them without waiting for the next poll"""
+        self._wake.set()
+
+    def stats(self):
+        return dict(self.index.stats(), loaded=self.loaded, embedded=self.embedded, errors=self.errors)
+
+    def load(self):
+        """Add vectors stored since the last load, by any process, to the index; returns how many.
+
+        Stops short of the oldest message still waiting for a vector, so one
+        that another process stores late is not skipped over.
+        """
+        params = {"model": self.embedder.name}
+        with self._load_lock, self.engine.connect() as conn:
+            params["last_id"] = self._loaded_id
+            params["frontier"] = conn.execute(text(
+                "SELECT MIN(m.id) FROM message m "
+                "LEFT JOIN message_embedding e ON e.message_id = m.id AND e.model = :model "
+                "WHERE m.id > :last_id AND e.message_id IS NULL"
+            ), params).scalar()
+            query = text(
+                "SELECT e.message_id, m.conversation_id, c.user_id, e.vector "
+                "FROM message_embedding e "
+                "JOIN message m ON m.id = e.message_id "
+                "JOIN conversation c ON c.id = m.conversation_id "
+                "WHERE e.model = :model AND e.message_id > :last_id "
+                + ("AND e.message_id < :frontier " if params["frontier"] is not None else "")
+                + "ORDER BY e.message_id"
+            )
+            added = 0
+            result = conn.execution_options(stream_results=True, yield_per=10000).execute(query, params)
+            for rows in result.partitions():
+                self.index.add(
+                    [r[0] for r in rows],
+                    np.frombuffer(b''.join(bytes(r[3]) for r in rows), dtype=np.float32),
+                    [r[1] for r in rows],
+                    [r[2] for r in rows]
+                )
+                self._loaded_id = rows[-1][0]
+                added += len(rows)
+        self.loaded = True
+        return added
+
+    def index_pending(self):
+        """Embed and store the next batch of messages without a vector; returns how many"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT m.id, m.content "
+                "FROM message m "
+                "LEFT JOIN message_embedding e ON e.message_id = m.id AND e.model = :model "
+                "WHERE m.id > :last_id AND e.message_id IS NULL "
+                "ORDER BY m.id LIMIT :batch"
+            ), {"model": self.embedder.name, "last_id": self._embedded_id, "batch": self.batch}).all()
+            if not rows:
+                return 0
+            vectors = self.embedder.embed([r[1][:self.max_chars] for r in rows])
+            try:
+                conn.execute(text(
+                    "INSERT INTO message_embedding (message_id, model, vector) VALUES (:id, :model, :vector)"
+                ), [{
+                    "id": r[0], "model": self.embedder.name, "vector": vector.tobytes()
+                } for r, vector in zip(rows, vectors)])
+                conn.commit()
+            except IntegrityError:
+                # Another process stored some of these first; the next pass skips them
+                conn.rollback()
+                return len(rows)
+        self._embedded_id = rows[-1][0]
+        self.embedded += len(rows)
+        return len(rows)
+
+    def _run(self):
+        try:
+            self.load()
+        except Exception as e:
+            self.errors += 1
+            print(f"Memory index load failed: {e}")
+        while True:
+            try:
+                embedded = self.index_pending()
+                self.load()
+                if embedded == self.batch:
+                    continue  # catching up: go straight to the next batch
+            except Exception as e:
+                self.errors += 1
+                print(f"Memory indexing failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+# ══════════════════════════════════════════════════════════════════════
+# PROMPT INJECTION
+# ══════════════════════════════════════════════════════════════════════
+
+def with_memories(turns, memories, max_chars=600):
+    """Prefix chat history with retrieved excerpts as a user/assistant preamble pair"""
+    if not memories:
+        return list(turns)
+    excerpts = "\n".join(
+        f"- ({m['role']}) {m['content'][:max_chars]}" for m in memories
+    )
+    return [
+        {"role": "user", "parts": [f"Relevant excerpts from our earlier conversations:\n{excerpts}"]},
+        {"role": "assistant", "parts": ["Noted, I'll use them where they help."]}
+    ] + list(turns)
@@ -0,0 +1,298 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║              metrics.py - Prometheus-Style Metrics                 ║
+# ║   Counters • Gauges • Histograms • Per-request DB query counts     ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from sqlalchemy import event
+
+# Seconds; from fast cache hits and single queries up to slow model calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+# ══════════════════════════════════════════════════════════════════════
+# METRIC TYPES
+# ══════════════════════════════════════════════════════════════════════
+
+class _Metric:
+    """A metric family: one child per combination of label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=(), function=None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.function = function  # read at scrape time instead of stored values
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.label_names and function is None:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """The child for these label values (created on first use; keep it to skip the lookup)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}")
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """(suffix, labels, value) for every child"""
+        if self.function is not None:
+            yield '', {}, self.function()
+            return
+        for values, child in list(self._children.items()):
+            yield from child.samples(dict(zip(self.label_names, values)))
+
+
+class _Value:
+    __slots__ = ('_value', '_lock')
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value):
+        self._value = value
+
+    @property
+    def value(self):
+        return self._value
+
+    def samples(self, labels):
+        yield '', labels, self._value
+
+
+class Counter(_Metric):
+    """Monotonic total (name it *_total)"""
+
+    kind = 'counter'
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, or is computed when scraped (`function`)"""
+
+    kind = 'gauge'
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_started')
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._started)
+        return False
+
+
+class _Buckets:
+    __slots__ = ('_bounds', '_counts', '_sum', '_lock')
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)  # the last one is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self._bounds, value)  # first bucket with value <= le
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self):
+        """Context manager observing the seconds spent inside it"""
+        return _Timer(self)
+
+    def samples(self, labels):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = 0
+        for bound, count in zip(self._bounds + (math.inf,), counts):
+            cumulative += count
+            yield '_bucket', dict(labels, le=_format_value(bound)), cumulative
+        yield '_sum', labels, total
+        yield '_count', labels, cumulative
+
+
+class Histogram(_Metric):
+    """Observations counted into fixed buckets, plus their sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+def timed(histogram):
+    """Decorator observing each call's duration in a histogram (or one labelled child of it)"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with histogram.time():
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# ══════════════════════════════════════════════════════════════════════
+# REGISTRY & EXPOSITION
+# ══════════════════════════════════════════════════════════════════════
+
+class MetricsRegistry:
+    """Named metrics rendered together in the Prometheus text format (version 0.0.4)"""
+
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self._metrics = {}
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=(), function=None):
+        return self._add(Counter(self.prefix + name, help, labels, function))
+
+    def gauge(self, name, help, labels=(), function=None):
+        return self._add(Gauge(self.prefix + name, help, labels, function))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # A failing collector must not break the whole scrape
+                lines.append(f"# {metric.name} unavailable: {_escape_help(str(e))}")
+                continue
+            for suffix, labels, value in samples:
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        lines.append('')
+        return '\n'.join(lines)
+
+
+def _escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# ══════════════════════════════════════════════════════════════════════
+# DATABASE QUERY TRACKING
+# ══════════════════════════════════════════════════════════════════════
+
+class QueryTracker:
+    """Counts and times every statement an engine runs, and counts them per request.
+
+    `begin()` starts a scope on the current thread (a green thread under
+    eventlet); `end()` closes it and returns how many statements ran in it.
+    Statements from background threads count towards the totals only.
+    """
+
+    def __init__(self, queries, query_seconds):
+        self.queries = queries
+        self.query_seconds = query_seconds
+        self._local = threading.local()
+
+    def attach(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def begin(self):
+        self._local.count = 0
+
+    def end(self):
+        count = getattr(self._local, 'count', 0)
+        self._local.count = None
+        return count
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_started', None)
+        if started is not None:
+            self.query_seconds.observe(time.perf_counter() - started)
+        self.queries.inc()
+        if getattr(self._local, 'count', None) is not None:
+            self._local.count += 1
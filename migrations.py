@@ -0,0 +1,143 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║              migrations.py - Versioned Schema Upgrades             ║
+# ║      Ordered steps • schema_migrations table • In-place upgrade    ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, LargeBinary, MetaData, String, Table, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+# ══════════════════════════════════════════════════════════════════════
+# MIGRATION STEPS
+# ══════════════════════════════════════════════════════════════════════
+# Every step must be idempotent: databases created by the old
+# db.create_all() already have some of the objects a step creates.
+
+def baseline(conn, metadata):
+    """Tables as the models define them (no-op for existing tables)"""
+    metadata.create_all(conn, checkfirst=True)
+
+
+HOT_INDEXES = [
+    # History load: WHERE conversation_id = ? ORDER BY timestamp
+    ("ix_message_conversation_timestamp", "message", '"conversation_id", "timestamp"'),
+    # Message pages: WHERE conversation_id = ? AND id < ? ORDER BY id DESC
+    ("ix_message_conversation_id_id", "message", '"conversation_id", "id"'),
+    # Conversation list: WHERE user_id = ? ORDER BY updated_at DESC
+    ("ix_conversation_user_updated", "conversation", '"user_id", "updated_at"'),
+]
+
+
+def add_hot_indexes(conn, metadata):
+    """Composite indexes for the chat and conversation-listing query patterns"""
+    for name, table, columns in HOT_INDEXES:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({columns})'))
+
+
+def add_fulltext_index(conn, metadata):
+    """Full-text index over message content: FTS5 on SQLite, tsvector + GIN on Postgres.
+
+    The SQLite index is an external-content FTS5 table kept in sync by
+    triggers; Postgres uses a stored generated column. Other databases (or a
+    SQLite build without FTS5) get nothing and search falls back to LIKE.
+    """
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        if not conn.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar():
+            return
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5("
+            "content, content='message', content_rowid='id', tokenize='porter unicode61')"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS message_fts_insert AFTER INSERT ON message BEGIN "
+            "INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS message_fts_delete AFTER DELETE ON message BEGIN "
+            "INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS message_fts_update AFTER UPDATE OF content ON message BEGIN "
+            "INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+            "INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content); END"
+        ))
+        # Index the messages that already exist
+        conn.execute(text("INSERT INTO message_fts(message_fts) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        conn.execute(text(
+            "ALTER TABLE message ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_message_search_vector ON message USING GIN (search_vector)"
+        ))
+
+
+def add_message_embeddings(conn, metadata):
+    """Stored embedding vectors for retrieval memory, one row per message and embedding model"""
+    Table(
+        "message_embedding", MetaData(),
+        Column("message_id", Integer, primary_key=True),
+        Column("model", String(100), primary_key=True),
+        Column("vector", LargeBinary, nullable=False),  # float32, little-endian
+    ).create(conn, checkfirst=True)
+
+
+def add_message_html(conn, metadata):
+    """Nullable column for the rendered HTML of a reply"""
+    if 'html' not in {column['name'] for column in inspect(conn).get_columns('message')}:
+        conn.execute(text('ALTER TABLE message ADD COLUMN html TEXT'))
+
+
+def add_jobs(conn, metadata):
+    """Background generation jobs (the table doubles as the work queue)"""
+    metadata.tables['job'].create(conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    (1, "baseline schema", baseline),
+    (2, "composite indexes for hot queries", add_hot_indexes),
+    (3, "full-text search index on messages", add_fulltext_index),
+    (4, "message embeddings for retrieval memory", add_message_embeddings),
+    (5, "rendered html column on messages", add_message_html),
+    (6, "background job queue", add_jobs),
+]
+
+# ══════════════════════════════════════════════════════════════════════
+# RUNNER
+# ══════════════════════════════════════════════════════════════════════
+
+def current_version(conn):
+    if not inspect(conn).has_table("schema_migrations"):
+        return 0
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+
+def migrate(engine, metadata, target=None):
+    """Apply pending migrations in order, each in its own transaction; returns those applied"""
+    applied = []
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+        ))
+    for version, name, step in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        try:
+            with engine.begin() as conn:
+                # Re-check inside the transaction: another worker may have just applied it
+                if current_version(conn) >= version:
+                    continue
+                step(conn, metadata)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {"v": version, "n": name, "t": datetime.utcnow()}
+                )
+        except IntegrityError:
+            # Lost the race to another worker recording the same version
+            continue
+        applied.append((version, name))
+    return applied
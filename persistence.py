@@ -0,0 +1,209 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║             persistence.py - Database Write Pipeline               ║
+# ║   Write-behind queue • Grouped commits • SQLite tuning profile     ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import queue
+import threading
+import time
+
+from sqlalchemy import event
+
+# ══════════════════════════════════════════════════════════════════════
+# WRITE-BEHIND QUEUE
+# ══════════════════════════════════════════════════════════════════════
+
+class WriteBehindQueue:
+    """Buffers rows in a bounded queue and commits them in batches on a background thread.
+
+    `write_batch(rows)` is called with up to `max_batch` rows at a time, once
+    that many are queued or `interval` seconds after the first one arrived.
+    Rows are tagged with a key (the conversation id) and optionally an owner
+    (the user id) so readers can wait for their own pending writes before
+    querying. A batch still failing after `retries` attempts is dropped and
+    its keys are passed to `on_drop(keys)`.
+    """
+
+    def __init__(self, write_batch, max_batch=200, interval=0.05, max_queue=10000, retries=3,
+                 on_drop=None):
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.interval = interval
+        self.retries = retries
+        self.on_drop = on_drop
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = {}  # key -> rows queued but not yet committed
+        self._owners = {}  # owner -> rows queued but not yet committed
+        self._cond = threading.Condition()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = False
+        self.batches = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+
+    def put(self, key, rows, owner=None):
+        """Queue rows for `key`; blocks if the queue is full (backpressure)"""
+        if self._stopping:
+            self.write_batch(rows)
+            return
+        self._ensure_started()
+        with self._cond:
+            self._pending[key] = self._pending.get(key, 0) + len(rows)
+            if owner is not None:
+                self._owners[owner] = self._owners.get(owner, 0) + len(rows)
+        for row in rows:
+            self._queue.put((key, owner, row))
+
+    def _waiting_on(self, key, owner):
+        if key is not None:
+            return self._pending.get(key)
+        if owner is not None:
+            return self._owners.get(owner)
+        return self._pending
+
+    def wait(self, key=None, timeout=5.0, owner=None):
+        """Block until rows queued for `key`, for `owner`, or (with neither) all rows are committed"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._waiting_on(key, owner):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=10.0):
+        """Flush everything still queued and stop the writer (shutdown hook)"""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            pending = sum(self._pending.values())
+        return {
+            "queued": pending,
+            "batches": self.batches,
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._drain()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.interval
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stop:
+                self._drain()
+                return
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.max_batch:
+                self._commit(batch)
+                batch = []
+        if batch:
+            self._commit(batch)
+
+    def _commit(self, batch):
+        rows = [row for _, _, row in batch]
+        for attempt in range(self.retries):
+            try:
+                self.write_batch(rows)
+                self.batches += 1
+                self.rows_written += len(rows)
+                break
+            except Exception as e:
+                print(f"Write-behind commit failed (attempt {attempt + 1}): {e}")
+                time.sleep(0.1 * (attempt + 1))
+        else:
+            self.rows_dropped += len(rows)
+            if self.on_drop is not None:
+                # Before readers are released, so none of them trusts state built on the lost rows
+                self.on_drop({key for key, _, _ in batch})
+        with self._cond:
+            for key, owner, _ in batch:
+                _release(self._pending, key)
+                if owner is not None:
+                    _release(self._owners, owner)
+            self._cond.notify_all()
+
+
+def _release(counts, name):
+    left = counts.get(name, 0) - 1
+    if left > 0:
+        counts[name] = left
+    else:
+        counts.pop(name, None)
+
+# ══════════════════════════════════════════════════════════════════════
+# SQLITE PERFORMANCE PROFILE
+# ══════════════════════════════════════════════════════════════════════
+
+def sqlite_pragmas(journal_mode='WAL', synchronous='NORMAL', mmap_size=256 * 1024 * 1024,
+                   cache_size=-64 * 1024, busy_timeout=5000, temp_store='MEMORY'):
+    """PRAGMA settings for concurrent readers and writers on one SQLite file.
+
+    WAL lets readers proceed while a writer commits; synchronous=NORMAL is
+    durable across application crashes in WAL mode (only an OS crash can lose
+    the last commits); a negative cache_size is in KiB; busy_timeout (ms)
+    makes writers queue instead of failing with "database is locked".
+    """
+    return [
+        ('journal_mode', journal_mode),
+        ('synchronous', synchronous),
+        ('mmap_size', mmap_size),
+        ('cache_size', cache_size),
+        ('busy_timeout', busy_timeout),
+        ('temp_store', temp_store)
+    ]
+
+
+def apply_sqlite_profile(engine, pragmas):
+    """Run the pragmas on every new connection of a SQLite engine (no-op for other DBs)"""
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return True
@@ -0,0 +1,137 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║             personas.py - Agent Personas & Model Registry          ║
+# ║    Hot-reloaded prompts • Lazily built models, one per persona     ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+# ══════════════════════════════════════════════════════════════════════
+# PROMPTS
+# ══════════════════════════════════════════════════════════════════════
+
+class PromptStore:
+    """System prompts by agent type: built-in defaults, overlaid by an optional JSON file.
+
+    The file maps agent type to prompt (`{"tutor": "You are ..."}`); its
+    entries replace or add to the defaults. It is re-read when its mtime
+    changes, checked at most every `check_interval` seconds, so edits take
+    effect without a restart. A file that fails to parse is reported and the
+    previous prompts stay in use.
+    """
+
+    def __init__(self, defaults, path=None, check_interval=2.0, clock=time.monotonic):
+        self.defaults = dict(defaults)
+        self.path = path
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._prompts = dict(self.defaults)
+        self._mtime = None
+        self._checked_at = None
+        self.reloads = 0
+        self.errors = 0
+
+    def all(self):
+        """Current prompts ({agent_type: prompt})"""
+        if self.path:
+            self._refresh()
+        return self._prompts
+
+    def get(self, agent_type):
+        return self.all().get(agent_type)
+
+    def _refresh(self):
+        now = self._clock()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            if mtime is None:
+                # File removed: back to the built-in prompts
+                self._prompts = dict(self.defaults)
+                self.reloads += 1
+                return
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    overrides = json.load(f)
+                if not isinstance(overrides, dict) or not all(
+                    isinstance(k, str) and isinstance(v, str) for k, v in overrides.items()
+                ):
+                    raise ValueError("expected an object of agent_type -> prompt strings")
+            except (OSError, ValueError) as e:
+                self.errors += 1
+                print(f"Prompt file {self.path} not loaded: {e}")
+                return
+            self._prompts = dict(self.defaults, **overrides)
+            self.reloads += 1
+
+# ══════════════════════════════════════════════════════════════════════
+# MODEL REGISTRY
+# ══════════════════════════════════════════════════════════════════════
+
+class ModelRegistry:
+    """One configured model per persona, built on first use.
+
+    `build(agent_type, system_prompt)` creates the model. Entries are keyed by
+    the prompt's hash as well, so a reloaded prompt gets a fresh model on its
+    next request while the old one finishes its in-flight calls. Models hold
+    no per-conversation state (each call starts its own chat session), so
+    one instance per persona serves every concurrent request.
+    """
+
+    def __init__(self, build, prompts):
+        self.build = build
+        self.prompts = prompts
+        self._models = {}  # agent_type -> (prompt digest, model)
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def agent_types(self):
+        return sorted(self.prompts.all())
+
+    def prompt(self, agent_type):
+        return self.prompts.get(agent_type)
+
+    def get(self, agent_type):
+        """Model for a persona (KeyError if the persona doesn't exist)"""
+        prompt = self.prompts.get(agent_type)
+        if prompt is None:
+            raise KeyError(agent_type)
+        digest = hashlib.sha256(prompt.encode('utf-8')).digest()
+        entry = self._models.get(agent_type)
+        if entry is not None and entry[0] == digest:
+            return entry[1]
+        with self._lock:
+            entry = self._models.get(agent_type)
+            if entry is not None and entry[0] == digest:
+                return entry[1]
+            model = self.build(agent_type, prompt)
+            self._models[agent_type] = (digest, model)
+            self.builds += 1
+            return model
+
+    def built(self):
+        """{agent_type: model} of the personas built so far"""
+        return {agent_type: model for agent_type, (_, model) in self._models.items()}
+
+    def stats(self):
+        return {
+            "agent_types": self.agent_types(),
+            "built": sorted(self._models),
+            "builds": self.builds,
+            "prompt_reloads": self.prompts.reloads,
+            "prompt_errors": self.prompts.errors
+        }
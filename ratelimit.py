@@ -0,0 +1,260 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║             ratelimit.py - Rate Limits & Concurrency Quotas        ║
+# ║   Token buckets per user/key/IP • In-flight caps • Redis backend   ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import hashlib
+import math
+import threading
+import time
+from collections import namedtuple
+
+# rate = tokens added per second, burst = bucket size (requests allowed at once)
+Rule = namedtuple('Rule', ['rate', 'burst'])
+
+
+def per_minute(requests, burst):
+    return Rule(requests / 60.0, float(burst))
+
+
+class RateLimited(Exception):
+    """Raised when a bucket is empty or a concurrency quota is used up"""
+
+    def __init__(self, scope, retry_after, reason='rate'):
+        super().__init__(f"Rate limit exceeded for {scope}")
+        self.scope = scope
+        self.retry_after = retry_after
+        self.reason = reason
+
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class CostTooLarge(RateLimited):
+    """Raised when a request costs more tokens than a bucket can ever hold; waiting won't help"""
+
+    def __init__(self, scope, cost, burst):
+        Exception.__init__(
+            self, f"Request costs {cost:g} tokens but the {scope} limit allows {burst:g} at once"
+        )
+        self.scope = scope
+        self.retry_after = 0.0
+        self.reason = 'size'
+        self.cost = cost
+        self.burst = burst
+
+# ══════════════════════════════════════════════════════════════════════
+# BACKENDS
+# ══════════════════════════════════════════════════════════════════════
+# A backend implements:
+#   take(buckets, cost) -> (denied, retry_after_seconds)
+#       buckets is a list of (key, rate, burst); all of them are charged, or
+#       none are and `denied` is the index of the one that would wait longest
+#   acquire(key, limit) -> bool     /     release(key)
+
+class MemoryBackend:
+    """Buckets and in-flight counters in this process (one worker, or per-worker limits)"""
+
+    def __init__(self, clock=time.monotonic, prune_every=10000):
+        self._clock = clock
+        self._buckets = {}  # key -> [tokens, updated_at, full_after]
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._prune_every = prune_every
+        self._ops = 0
+
+    def take(self, buckets, cost=1.0):
+        now = self._clock()
+        with self._lock:
+            levels = []
+            denied, retry_after = None, 0.0
+            for index, (key, rate, burst) in enumerate(buckets):
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    tokens = burst
+                else:
+                    tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                levels.append(tokens)
+                if tokens < cost and (cost - tokens) / rate > retry_after:
+                    denied, retry_after = index, (cost - tokens) / rate
+            if denied is None:
+                for (key, rate, burst), tokens in zip(buckets, levels):
+                    tokens -= cost
+                    self._buckets[key] = [tokens, now, now + (burst - tokens) / rate]
+            self._ops += 1
+            if self._ops >= self._prune_every:
+                self._prune(now)
+        return denied, retry_after
+
+    def acquire(self, key, limit):
+        with self._lock:
+            count = self._inflight.get(key, 0)
+            if count >= limit:
+                return False
+            self._inflight[key] = count + 1
+            return True
+
+    def release(self, key):
+        with self._lock:
+            count = self._inflight.get(key, 0) - 1
+            if count > 0:
+                self._inflight[key] = count
+            else:
+                self._inflight.pop(key, None)
+
+    def _prune(self, now):
+        """Forget buckets that have refilled completely (same as never seen)"""
+        self._ops = 0
+        for key in [k for k, b in self._buckets.items() if b[2] <= now]:
+            del self._buckets[key]
+
+
+# KEYS = bucket keys; ARGV = cost, then rate and burst for each key
+TAKE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local levels = {}
+local denied, retry = 0, 0
+for i, key in ipairs(KEYS) do
+  local rate, burst = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+  local state = redis.call('HMGET', key, 'tokens', 'ts')
+  local tokens = tonumber(state[1]) or burst
+  local ts = tonumber(state[2]) or now
+  tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+  levels[i] = tokens
+  if tokens < cost and (cost - tokens) / rate > retry then
+    denied, retry = i, (cost - tokens) / rate
+  end
+end
+if denied == 0 then
+  for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+    local tokens = levels[i] - cost
+    redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil((burst - tokens) / rate * 1000) + 1000)
+  end
+end
+return {denied, tostring(retry)}
+"""
+
+ACQUIRE_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+if count > tonumber(ARGV[1]) then
+  redis.call('DECR', KEYS[1])
+  return 0
+end
+return 1
+"""
+
+
+class RedisBackend:
+    """Buckets shared by every worker through Redis (atomic Lua scripts, server clock).
+
+    In-flight counters expire after `slot_ttl` seconds without activity, so a
+    worker that dies mid-request can't hold a user's slots forever.
+    """
+
+    def __init__(self, client, prefix='ratelimit:', slot_ttl=600):
+        self.client = client
+        self.prefix = prefix
+        self.slot_ttl = slot_ttl
+        self._take = client.register_script(TAKE_SCRIPT)
+        self._acquire = client.register_script(ACQUIRE_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        import redis  # optional dependency, only needed for the shared backend
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def take(self, buckets, cost=1.0):
+        args = [cost]
+        for _, rate, burst in buckets:
+            args += [rate, burst]
+        denied, retry_after = self._take(keys=[self.prefix + key for key, _, _ in buckets], args=args)
+        return (int(denied) - 1 if int(denied) else None), float(retry_after)
+
+    def acquire(self, key, limit):
+        return bool(self._acquire(keys=[self.prefix + 'inflight:' + key], args=[limit, self.slot_ttl]))
+
+    def release(self, key):
+        self.client.decr(self.prefix + 'inflight:' + key)
+
+# ══════════════════════════════════════════════════════════════════════
+# LIMITER
+# ══════════════════════════════════════════════════════════════════════
+
+class RateLimiter:
+    """Applies per-scope token-bucket rules and per-user concurrency caps.
+
+    `rules` maps a scope name ('user', 'api_key', 'ip') to a Rule; scopes
+    without a rule are not limited. `max_concurrent` caps in-flight calls per
+    key (0 = unlimited). Values of `hashed_scopes` are credentials, so bucket
+    keys (in memory and in Redis) hold a digest of them instead.
+    """
+
+    def __init__(self, backend, rules, max_concurrent=0, hashed_scopes=('api_key',)):
+        self.backend = backend
+        self.rules = {scope: rule for scope, rule in rules.items() if rule and rule.rate > 0}
+        self.max_concurrent = max_concurrent
+        self.hashed_scopes = frozenset(hashed_scopes)
+        self.allowed = 0
+        self.limited = 0
+
+    def bucket_key(self, scope, value):
+        if scope in self.hashed_scopes:
+            value = hashlib.sha256(str(value).encode('utf-8')).hexdigest()[:32]
+        return f"{scope}:{value}"
+
+    def check(self, subjects, cost=1.0):
+        """Take `cost` tokens from the bucket of every (scope, value), or from none.
+
+        Raises RateLimited, naming the scope that would wait longest, if any
+        bucket is short; the others keep their tokens. A cost larger than a
+        bucket can ever hold raises CostTooLarge without charging anything.
+        """
+        buckets, scopes = [], []
+        for scope, value in subjects:
+            rule = self.rules.get(scope)
+            if rule is None or value is None:
+                continue
+            buckets.append((self.bucket_key(scope, value), rule.rate, rule.burst))
+            scopes.append(scope)
+        if buckets:
+            burst, scope = min((burst, scope) for (_, _, burst), scope in zip(buckets, scopes))
+            if cost > burst:
+                self.limited += 1
+                raise CostTooLarge(scope, cost, burst)
+            denied, retry_after = self.backend.take(buckets, cost)
+            if denied is not None:
+                self.limited += 1
+                raise RateLimited(scopes[denied], retry_after)
+        self.allowed += 1
+
+    def acquire(self, key):
+        """Reserve an in-flight slot for `key`; raises RateLimited when all are taken"""
+        if not self.max_concurrent:
+            return False
+        if not self.backend.acquire(key, self.max_concurrent):
+            self.limited += 1
+            raise RateLimited('concurrency', 1.0, reason='concurrency')
+        return True
+
+    def acquire_up_to(self, key, count):
+        """Reserve up to `count` more in-flight slots for `key` without failing; returns how many"""
+        taken = 0
+        while taken < count and self.backend.acquire(key, self.max_concurrent):
+            taken += 1
+        return taken
+
+    def release(self, key, count=1):
+        for _ in range(count):
+            self.backend.release(key)
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "allowed": self.allowed,
+            "limited": self.limited
+        }
@@ -0,0 +1,117 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║             rendering.py - Markdown to HTML Rendering              ║
+# ║   Pooled Markdown instances • Memoized HTML • Streamed blocks      ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import hashlib
+import queue
+
+import markdown
+
+from caches import LRUCache
+
+DEFAULT_EXTENSIONS = ('fenced_code', 'tables')
+
+# ══════════════════════════════════════════════════════════════════════
+# RENDERER
+# ══════════════════════════════════════════════════════════════════════
+
+class MarkdownRenderer:
+    """Renders markdown with a pool of reusable Markdown instances and memoizes the HTML.
+
+    Building a Markdown object loads its extension pipeline, which costs more
+    than converting a typical reply, so instances are reset and reused. They
+    are pooled rather than thread-local because under eventlet every request
+    is its own green thread. Output is cached by content hash, so history
+    views, cached answers and repeated prompts don't render the same text again.
+    """
+
+    def __init__(self, extensions=DEFAULT_EXTENSIONS, max_entries=2048, pool_size=32):
+        self.extensions = list(extensions)
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._cache = LRUCache(max_entries=max_entries, ttl=float('inf'))
+        self.hits = 0
+        self.misses = 0
+
+    def convert(self, text):
+        """Render without touching the cache (for one-off fragments)"""
+        try:
+            md = self._pool.get_nowait()
+        except queue.Empty:
+            md = markdown.Markdown(extensions=self.extensions)
+        try:
+            return md.reset().convert(text or '')
+        finally:
+            try:
+                self._pool.put_nowait(md)
+            except queue.Full:
+                pass
+
+    def render(self, text):
+        key = hashlib.sha256((text or '').encode('utf-8')).digest()
+        html = self._cache.get(key)
+        if html is not None:
+            self.hits += 1
+            return html
+        self.misses += 1
+        html = self.convert(text)
+        self._cache.put(key, html)
+        return html
+
+    def stats(self):
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+# ══════════════════════════════════════════════════════════════════════
+# INCREMENTAL RENDERING FOR STREAMS
+# ══════════════════════════════════════════════════════════════════════
+
+FENCES = ('```', '~~~')
+
+
+class IncrementalRenderer:
+    """Renders a streamed reply block by block.
+
+    A block is complete once a blank line follows it outside a fenced code
+    block; each completed block is rendered exactly once. Only the unfinished
+    tail is re-rendered as chunks arrive. A loose list split by blank lines
+    comes out as several lists until the final full render replaces it.
+    """
+
+    def __init__(self, renderer):
+        self.renderer = renderer
+        self.text = ''
+        self._stable = 0  # characters already emitted as completed blocks
+
+    def feed(self, chunk):
+        """Add a chunk; returns HTML of blocks completed by it ('' if none)"""
+        self.text += chunk
+        boundary = self._boundary()
+        if boundary <= self._stable:
+            return ''
+        html = self.renderer.convert(self.text[self._stable:boundary])
+        self._stable = boundary
+        return html
+
+    def tail(self):
+        """HTML preview of the block still being written"""
+        rest = self.text[self._stable:]
+        return self.renderer.convert(rest) if rest.strip() else ''
+
+    def _boundary(self):
+        """End of the last blank line outside a code fence, scanning only the unfinished part"""
+        boundary = position = self._stable
+        in_fence = False
+        for line in self.text[self._stable:].splitlines(keepends=True):
+            if not line.endswith('\n'):
+                break  # the last line may still grow
+            position += len(line)
+            stripped = line.strip()
+            if stripped.startswith(FENCES):
+                in_fence = not in_fence
+            elif not stripped and not in_fence:
+                boundary = position
+        return boundary
@@ -0,0 +1,379 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║            resilience.py - Fault-Tolerant Model Client             ║
+# ║  Jittered retries • Hedged requests • Circuit breaker • Fallback   ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+from dispatcher import DeadlineExceeded, DispatchError
+
+# HTTP statuses worth retrying (google.api_core errors carry theirs in `.code`)
+TRANSIENT_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class UpstreamUnavailable(DispatchError):
+    """Every model is failing or has its circuit open"""
+
+    status = 503
+
+
+def is_transient(error):
+    """Timeouts, throttling, 5xx and connection failures; anything else is the request's fault"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, 'code', None)
+    if isinstance(code, int) and code in TRANSIENT_STATUS:
+        return True
+    return isinstance(error, OSError)  # includes requests' connection errors
+
+# ══════════════════════════════════════════════════════════════════════
+# CIRCUIT BREAKER
+# ══════════════════════════════════════════════════════════════════════
+
+class CircuitBreaker:
+    """Stops calling an upstream after repeated failures, then probes it again.
+
+    `failure_threshold` consecutive transient failures open the circuit:
+    calls fail fast for `reset_timeout` seconds. After that one trial call
+    is let through (half-open); its success closes the circuit, its failure
+    opens it for another period.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow(self):
+        """Whether a call may go upstream now (claims the half-open trial)"""
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open' and self._clock() - self._opened_at >= self.reset_timeout:
+                self._state = 'half_open'
+                self._trial = False
+            if self._state == 'half_open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def retry_after(self):
+        """Seconds until the next trial call is allowed"""
+        with self._lock:
+            if self._state != 'open':
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - self._clock())
+
+    def record_success(self):
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                if self._state != 'open':
+                    self.trips += 1
+                self._state = 'open'
+                self._opened_at = self._clock()
+                self._trial = False
+
+# ══════════════════════════════════════════════════════════════════════
+# RESILIENT MODEL
+# ══════════════════════════════════════════════════════════════════════
+
+_END = object()  # a stream that produced no chunks at all
+
+
+class _Upstream:
+    """One model with its breaker, latency samples and counters"""
+
+    def __init__(self, model, breaker):
+        self.model = model
+        self.breaker = breaker
+        self.name = getattr(model, 'model_name', type(model).__name__)
+        self.latencies = {False: deque(maxlen=256), True: deque(maxlen=256)}  # by `stream`
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def p95(self, stream):
+        samples = sorted(self.latencies[stream])
+        if len(samples) < 20:
+            return None  # no hedging until the latency distribution is known
+        return samples[int(0.95 * (len(samples) - 1))]
+
+    def stats(self):
+        return {
+            "model": self.name,
+            "circuit": self.breaker.state,
+            "trips": self.breaker.trips,
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins
+        }
+
+
+class ResilientModel:
+    """Drop-in wrapper around genai-style models: start_chat().send_message() and generate_content().
+
+    Each call tries the models in order, skipping any whose circuit is open,
+    so later models act as fallbacks. Transient errors are retried on the
+    same model with full-jitter exponential backoff. Everything, retries
+    included, has to fit in `deadline` seconds, and each attempt is given the
+    time left as its request timeout. With `hedge` on, an attempt still
+    pending after `hedge_after` seconds (default: that model's observed p95)
+    is raced against a second identical one, and the first success wins.
+    A stream can only be retried until its first chunk arrives.
+
+    `breakers` (one per model) lets wrappers of the same upstream share
+    circuit state; by default each model gets its own breaker.
+    """
+
+    def __init__(self, models, retries=2, backoff=0.25, max_backoff=4.0, deadline=60.0,
+                 hedge=False, hedge_after=None, breaker_failures=5, breaker_reset=30.0,
+                 breakers=None, rng=None, clock=time.monotonic, sleep=time.sleep):
+        breakers = breakers or [
+            CircuitBreaker(breaker_failures, breaker_reset, clock) for _ in models
+        ]
+        self.upstreams = [
+            _Upstream(m, breaker) for m, breaker in zip(models, breakers) if m is not None
+        ]
+        if not self.upstreams:
+            raise ValueError("ResilientModel needs at least one model")
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self._rng = rng or random.Random()
+        self._clock = clock
+        self._sleep = sleep
+        self.fallbacks = 0
+
+    @property
+    def model_name(self):
+        return self.upstreams[0].name
+
+    def start_chat(self, history=None):
+        return ResilientChat(self, history or [])
+
+    def generate_content(self, contents, stream=False):
+        return self.start_chat().send_message(contents, stream=stream)
+
+    def stats(self):
+        return {
+            "models": [upstream.stats() for upstream in self.upstreams],
+            "fallbacks": self.fallbacks,
+            "hedging": self.hedge
+        }
+
+    def _call(self, history, content, stream):
+        """Run one logical call; returns (upstream, response) or (upstream, (response, chunks, first))"""
+        deadline = self._clock() + self.deadline
+        last_error = None
+        for index, upstream in enumerate(self.upstreams):
+            if not upstream.breaker.allow():
+                continue
+            if index > 0:
+                self.fallbacks += 1
+            for attempt in range(self.retries + 1):
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    raise DeadlineExceeded("Model call deadline exceeded") from last_error
+                if attempt:
+                    upstream.retries += 1
+                upstream.calls += 1
+                try:
+                    result = self._attempt(upstream, history, content, stream, deadline)
+                except DeadlineExceeded:
+                    upstream.breaker.record_failure()
+                    upstream.errors += 1
+                    raise
+                except Exception as e:
+                    if not is_transient(e):
+                        # Upstream answered; the request itself was rejected
+                        upstream.breaker.record_success()
+                        raise
+                    upstream.breaker.record_failure()
+                    upstream.errors += 1
+                    last_error = e
+                    if upstream.breaker.state == 'open' or attempt == self.retries:
+                        break  # try the next model
+                    delay = self._rng.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                    if self._clock() + delay >= deadline:
+                        break
+                    self._sleep(delay)
+                    continue
+                upstream.breaker.record_success()
+                return upstream, result
+
+        retry_after = min(
+            (u.breaker.retry_after() for u in self.upstreams if u.breaker.state == 'open'),
+            default=1.0
+        )
+        if last_error is None:
+            raise UpstreamUnavailable("Model circuit is open", retry_after=max(1.0, retry_after))
+        raise UpstreamUnavailable(
+            f"Model unavailable: {last_error}", retry_after=max(1.0, retry_after)
+        ) from last_error
+
+    def _attempt(self, upstream, history, content, stream, deadline):
+        run = lambda: self._once(upstream, history, content, stream, deadline)
+        delay = self.hedge_after if self.hedge_after else upstream.p95(stream)
+        if not self.hedge or delay is None or self._clock() + delay >= deadline:
+            return run()
+        return self._hedged(upstream, run, delay, deadline)
+
+    def _once(self, upstream, history, content, stream, deadline):
+        started = self._clock()
+        session = upstream.model.start_chat(history=list(history))
+        response = session.send_message(
+            content, stream=stream, request_options={'timeout': max(0.001, deadline - started)}
+        )
+        if stream:
+            chunks = iter(response)
+            # Pull the first chunk here, so setup errors are retried like any other
+            result = (response, chunks, next(chunks, _END))
+        else:
+            result = response
+        upstream.latencies[stream].append(self._clock() - started)
+        return result
+
+    def _hedged(self, upstream, run, delay, deadline):
+        """Race a second attempt against a slow first one; the loser's result is discarded"""
+        outcomes = queue.Queue()
+        lock = threading.Lock()
+        settled = [False]
+
+        def attempt(index):
+            try:
+                outcome = (index, True, run())
+            except Exception as e:
+                outcome = (index, False, e)
+            with lock:
+                if not settled[0]:
+                    outcomes.put(outcome)
+                    return
+            _discard(outcome)
+
+        def start(index):
+            threading.Thread(target=attempt, args=(index,), name='llm-hedge', daemon=True).start()
+
+        start(0)
+        launched = 1
+        try:
+            outcome = outcomes.get(timeout=delay)
+        except queue.Empty:
+            upstream.hedges += 1
+            upstream.calls += 1
+            start(1)
+            launched = 2
+            outcome = None
+        failures = []
+        try:
+            while True:
+                if outcome is None:
+                    try:
+                        outcome = outcomes.get(timeout=max(0.0, deadline - self._clock()))
+                    except queue.Empty:
+                        raise DeadlineExceeded("Model call deadline exceeded") from None
+                index, ok, value = outcome
+                if ok:
+                    if index == 1:
+                        upstream.hedge_wins += 1
+                    return value
+                failures.append(value)
+                if len(failures) == launched:
+                    raise value
+                outcome = None
+        finally:
+            with lock:
+                settled[0] = True
+            while True:
+                try:
+                    _discard(outcomes.get_nowait())
+                except queue.Empty:
+                    break
+
+
+def _discard(outcome):
+    """Release a losing hedged attempt (closes its stream, if any)"""
+    _, ok, value = outcome
+    if ok and isinstance(value, tuple):
+        close = getattr(value[1], 'close', None)
+        if close is not None:
+            close()
+
+
+class ResilientChat:
+    """Chat session over a ResilientModel; each message is one resilient call"""
+
+    def __init__(self, client, history):
+        self.client = client
+        self.history = list(history)
+
+    def send_message(self, content, stream=False):
+        if stream:
+            return ResilientStream(self.client, self.history, content)
+        _, response = self.client._call(self.history, content, stream=False)
+        return response
+
+
+class ResilientStream:
+    """Streamed response; retries and fallback apply until the first chunk"""
+
+    def __init__(self, client, history, content):
+        self._client = client
+        self._history = history
+        self._content = content
+        self._response = None
+
+    def __iter__(self):
+        upstream, (response, chunks, first) = self._client._call(
+            self._history, self._content, stream=True
+        )
+        self._response = response
+        if first is _END:
+            return
+        yield first
+        try:
+            yield from chunks
+        except Exception as e:
+            # Too late to retry (the client has partial output), but the breaker should know
+            if is_transient(e):
+                upstream.breaker.record_failure()
+                upstream.errors += 1
+            raise
+
+    @property
+    def usage_metadata(self):
+        return getattr(self._response, 'usage_metadata', None)
+
+    @property
+    def text(self):
+        if self._response is None:
+            for _ in self:
+                pass
+        return self._response.text
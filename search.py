@@ -0,0 +1,147 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║               search.py - Full-Text Message Search                 ║
+# ║       SQLite FTS5 • Postgres tsvector • Ranked snippets            ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import html
+import re
+
+from sqlalchemy import DateTime, inspect, text
+
+# Snippet highlight markers: private-use characters that can't collide with
+# message text, swapped for <mark> tags after the snippet is HTML-escaped
+MARK_START = '\ue000'
+MARK_END = '\ue001'
+SNIPPET_TOKENS = 16
+
+# ══════════════════════════════════════════════════════════════════════
+# QUERY HELPERS
+# ══════════════════════════════════════════════════════════════════════
+
+def query_terms(query):
+    """Split user input into search terms (words, optionally ending in * for prefix match)"""
+    return re.findall(r'\w+\*?', query, flags=re.UNICODE)
+
+
+def fts5_query(query):
+    """FTS5 MATCH expression that ANDs the terms; user input is never parsed as FTS syntax"""
+    parts = []
+    for term in query_terms(query):
+        prefix = term.endswith('*')
+        word = term.rstrip('*')
+        parts.append(f'"{word}"*' if prefix else f'"{word}"')
+    return ' '.join(parts)
+
+
+def highlight(snippet):
+    """HTML-escape a snippet and turn the match markers into <mark> tags"""
+    return html.escape(snippet or '').replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def like_snippet(content, terms, width=120):
+    """Snippet around the first matching term, for the LIKE fallback"""
+    lowered = content.lower()
+    positions = [lowered.find(t.rstrip('*').lower()) for t in terms]
+    positions = [p for p in positions if p >= 0]
+    start = max(0, min(positions) - width // 3) if positions else 0
+    snippet = content[start:start + width]
+    for term in terms:
+        word = re.escape(term.rstrip('*'))
+        snippet = re.sub(f'({word})', f'{MARK_START}\\1{MARK_END}', snippet, flags=re.IGNORECASE)
+    return ('…' if start else '') + snippet + ('…' if start + width < len(content) else '')
+
+# ══════════════════════════════════════════════════════════════════════
+# SEARCH
+# ══════════════════════════════════════════════════════════════════════
+
+class MessageSearch:
+    """Ranked full-text search over a user's messages, using whatever index the database has"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._backend = None
+
+    @property
+    def backend(self):
+        """'fts5', 'tsvector' or 'like', detected once from the schema"""
+        if self._backend is None:
+            dialect = self.engine.dialect.name
+            inspector = inspect(self.engine)
+            if dialect == 'sqlite' and inspector.has_table('message_fts'):
+                self._backend = 'fts5'
+            elif dialect == 'postgresql' and any(
+                    c['name'] == 'search_vector' for c in inspector.get_columns('message')):
+                self._backend = 'tsvector'
+            else:
+                self._backend = 'like'
+        return self._backend
+
+    def search(self, conn, query, user_id, limit=20, offset=0, conversation_id=None):
+        """Return (results, has_more); results are best match first with highlighted snippets"""
+        terms = query_terms(query)
+        if not terms:
+            return [], False
+
+        params = {"user_id": user_id, "limit": limit + 1, "offset": offset}
+        scope = "c.user_id = :user_id"
+        if conversation_id is not None:
+            scope += " AND m.conversation_id = :conversation_id"
+            params["conversation_id"] = conversation_id
+
+        if self.backend == 'fts5':
+            params.update(q=fts5_query(query), start=MARK_START, end=MARK_END, tokens=SNIPPET_TOKENS)
+            sql = (
+                "SELECT m.id, m.conversation_id, m.role, m.timestamp, c.title, "
+                "snippet(message_fts, 0, :start, :end, '…', :tokens) AS snippet, "
+                "bm25(message_fts) AS score "
+                "FROM message_fts "
+                "JOIN message m ON m.id = message_fts.rowid "
+                "JOIN conversation c ON c.id = m.conversation_id "
+                f"WHERE message_fts MATCH :q AND {scope} "
+                "ORDER BY score, m.id DESC LIMIT :limit OFFSET :offset"
+            )
+        elif self.backend == 'tsvector':
+            params.update(
+                q=' '.join(t.rstrip('*') for t in terms),
+                options=f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords={SNIPPET_TOKENS * 2}, MinWords=5"
+            )
+            sql = (
+                "SELECT m.id, m.conversation_id, m.role, m.timestamp, c.title, "
+                "ts_headline('english', m.content, q, :options) AS snippet, "
+                "-ts_rank_cd(m.search_vector, q) AS score "
+                "FROM message m "
+                "JOIN conversation c ON c.id = m.conversation_id, "
+                "websearch_to_tsquery('english', :q) AS q "
+                f"WHERE m.search_vector @@ q AND {scope} "
+                "ORDER BY score, m.id DESC LIMIT :limit OFFSET :offset"
+            )
+        else:
+            # No index: substring scan, newest first
+            likes = []
+            for i, term in enumerate(terms):
+                params[f"t{i}"] = f"%{term.rstrip('*')}%"
+                likes.append(f"m.content LIKE :t{i}")
+            sql = (
+                "SELECT m.id, m.conversation_id, m.role, m.timestamp, c.title, "
+                "m.content AS snippet, 0 AS score "
+                "FROM message m JOIN conversation c ON c.id = m.conversation_id "
+                f"WHERE {' AND '.join(likes)} AND {scope} "
+                "ORDER BY m.id DESC LIMIT :limit OFFSET :offset"
+            )
+
+        rows = conn.execute(text(sql).columns(timestamp=DateTime), params).mappings().all()
+        results = []
+        for row in rows[:limit]:
+            snippet = row['snippet']
+            if self.backend == 'like':
+                snippet = like_snippet(snippet, terms)
+            results.append({
+                "message_id": row['id'],
+                "conversation_id": row['conversation_id'],
+                "conversation_title": row['title'],
+                "role": row['role'],
+                "timestamp": row['timestamp'],
+                "snippet": highlight(snippet),
+                "score": round(-float(row['score']), 4) or 0.0
+            })
+        return results, len(rows) > limit
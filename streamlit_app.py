@@ -6,7 +6,6 @@
 import streamlit as st
 import requests
 import json
-from datetime import datetime
 import os
 
 # ══════════════════════════════════════════════════════════════════════
@@ -72,6 +71,10 @@ if 'conversations' not in st.session_state:
     st.session_state.conversations = []
 if 'current_conversation_id' not in st.session_state:
     st.session_state.current_conversation_id = None
+if 'older_messages_cursor' not in st.session_state:
+    st.session_state.older_messages_cursor = None
+
+MESSAGE_PAGE_SIZE = 50
 
 # ══════════════════════════════════════════════════════════════════════
 # API FUNCTIONS
@@ -99,22 +102,36 @@ def login_user(username, password):
     except Exception as e:
         return {"error": str(e)}, 500
 
-def send_message(message, token, conversation_id=None):
-    """Send message to API"""
+def send_message_stream(message, token, conversation_id=None):
+    """Send message to API and yield (event, data) pairs as the response streams"""
     try:
-        headers = {"Authorization": f"Bearer {token}"}
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "text/event-stream"
+        }
         data = {"message": message}
         if conversation_id:
             data["conversation_id"] = conversation_id
         
-        response = requests.post(
-            f"{API_BASE_URL}/api/chat",
+        with requests.post(
+            f"{API_BASE_URL}/api/chat/stream",
             headers=headers,
-            json=data
-        )
-        return response.json(), response.status_code
+            json=data,
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                yield "error", response.json()
+                return
+            
+            event = "message"
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    yield event, json.loads(line[len("data:"):].strip())
+                    event = "message"
     except Exception as e:
-        return {"error": str(e)}, 500
+        yield "error", {"error": str(e)}
 
 def get_conversations(token):
     """Get user's conversations"""
@@ -128,13 +145,17 @@ def get_conversations(token):
     except Exception as e:
         return {"error": str(e)}, 500
 
-def load_conversation(conversation_id, token):
-    """Load specific conversation"""
+def load_conversation(conversation_id, token, before=None):
+    """Load a page of a conversation (latest messages first, `before` for older ones)"""
     try:
         headers = {"Authorization": f"Bearer {token}"}
+        params = {"limit": MESSAGE_PAGE_SIZE}
+        if before:
+            params["before"] = before
         response = requests.get(
             f"{API_BASE_URL}/api/conversations/{conversation_id}",
-            headers=headers
+            headers=headers,
+            params=params
         )
         return response.json(), response.status_code
     except Exception as e:
@@ -227,6 +248,7 @@ def show_chat_page():
         if st.button("➕ New Conversation", use_container_width=True):
             st.session_state.current_conversation_id = None
             st.session_state.messages = []
+            st.session_state.older_messages_cursor = None
             st.rerun()
         
         # Load conversations on first run
@@ -248,6 +270,7 @@ def show_chat_page():
                 if status == 200:
                     st.session_state.current_conversation_id = conv['id']
                     st.session_state.messages = result['messages']
+                    st.session_state.older_messages_cursor = result.get('next_cursor')
                     st.rerun()
         
         st.markdown("---")
@@ -261,6 +284,19 @@ def show_chat_page():
     # Main chat area
     st.title("🤖 AI Agent Chat")
     
+    # Older messages are fetched a page at a time on demand
+    if st.session_state.older_messages_cursor:
+        if st.button("⬆️ Load older messages"):
+            result, status = load_conversation(
+                st.session_state.current_conversation_id,
+                st.session_state.access_token,
+                before=st.session_state.older_messages_cursor
+            )
+            if status == 200:
+                st.session_state.messages = result['messages'] + st.session_state.messages
+                st.session_state.older_messages_cursor = result.get('next_cursor')
+                st.rerun()
+    
     # Display messages
     for message in st.session_state.messages:
         role = message['role']
@@ -279,16 +315,20 @@ def show_chat_page():
         
         # Get AI response
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                result, status = send_message(
-                    prompt,
-                    st.session_state.access_token,
-                    st.session_state.current_conversation_id
-                )
-                
-                if status == 200:
-                    response = result['response']
-                    st.markdown(response)
+            placeholder = st.empty()
+            placeholder.markdown("Thinking...")
+            response = ""
+            
+            for event, result in send_message_stream(
+                prompt,
+                st.session_state.access_token,
+                st.session_state.current_conversation_id
+            ):
+                if event == "chunk":
+                    response += result['chunk']
+                    placeholder.markdown(response + "▌")
+                elif event == "complete":
+                    placeholder.markdown(response)
                     
                     # Update conversation ID
                     if not st.session_state.current_conversation_id:
@@ -299,7 +339,8 @@ def show_chat_page():
                         "role": "assistant",
                         "content": response
                     })
-                else:
+                elif event == "error":
+                    placeholder.empty()
                     error_msg = result.get('error', 'Failed to get response')
                     st.error(f"Error: {error_msg}")
 
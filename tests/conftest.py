@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root, next to app.py
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """app.py imported once against a throwaway SQLite file and the instant fake model"""
+    database = tmp_path_factory.mktemp('db') / 'test.db'
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{database}',
+        'LLM_BACKEND': 'fake',
+        'FAKE_LLM_LATENCY': '0',
+        'FAKE_LLM_TOKENS_PER_SECOND': '0',
+        'RATE_LIMIT': '0',
+        'JOB_WORKERS': '0',
+        'METRICS': '0',
+        'IMPORT_BATCH_SIZE': '2',
+    })
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from ratelimit import MemoryBackend, RateLimiter, Rule
+
+
+def ndjson(records):
+    return '\n'.join(json.dumps(record) for record in records) + '\n'
+
+
+def export_records(title, messages=5):
+    return [{'type': 'conversation', 'id': 1, 'title': title, 'user_id': 1}] + [{
+        'type': 'message', 'id': i, 'conversation_id': 1, 'role': 'assistant',
+        'content': '**bold**', 'html': '<script>alert(1)</script>'
+    } for i in range(messages)]
+
+
+def titles(client):
+    return {c['title'] for c in client.get('/api/conversations?limit=1000').get_json()['conversations']}
+
+
+def test_bad_limit_and_cursor_get_fixed_messages(client):
+    for url, error in [
+        ('/api/conversations?limit=ten', 'invalid limit'),
+        ('/api/conversations?before=', None),
+        ('/api/conversations?before=not-a-cursor', 'invalid cursor'),
+        ('/api/conversations?before=|7', 'invalid cursor'),
+        ('/api/conversations/1?before=abc', 'invalid cursor'),
+    ]:
+        response = client.get(url)
+        if error is None:
+            assert response.status_code in (200, 404)
+        else:
+            assert response.status_code == 400
+            assert response.get_json() == {'error': error}
+
+
+def test_import_with_a_bad_line_imports_nothing(client):
+    # IMPORT_BATCH_SIZE=2, so several batches are written before the bad line
+    body = ndjson(export_records('half imported')) + '{not json\n'
+    response = client.post('/api/import', data=body, content_type='application/x-ndjson')
+
+    assert response.status_code == 400
+    assert 'half imported' not in titles(client)
+
+
+def test_import_rejects_lines_that_are_not_objects(client):
+    body = ndjson(export_records('not objects')) + '[1, 2]\n'
+    response = client.post('/api/import', data=body, content_type='application/x-ndjson')
+
+    assert response.status_code == 400
+    assert 'not objects' not in titles(client)
+
+
+def test_import_renders_html_instead_of_trusting_it(client, app_module):
+    response = client.post('/api/import', data=ndjson(export_records('rendered')),
+                           content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.get_json()['imported']['message'] == 5
+
+    conversation_id = next(
+        c['id'] for c in client.get('/api/conversations').get_json()['conversations']
+        if c['title'] == 'rendered'
+    )
+    with app_module.app.app_context():
+        stored = app_module.Message.query.filter_by(conversation_id=conversation_id).all()
+        assert {m.html for m in stored} == {'<p><strong>bold</strong></p>'}
+
+
+def guest_limiter(app_module, monkeypatch, burst):
+    rl = RateLimiter(MemoryBackend(), {'guest': Rule(0.001, burst)}, max_concurrent=2)
+    monkeypatch.setattr(app_module, 'rate_limiter', rl)
+    return rl
+
+
+def test_malformed_batch_spends_no_tokens(client, app_module, monkeypatch):
+    rl = guest_limiter(app_module, monkeypatch, 3.0)
+    for body in [{'items': []}, {'items': ['ok', {'message': 7}]}, ['not', 'an', 'object']]:
+        response = client.post('/api/chat/batch', json=body)
+        assert response.status_code == 400
+    response = client.post('/api/chat/batch', data='{not json', content_type='application/json')
+    assert response.status_code == 400
+
+    assert rl.backend._buckets == {}
+    assert rl.backend._inflight == {}
+
+
+def test_batch_larger_than_the_burst_is_refused(client, app_module, monkeypatch):
+    rl = guest_limiter(app_module, monkeypatch, 3.0)
+
+    response = client.post('/api/chat/batch', json={'items': ['a', 'b', 'c', 'd']})
+    assert response.status_code == 413
+    assert response.get_json()['limit'] == 3.0
+    assert 'Retry-After' not in response.headers
+    assert rl.backend._buckets == {}
+    assert rl.backend._inflight == {}
+
+    response = client.post('/api/chat/batch', json={'items': ['a', 'b', 'c'], 'persist': False})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    response.close()
+    assert lines[-1]['succeeded'] == 3
+    assert rl.backend._buckets['guest:all'][0] == pytest.approx(0.0, abs=0.01)
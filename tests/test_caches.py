@@ -0,0 +1,180 @@
+import threading
+import time
+
+import pytest
+
+from caches import SingleFlight
+
+
+def slow_stream(chunks, delay=0.05, calls=None):
+    def produce(shared):
+        if calls is not None:
+            calls.append('stream')
+        for chunk in chunks:
+            time.sleep(delay)
+            yield chunk
+        shared['text'] = ''.join(chunks)
+    return produce
+
+
+def test_do_coalesces_concurrent_callers():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def fn():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return 'value'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('k', fn)))
+    leader.start()
+    started.wait(1)
+    results.append(flight.do('k', fn))
+    leader.join()
+
+    assert calls == [1]
+    assert sorted(results) == [('value', False), ('value', True)]
+
+
+def test_do_shares_the_leaders_error():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError('upstream down')
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('k', fail)
+        except ValueError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(1)
+    call()
+    leader.join()
+    assert errors == ['upstream down', 'upstream down']
+
+
+def test_stream_followers_replay_the_leaders_chunks():
+    flight = SingleFlight()
+    calls = []
+    produce = slow_stream(['a', 'b', 'c'], calls=calls)
+    leader_result, follower_result = {}, {}
+
+    leader = flight.stream('k', produce, leader_result)
+    assert next(leader) == 'a'
+    follower = list(flight.stream('k', produce, follower_result))
+    rest = list(leader)
+
+    assert calls == ['stream']
+    assert ['a'] + rest == follower == ['a', 'b', 'c']
+    assert leader_result == {'text': 'abc'}
+    assert follower_result == {'text': 'abc', 'coalesced': True}
+
+
+def test_stream_survives_the_leader_disconnecting():
+    flight = SingleFlight()
+    produce = slow_stream(['a', 'b', 'c', 'd'])
+    follower_result = {}
+    received = []
+
+    leader = flight.stream('k', produce, {})
+    next(leader)
+    follower = threading.Thread(
+        target=lambda: received.extend(flight.stream('k', produce, follower_result))
+    )
+    follower.start()
+    time.sleep(0.02)
+    leader.close()
+    follower.join(2)
+
+    assert received == ['a', 'b', 'c', 'd']
+    assert follower_result['text'] == 'abcd'
+
+
+def test_stream_is_abandoned_once_nobody_reads():
+    flight = SingleFlight()
+    produced = []
+
+    def produce(shared):
+        for i in range(100):
+            produced.append(i)
+            time.sleep(0.01)
+            yield str(i)
+
+    stream = flight.stream('k', produce, {})
+    next(stream)
+    stream.close()
+    time.sleep(0.1)
+    assert len(produced) < 20
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_blocking_and_streaming_calls_never_share_a_flight():
+    flight = SingleFlight()
+    calls = []
+    stream_started = threading.Event()
+
+    def produce(shared):
+        calls.append('stream')
+        stream_started.set()
+        for chunk in ['x', 'y']:
+            time.sleep(0.05)
+            yield chunk
+        shared.update(text='xy', usage={'total_tokens': 2})
+
+    def fn():
+        calls.append('call')
+        return 'reply', {'total_tokens': 1}
+
+    stream_result = {}
+    streamer = threading.Thread(target=lambda: list(flight.stream('k', produce, stream_result)))
+    streamer.start()
+    stream_started.wait(1)
+    # Same key while the stream is in flight: runs its own call, not the stream's
+    (text, usage), shared = flight.do('k', fn)
+    streamer.join()
+
+    assert (text, usage, shared) == ('reply', {'total_tokens': 1}, False)
+    assert stream_result == {'text': 'xy', 'usage': {'total_tokens': 2}}
+    assert sorted(calls) == ['call', 'stream']
+
+
+def test_streaming_call_does_not_join_a_blocking_leader():
+    flight = SingleFlight()
+    call_started = threading.Event()
+
+    def fn():
+        call_started.set()
+        time.sleep(0.1)
+        return 'reply', {}
+
+    caller = threading.Thread(target=lambda: flight.do('k', fn))
+    caller.start()
+    call_started.wait(1)
+    result = {}
+    chunks = list(flight.stream('k', slow_stream(['a', 'b'], delay=0), result))
+    caller.join()
+
+    assert chunks == ['a', 'b']
+    assert result == {'text': 'ab'}
+
+
+def test_stream_error_reaches_every_reader():
+    flight = SingleFlight()
+
+    def produce(shared):
+        yield 'a'
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError, match='boom'):
+        list(flight.stream('k', produce, {}))
@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+
+from dispatcher import DeadlineExceeded, LLMDispatcher, Overloaded
+from llm import FakeModel
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition never held"
+        time.sleep(0.005)
+
+
+def in_background(fn):
+    """Run fn on a thread; returns a list that receives its result or exception"""
+    outcome = []
+
+    def run():
+        try:
+            outcome.append(fn())
+        except Exception as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return outcome, thread
+
+
+def occupy(dispatcher, release, priority='user'):
+    """Tie up a worker until `release` is set"""
+    outcome, thread = in_background(lambda: dispatcher.call(release.wait, priority))
+    wait_until(lambda: dispatcher.stats()['running'] == 1)
+    return outcome, thread
+
+
+def queue_job(dispatcher, release, priority):
+    before = dispatcher.stats()['queue_depth']
+    outcome, thread = in_background(lambda: dispatcher.call(release.wait, priority))
+    wait_until(lambda: dispatcher.stats()['queue_depth'] == before + 1)
+    return outcome, thread
+
+
+def test_call_runs_the_model_on_a_worker():
+    model = FakeModel(latency=0.01, tokens_per_second=0, reply_words=8)
+    dispatcher = LLMDispatcher(workers=2, max_queue=2)
+
+    text = dispatcher.call(lambda: model.generate_content('hello').text)
+
+    assert text == model.reply_for('hello')
+    assert dispatcher.stats()['completed'] == 1
+
+
+def test_stream_yields_chunks_from_a_worker():
+    model = FakeModel(latency=0.0, tokens_per_second=0, reply_words=8, chunk_words=2)
+    dispatcher = LLMDispatcher(workers=1, max_queue=1)
+
+    chunks = list(dispatcher.stream(lambda: model.generate_content('hello', stream=True)))
+
+    assert len(chunks) == 4
+    assert ''.join(chunk.text for chunk in chunks) == model.reply_for('hello')
+
+
+def test_full_queue_sheds_the_newcomer():
+    dispatcher = LLMDispatcher(workers=1, max_queue=1)
+    release = threading.Event()
+    running, first = occupy(dispatcher, release)
+    queued, second = queue_job(dispatcher, release, 'user')
+
+    with pytest.raises(Overloaded, match="queue is full"):
+        dispatcher.call(lambda: None, 'user')
+
+    release.set()
+    first.join(1)
+    second.join(1)
+    assert running == [True] and queued == [True]
+    assert dispatcher.stats()['shed'] == 1
+
+
+def test_urgent_job_displaces_queued_background_work():
+    dispatcher = LLMDispatcher(workers=1, max_queue=1)
+    release = threading.Event()
+    _, first = occupy(dispatcher, release)
+    displaced, second = queue_job(dispatcher, release, 'batch')
+
+    urgent, third = in_background(lambda: dispatcher.call(lambda: 'urgent', 'interactive'))
+    second.join(1)
+    release.set()
+    first.join(1)
+    third.join(1)
+
+    assert isinstance(displaced[0], Overloaded)
+    assert urgent == ['urgent']
+    assert dispatcher.stats()['shed'] == 1
+
+
+def test_wait_longer_than_the_deadline_is_shed_at_admission():
+    model = FakeModel(latency=0.1, tokens_per_second=0, reply_words=4)
+    dispatcher = LLMDispatcher(workers=1, max_queue=8)
+    dispatcher.call(lambda: model.generate_content('warm up').text)  # learn the service time
+    release = threading.Event()
+    _, first = occupy(dispatcher, release)
+
+    with pytest.raises(Overloaded, match="exceeds the deadline"):
+        dispatcher.call(lambda: None, timeout=0.05)
+
+    release.set()
+    first.join(1)
+    assert dispatcher.stats()['queue_depth'] == 0
+
+
+def test_call_times_out_and_its_queued_job_expires():
+    dispatcher = LLMDispatcher(workers=1, max_queue=4)
+    release = threading.Event()
+    _, first = occupy(dispatcher, release)
+
+    with pytest.raises(DeadlineExceeded):
+        dispatcher.call(lambda: None, timeout=0.05)
+
+    release.set()
+    first.join(1)
+    wait_until(lambda: dispatcher.stats()['expired'] == 1)
+    assert dispatcher.stats()['completed'] == 1
+
+
+def test_upstream_error_reaches_the_caller():
+    model = FakeModel(latency=0.0, tokens_per_second=0, error_rate=1.0)
+    dispatcher = LLMDispatcher(workers=1, max_queue=1)
+
+    with pytest.raises(Exception, match="503"):
+        dispatcher.call(lambda: model.generate_content('hello').text)
+
+    assert dispatcher.stats()['failed'] == 1
@@ -0,0 +1,63 @@
+import threading
+
+from persistence import WriteBehindQueue
+
+
+def test_close_flushes_every_queued_row():
+    written = []
+    writes = WriteBehindQueue(written.extend, max_batch=3, interval=10.0)
+    for n in range(7):
+        writes.put('conversation', [n])
+
+    writes.close()
+
+    assert sorted(written) == list(range(7))
+    assert writes.stats() == {"queued": 0, "batches": 3, "rows_written": 7, "rows_dropped": 0}
+
+
+def test_put_after_close_writes_synchronously():
+    written = []
+    writes = WriteBehindQueue(written.extend)
+    writes.put('conversation', ['queued'])
+    writes.close()
+
+    writes.put('conversation', ['late'])
+
+    assert written == ['queued', 'late']
+
+
+def test_wait_returns_once_the_key_is_committed():
+    written = []
+    gate = threading.Event()
+
+    def write_batch(rows):
+        gate.wait(1)
+        written.extend(rows)
+
+    writes = WriteBehindQueue(write_batch, interval=0.0)
+    writes.put(1, ['a'], owner='alice')
+    writes.put(2, ['b'])
+
+    assert not writes.wait(1, timeout=0.05)
+    assert not writes.wait(owner='alice', timeout=0.0)
+    gate.set()
+    assert writes.wait(timeout=1.0)
+    assert sorted(written) == ['a', 'b']
+    writes.close()
+
+
+def test_failing_batch_is_dropped_and_reported():
+    dropped = []
+
+    def write_batch(rows):
+        raise RuntimeError("database is locked")
+
+    writes = WriteBehindQueue(write_batch, interval=10.0, retries=1, on_drop=dropped.append)
+    writes.put(1, ['a', 'b'])
+    writes.put(2, ['c'])
+
+    writes.close()
+
+    assert dropped == [{1, 2}]
+    assert writes.stats()['rows_dropped'] == 3
+    assert writes.wait(timeout=0.0)
@@ -0,0 +1,110 @@
+import pytest
+
+from auth import Identity
+from ratelimit import CostTooLarge, MemoryBackend, RateLimited, RateLimiter, Rule
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def limiter(rules, max_concurrent=0):
+    clock = Clock()
+    return RateLimiter(MemoryBackend(clock=clock), rules, max_concurrent=max_concurrent), clock
+
+
+def tokens(limiter, key):
+    return limiter.backend._buckets[key][0]
+
+
+def test_check_charges_every_bucket_or_none():
+    rl, _ = limiter({'user': Rule(1.0, 5.0), 'ip': Rule(1.0, 2.0)})
+    subjects = [('user', 1), ('ip', 'a')]
+    rl.check(subjects)
+    rl.check(subjects)
+
+    with pytest.raises(RateLimited) as refused:
+        rl.check(subjects)
+
+    assert refused.value.scope == 'ip'
+    assert refused.value.retry_after == pytest.approx(1.0)
+    # The user bucket allowed the third request but was not charged for it
+    assert tokens(rl, 'user:1') == 3.0
+
+
+def test_refused_request_reports_the_longest_wait():
+    rl, _ = limiter({'user': Rule(0.5, 1.0), 'ip': Rule(1.0, 1.0)})
+    rl.check([('user', 1), ('ip', 'a')])
+    with pytest.raises(RateLimited) as refused:
+        rl.check([('user', 1), ('ip', 'a')])
+    assert refused.value.scope == 'user'
+    assert refused.value.retry_after == pytest.approx(2.0)
+
+
+def test_buckets_refill_over_time():
+    rl, clock = limiter({'user': Rule(1.0, 2.0)})
+    rl.check([('user', 1)], cost=2)
+    with pytest.raises(RateLimited):
+        rl.check([('user', 1)])
+    clock.now += 1.0
+    rl.check([('user', 1)])
+
+
+def test_cost_above_the_smallest_burst_is_refused_without_charging():
+    rl, _ = limiter({'user': Rule(1.0, 10.0), 'ip': Rule(1.0, 4.0)})
+    with pytest.raises(CostTooLarge) as refused:
+        rl.check([('user', 1), ('ip', 'a')], cost=5)
+    assert refused.value.scope == 'ip'
+    assert refused.value.burst == 4.0
+    assert rl.backend._buckets == {}
+
+    rl.check([('user', 1), ('ip', 'a')], cost=4)
+    assert tokens(rl, 'ip:a') == 0.0
+
+
+def test_api_keys_are_hashed_in_bucket_keys():
+    rl, _ = limiter({'api_key': Rule(1.0, 5.0)})
+    rl.check([('api_key', 'secret-key')])
+    assert not any('secret-key' in key for key in rl.backend._buckets)
+
+
+def test_acquire_up_to_takes_only_free_slots():
+    rl, _ = limiter({}, max_concurrent=3)
+    assert rl.acquire('user:1')
+    assert rl.acquire_up_to('user:1', 5) == 2
+    with pytest.raises(RateLimited) as refused:
+        rl.acquire('user:1')
+    assert refused.value.reason == 'concurrency'
+
+    rl.release('user:1', 3)
+    assert rl.acquire_up_to('user:1', 2) == 2
+
+
+def test_limit_request_spends_no_tokens_when_concurrency_refuses(app_module, monkeypatch):
+    rl, _ = limiter({'user': Rule(1.0, 5.0)}, max_concurrent=1)
+    monkeypatch.setattr(app_module, 'rate_limiter', rl)
+    user = Identity(1, 'alice', 'key')
+
+    slot = app_module.limit_request(user, None, '10.0.0.1')
+    with pytest.raises(RateLimited):
+        app_module.limit_request(user, None, '10.0.0.1')
+    assert tokens(rl, 'user:1') == 4.0
+
+    rl.release(slot)
+    assert app_module.limit_request(user, None, '10.0.0.1') == slot
+
+
+def test_limit_request_gives_the_slot_back_when_a_bucket_refuses(app_module, monkeypatch):
+    rl, _ = limiter({'user': Rule(1.0, 1.0)}, max_concurrent=1)
+    monkeypatch.setattr(app_module, 'rate_limiter', rl)
+    user = Identity(2, 'bob', 'key')
+
+    rl.release(app_module.limit_request(user, None, '10.0.0.2'))
+    with pytest.raises(RateLimited) as refused:
+        app_module.limit_request(user, None, '10.0.0.2')
+    assert refused.value.scope == 'user'
+    assert rl.backend._inflight == {}
@@ -0,0 +1,173 @@
+import time
+
+import pytest
+
+from llm import FakeModel, FakeUpstreamError
+from resilience import CircuitBreaker, ResilientModel, UpstreamUnavailable
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fake(name='primary', **faults):
+    """An instant FakeModel with the given faults injected"""
+    options = dict(latency=0.0, tokens_per_second=0, reply_words=12, model_name=name)
+    options.update(faults)
+    return FakeModel(**options)
+
+
+def heal(model):
+    """A sleep stub that clears the model's faults during the retry backoff"""
+    def sleep(delay):
+        model.error_rate = 0.0
+    return sleep
+
+
+def stats(client, index=0):
+    return client.stats()['models'][index]
+
+
+def test_transient_error_is_retried_on_the_same_model():
+    primary = fake(error_rate=1.0)
+    client = ResilientModel([primary], retries=2, sleep=heal(primary))
+
+    response = client.start_chat().send_message('hello')
+
+    assert response.text == primary.reply_for('hello')
+    assert stats(client) == {
+        "model": 'primary', "circuit": 'closed', "trips": 0, "calls": 2,
+        "errors": 1, "retries": 1, "hedges": 0, "hedge_wins": 0
+    }
+
+
+def test_exhausted_retries_raise_upstream_unavailable():
+    client = ResilientModel([fake(error_rate=1.0)], retries=2, breaker_failures=10,
+                            sleep=lambda delay: None)
+
+    with pytest.raises(UpstreamUnavailable) as failed:
+        client.start_chat().send_message('hello')
+
+    assert isinstance(failed.value.__cause__, FakeUpstreamError)
+    assert failed.value.__cause__.code == 503
+    assert stats(client)['calls'] == 3
+    assert stats(client)['errors'] == 3
+
+
+def test_stream_is_retried_until_the_first_chunk():
+    primary = fake(error_rate=1.0)
+    client = ResilientModel([primary], retries=1, sleep=heal(primary))
+
+    chunks = list(client.start_chat().send_message('hello', stream=True))
+
+    assert ''.join(chunk.text for chunk in chunks) == primary.reply_for('hello')
+    assert stats(client)['retries'] == 1
+
+
+def test_breaker_opens_fails_fast_then_probes_again():
+    clock = Clock()
+    primary = fake(error_rate=1.0)
+    client = ResilientModel([primary], retries=5, breaker_failures=2, breaker_reset=30.0,
+                            clock=clock, sleep=lambda delay: None)
+
+    with pytest.raises(UpstreamUnavailable):
+        client.start_chat().send_message('hello')
+    # The breaker cut the retries short
+    assert stats(client)['calls'] == 2
+    assert stats(client)['circuit'] == 'open'
+    assert stats(client)['trips'] == 1
+
+    clock.now = 10.0
+    with pytest.raises(UpstreamUnavailable) as refused:
+        client.start_chat().send_message('hello')
+    assert refused.value.retry_after == pytest.approx(20.0)
+    assert stats(client)['calls'] == 2  # failed fast, upstream untouched
+
+    clock.now = 30.0
+    primary.error_rate = 0.0
+    assert client.start_chat().send_message('hello').text == primary.reply_for('hello')
+    assert stats(client)['circuit'] == 'closed'
+    assert stats(client)['calls'] == 3
+
+
+def test_failed_half_open_trial_reopens_the_circuit():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5.0, clock=clock)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    clock.now = 5.0
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial call at a time
+    breaker.record_failure()
+
+    assert breaker.state == 'open'
+    assert breaker.trips == 2
+    assert breaker.retry_after() == pytest.approx(5.0)
+
+
+def test_failing_model_falls_back_to_the_next():
+    primary = fake(error_rate=1.0)
+    backup = fake('backup')
+    client = ResilientModel([primary, backup], retries=0)
+
+    response = client.start_chat().send_message('hello')
+
+    assert response.text == backup.reply_for('hello')
+    assert client.stats()['fallbacks'] == 1
+    assert stats(client, 0)['errors'] == 1
+    assert stats(client, 1)['calls'] == 1
+
+
+def test_open_circuit_skips_straight_to_the_fallback():
+    primary = fake(error_rate=1.0)
+    client = ResilientModel([primary, fake('backup')], retries=0, breaker_failures=1)
+    client.start_chat().send_message('hello')
+
+    client.start_chat().send_message('hello')
+
+    assert stats(client, 0)['calls'] == 1
+    assert stats(client, 1)['calls'] == 2
+    assert client.stats()['fallbacks'] == 2
+
+
+def test_attempt_is_bounded_by_the_deadline():
+    client = ResilientModel([fake(latency=1.0)], retries=2, backoff=0.0, deadline=0.05)
+
+    started = time.monotonic()
+    with pytest.raises(UpstreamUnavailable) as failed:
+        client.start_chat().send_message('hello')
+
+    assert time.monotonic() - started < 0.5
+    assert failed.value.__cause__.code == 504
+    assert stats(client)['calls'] == 1  # no time left to retry
+
+
+def test_slow_attempt_is_hedged():
+    # Seeded so the first draw is slow and the second is not
+    primary = fake(slow_rate=0.5, slow_latency=1.0, seed=1)
+    client = ResilientModel([primary], hedge=True, hedge_after=0.05)
+
+    started = time.monotonic()
+    response = client.start_chat().send_message('hello')
+
+    assert time.monotonic() - started < 0.5
+    assert response.text == primary.reply_for('hello')
+    assert stats(client)['hedges'] == 1
+    assert stats(client)['hedge_wins'] == 1
+    assert stats(client)['calls'] == 2
+
+
+def test_hedging_waits_for_latency_samples_without_hedge_after():
+    client = ResilientModel([fake()], hedge=True)
+
+    for _ in range(19):
+        client.start_chat().send_message('hello')
+
+    assert client.upstreams[0].p95(False) is None
+    assert stats(client)['hedges'] == 0
+
@@ -0,0 +1,176 @@
+# ╔════════════════════════════════════════════════════════════════════╗
+# ║           transfer.py - Streaming NDJSON Export & Import           ║
+# ║    Server-side cursors • Constant memory • Batched transactions    ║
+# ╚════════════════════════════════════════════════════════════════════╝
+
+import json
+from datetime import datetime
+
+from sqlalchemy import func, insert, select, text
+
+FORMAT_VERSION = 1
+DATETIME_COLUMNS = ('created_at', 'updated_at', 'timestamp')
+
+# ══════════════════════════════════════════════════════════════════════
+# EXPORT
+# ══════════════════════════════════════════════════════════════════════
+
+def _record(kind, row, columns):
+    record = {"type": kind}
+    for column in columns:
+        value = row[column]
+        record[column] = value.isoformat() if isinstance(value, datetime) else value
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def export_ndjson(engine, metadata, user_id=None, include_users=False, yield_per=1000):
+    """Yield NDJSON lines for conversations and messages (one user's or everyone's).
+
+    Rows are read through a server-side cursor `yield_per` at a time, so memory
+    stays flat however large the history is. Order: header, users (optional),
+    conversations, then messages grouped by conversation.
+    """
+    users = metadata.tables['user']
+    conversations = metadata.tables['conversation']
+    messages = metadata.tables['message']
+
+    yield json.dumps({
+        "type": "export",
+        "version": FORMAT_VERSION,
+        "exported_at": datetime.utcnow().isoformat()
+    }) + "\n"
+
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, yield_per=yield_per)
+
+        if include_users:
+            query = select(users).order_by(users.c.id)
+            if user_id is not None:
+                query = query.where(users.c.id == user_id)
+            for row in conn.execute(query).mappings():
+                yield _record("user", row, users.c.keys())
+
+        query = select(conversations).order_by(conversations.c.id)
+        if user_id is not None:
+            query = query.where(conversations.c.user_id == user_id)
+        for row in conn.execute(query).mappings():
+            yield _record("conversation", row, conversations.c.keys())
+
+        query = select(messages).order_by(messages.c.conversation_id, messages.c.id)
+        if user_id is not None:
+            query = query.join(
+                conversations, conversations.c.id == messages.c.conversation_id
+            ).where(conversations.c.user_id == user_id)
+        for row in conn.execute(query).mappings():
+            yield _record("message", row, messages.c.keys())
+
+# ══════════════════════════════════════════════════════════════════════
+# IMPORT
+# ══════════════════════════════════════════════════════════════════════
+
+def _values(table, record, drop=('type',)):
+    values = {}
+    for column in table.c.keys():
+        if column in record and column not in drop:
+            value = record[column]
+            if column in DATETIME_COLUMNS and isinstance(value, str):
+                value = datetime.fromisoformat(value)
+            values[column] = value
+    return values
+
+
+def import_ndjson(engine, metadata, lines, user_id=None, preserve_ids=False, batch_size=5000,
+                  atomic=False, render_html=None):
+    """Load NDJSON produced by export_ndjson; returns counts per record type.
+
+    By default conversations (and users) get new ids and messages are
+    re-pointed at them, so an export can be merged into a live database.
+    `user_id` assigns every conversation to one user and skips user records.
+    `preserve_ids` keeps the original ids, which is much faster when filling
+    an empty database (e.g. migrating SQLite to Postgres). Messages are
+    inserted `batch_size` rows per statement; each batch is committed on its
+    own, or with `atomic` everything is one transaction that a bad line
+    rolls back. `render_html(content)` replaces any stored `html` of a
+    message instead of trusting the file's.
+    """
+    users = metadata.tables['user']
+    conversations = metadata.tables['conversation']
+    messages = metadata.tables['message']
+    user_ids, conversation_ids = {}, {}
+    counts = {"user": 0, "conversation": 0, "message": 0}
+    pending = []
+
+    def flush(conn):
+        if pending:
+            conn.execute(insert(messages), pending)
+            counts["message"] += len(pending)
+            pending.clear()
+
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError(f"expected an object per line, got {type(record).__name__}")
+            kind = record.get("type")
+
+            if kind == "user" and user_id is None:
+                values = _values(users, record, drop=('type',) if preserve_ids else ('type', 'id'))
+                existing = conn.execute(
+                    select(users.c.id).where(users.c.username == values['username'])
+                ).scalar()
+                if existing is None:
+                    result = conn.execute(insert(users), values)
+                    existing = values.get('id') or result.inserted_primary_key[0]
+                    counts["user"] += 1
+                user_ids[record['id']] = existing
+
+            elif kind == "conversation":
+                values = _values(conversations, record, drop=('type',) if preserve_ids else ('type', 'id'))
+                values['user_id'] = user_id if user_id is not None else user_ids.get(
+                    record['user_id'], record['user_id'])
+                result = conn.execute(insert(conversations), values)
+                conversation_ids[record['id']] = values.get('id') or result.inserted_primary_key[0]
+                counts["conversation"] += 1
+
+            elif kind == "message":
+                if record['conversation_id'] not in conversation_ids:
+                    continue  # message of a conversation that was not part of the export
+                values = _values(messages, record, drop=('type',) if preserve_ids else ('type', 'id'))
+                values['conversation_id'] = conversation_ids[record['conversation_id']]
+                if render_html is not None and values.get('html') is not None:
+                    values['html'] = render_html(values['content'])
+                pending.append(values)
+                if len(pending) >= batch_size:
+                    flush(conn)
+                    if not atomic:
+                        transaction.commit()
+                        transaction = conn.begin()
+
+        flush(conn)
+        transaction.commit()
+
+        if preserve_ids and engine.dialect.name == 'postgresql':
+            # Explicit ids don't advance the serial sequences; move them past the data
+            for table in (users, conversations, messages):
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', 'id'), "
+                    f"COALESCE((SELECT MAX(id) FROM \"{table.name}\"), 1))"
+                ))
+            conn.commit()
+
+    return counts
+
+
+def count_rows(engine, metadata):
+    """Row counts of the exported tables (handy for verifying a migration)"""
+    with engine.connect() as conn:
+        return {
+            name: conn.execute(select(func.count()).select_from(metadata.tables[name])).scalar()
+            for name in ('user', 'conversation', 'message')
+        }